@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Helpers shared by benchmarks.
+"""
+
+
+import time
+
+
+def rate(function, count):
+    """
+    Run function count times and return calls per second.
+    """
+    
+    start = time.time()
+    
+    for i in xrange(count):
+        function()
+    
+    return count / (time.time() - start)
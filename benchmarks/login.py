@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Login key generation benchmark.
+"""
+
+
+import random
+import sys
+
+from aochat import _generate_login_key, _crypt
+
+from common import rate
+
+
+def main(count = 1000):
+    key = random.getrandbits(128) | 1 << 127
+    plain = "x" * 64
+    
+    print "crypt               %10.0f calls/sec" % rate(lambda: _crypt(key, plain), count * 10)
+    print "generate login key  %10.0f calls/sec" % rate(lambda: _generate_login_key("3a3c3a6e5b2c1f4d", "username", "password"), count)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
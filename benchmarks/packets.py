@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Packet decode and encode benchmark.
+"""
+
+
+import sys
+
+from aochat.packets import *
+
+from common import rate
+
+
+SAMPLES = (
+    AOCP_PRIVATE_MESSAGE(123456, "Hello, world!", AOFL_PRIVATE_MESSAGE),
+    AOCP_CHANNEL_MESSAGE(0x0300000001, "WTS Combined Sharpshooter's Sleeves, ql 300. Tell me!", AOFL_CHANNEL_MESSAGE),
+    AOCP_FRIEND_UPDATE(123456, AOFL_FRIEND_BUDDY),
+    AOCP_PING(),
+)
+
+# Server packets share layout with client packets of the same type
+SERVER_SAMPLES = (
+    (AOSP_PRIVATE_MESSAGE, Integer(123456).pack() + String("Hello, world!").pack() + String("\x00").pack()),
+    (AOSP_CHANNEL_MESSAGE, ChannelID(0x0300000001).pack() + Integer(123456).pack() + String("WTS Combined Sharpshooter's Sleeves, ql 300. Tell me!").pack() + String("").pack()),
+    (AOSP_FRIEND_UPDATE, Integer(123456).pack() + Integer(1).pack() + String("\x01").pack()),
+    (AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, Integer(123456).pack() + Integer(654321).pack()),
+)
+
+
+def main(count = 100000):
+    for Packet, data in SERVER_SAMPLES:
+        print "decode %-40s %10.0f packets/sec" % (Packet.__name__, rate(lambda: Packet(data), count))
+    
+    for packet in SAMPLES:
+        print "encode %-40s %10.0f packets/sec" % (packet.__class__.__name__, rate(packet.pack, count))
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+"""
+Benchmark suite: packet codecs of all packet types, extended messages,
+login key and end-to-end chat through local server. Results are saved as
+JSON and compared with results of earlier run.
+    
+    python benchmarks/suite.py -o results.json -c previous.json
+"""
+
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+from aochat import Chat, SERVER_PACKETS, CLIENT_PACKETS, _generate_login_key
+from aochat.extended import _cache, parse_extended
+from aochat.keys import KeyPool
+from aochat.packets import *
+from aochat.server import MockServer, make_packet
+
+from common import rate
+
+
+# Field values used for sample packets
+SAMPLE_VALUES = {
+    Integer:         123456,
+    String:          "WTS Combined Sharpshooter's Sleeves, ql 300. Tell me!",
+    ChannelID:       0x0300000001,
+    TupleOfIntegers: (123456, 654321, 111111),
+    TupleOfStrings:  ("Character", "Another", "Third"),
+}
+
+
+def extended_string(text):
+    """
+    Encode string argument of extended message, length byte counts itself.
+    """
+    
+    return "s" + chr(len(text) + 1) + text
+
+
+# Tower attack message: faction, organization, attacker, faction reference,
+# organization twice, zone and coordinates 1500, 2200
+EXTENDED_MESSAGE = "".join((
+    "~&!!!&r!5b/R",
+    extended_string("Clan"),
+    extended_string("Foo Org"),
+    extended_string("Attacker"),
+    'R!!!&r!!!!"',
+    extended_string("Bar Org"),
+    extended_string("Bar Org"),
+    extended_string("Perpetual Wastelands"),
+    "i!!!2X",
+    "i!!!:l",
+    "~",
+))
+
+
+def sample(Class):
+    """
+    Make sample packet of class.
+    """
+    
+    return make_packet(Class, *map(lambda (name, Type): SAMPLE_VALUES[Type], Class.fields))
+
+
+def bench_packets(count):
+    results = {}
+    
+    for packet_type, Class in sorted(SERVER_PACKETS.items()):
+        data = sample(Class).pack()[4:]
+        
+        results["decode %s" % Class.__name__] = rate(lambda: Class(data), count)
+    
+    for packet_type, Class in sorted(CLIENT_PACKETS.items()):
+        packet = sample(Class)
+        
+        results["encode %s" % Class.__name__] = rate(packet.pack, count)
+    
+    return results
+
+
+def bench_extended(count):
+    # Benchmark is meaningless for blob not parsing as intended
+    assert parse_extended(EXTENDED_MESSAGE)[2] == ("Clan", "Foo Org", "Attacker", (506, 1,), "Bar Org", "Bar Org", "Perpetual Wastelands", 1500, 2200,)
+    
+    data = ChannelID(0x0A00000001).pack() + Integer(0).pack() + String(EXTENDED_MESSAGE).pack() + String("").pack()
+    
+    def parse():
+        _cache.clear()
+        parse_extended(EXTENDED_MESSAGE)
+    
+    return {
+        "parse extended message":           rate(parse, count),
+        "decode AOSP_CHANNEL_MESSAGE args": rate(lambda: AOSP_CHANNEL_MESSAGE(data).args, count),
+    }
+
+
+def bench_login(count):
+    return {
+        "generate login key": rate(lambda: _generate_login_key("3a3c3a6e5b2c1f4d", "username", "password"), count),
+    }
+
+
+def bench_chat(count, send_rate):
+    """
+    Stream count private messages through Chat.start(). Messages carry time
+    they were sent at for latency.
+    """
+    
+    def script(handler):
+        for i in xrange(count):
+            yield make_packet(AOSP_PRIVATE_MESSAGE, 1, repr(time.time()), "\x00")
+    
+    server = MockServer(script = script, rate = send_rate)
+    server.start()
+    
+    keys = KeyPool(size = 1, threshold = 0, public_key = server.public_key)
+    
+    chat = Chat("username", "password", server.host, server.port, keys = keys)
+    chat.login(server.characters[0][0])
+    
+    latencies = []
+    
+    def callback(chat, packet):
+        if packet.type == AOSP_PRIVATE_MESSAGE.type:
+            latencies.append(time.time() - float(packet.message))
+            
+            # Leave chat loop
+            if len(latencies) == count:
+                raise KeyboardInterrupt
+    
+    start = time.time()
+    chat.start(callback)
+    elapsed = time.time() - start
+    
+    chat.close()
+    keys.close()
+    server.stop()
+    
+    latencies.sort()
+    
+    return {
+        "chat messages/sec": count / elapsed,
+        "chat latency avg":  sum(latencies) / len(latencies),
+        "chat latency p50":  latencies[len(latencies) / 2],
+        "chat latency p99":  latencies[len(latencies) * 99 / 100],
+    }
+
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd = os.path.dirname(os.path.abspath(__file__)), stderr = subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous):
+    """
+    Print results with change against previous results.
+    """
+    
+    for name in sorted(results):
+        value = results[name]
+        old = previous.get(name)
+        
+        if old:
+            print "%-50s %14.6g  %+7.1f%%" % (name, value, (value / old - 1) * 100)
+        else:
+            print "%-50s %14.6g" % (name, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Run benchmarks.")
+    parser.add_argument("-n", "--count", type = int, default = 100000, help = "iterations of codec benchmarks")
+    parser.add_argument("-m", "--messages", type = int, default = 100000, help = "messages of end-to-end benchmark")
+    parser.add_argument("-r", "--rate", type = int, default = None, help = "messages per second sent by server")
+    parser.add_argument("-o", "--output", help = "save results to JSON file")
+    parser.add_argument("-c", "--compare", help = "compare with results in JSON file")
+    
+    args = parser.parse_args()
+    
+    results = {}
+    results.update(bench_packets(args.count))
+    results.update(bench_extended(args.count))
+    results.update(bench_login(max(args.count / 100, 1)))
+    results.update(bench_chat(args.messages, args.rate))
+    
+    previous = {}
+    
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+    
+    compare(results, previous)
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "revision": revision(),
+                "python":   platform.python_version(),
+                "time":     time.time(),
+                "results":  results,
+            }, f, indent = 4, sort_keys = True)
+
+
+if __name__ == "__main__":
+    main()
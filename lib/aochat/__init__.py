@@ -6,12 +6,20 @@ Python implementation of Anarchy Online chat protocol.
 """
 
 
+import binascii
 import socket
 import select
 import struct
 import random
+import threading
+import time
 
+from aochat.buddies import BuddyList
+from aochat.buffer import HEADER, PacketBuffer
+from aochat.channels import Channels, PrivateChannels
+from aochat.characters import CharacterCache
 from aochat.packets import *
+from aochat.throttle import PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, BULK_RATE, BULK_BURST, SendQueue
 
 
 SERVER_PACKETS = {
@@ -63,18 +71,32 @@ CLIENT_PACKETS = {
 ### LOGIN KEY GENERATOR ########################################################
 
 
-def _generate_login_key(server_key, username, password):
+# Diffie-Hellman parameters of chat server
+DH_Y = 0x9C32CC23D559CA90FC31BE72DF817D0E124769E809F936BC14360FF4BED758F260A0D596584EACBBC2B88BDD410416163E11DBF62173393FBC0C6FEFB2D855F1A03DEC8E9F105BBAD91B3437D8EB73FE2F44159597AA4053CF788D2F9D7012FB8D7C4CE3876F7D6CD5D0C31754F4CD96166708641958DE54A6DEF5657B9F2E92L
+DH_N = 0xECA2E8C85D863DCDC26A429A71A9815AD052F6139669DD659F98AE159D313D13C6BF2838E10A69B6478B64A24BD054BA8248E8FA778703B418408249440B2C1EDD28853E240D8A7E49540B76D120D3B1AD2878B1B99490EB4A2A5E84CAA8A91CECBDB1AA7C816E8BE343246F80C637ABC653B893FD91686CF8D32D6CFE5F2A6FL
+DH_G = 0x5L
+
+
+def _generate_keypair(dhY = DH_Y):
     """
-    Generate login key by server_key, username and password.
+    Generate client public key and shared key: (dhX, dhK).
     """
     
-    dhY = 0x9C32CC23D559CA90FC31BE72DF817D0E124769E809F936BC14360FF4BED758F260A0D596584EACBBC2B88BDD410416163E11DBF62173393FBC0C6FEFB2D855F1A03DEC8E9F105BBAD91B3437D8EB73FE2F44159597AA4053CF788D2F9D7012FB8D7C4CE3876F7D6CD5D0C31754F4CD96166708641958DE54A6DEF5657B9F2E92L
-    dhN = 0xECA2E8C85D863DCDC26A429A71A9815AD052F6139669DD659F98AE159D313D13C6BF2838E10A69B6478B64A24BD054BA8248E8FA778703B418408249440B2C1EDD28853E240D8A7E49540B76D120D3B1AD2878B1B99490EB4A2A5E84CAA8A91CECBDB1AA7C816E8BE343246F80C637ABC653B893FD91686CF8D32D6CFE5F2A6FL
-    dhG = 0x5L
     dhx = random.randrange(0, 2 ** 256)
     
-    dhX = pow(dhG, dhx, dhN)
-    dhK = int(("%x" % pow(dhY, dhx, dhN))[:32], 16)
+    dhX = pow(DH_G, dhx, DH_N)
+    dhK = int(("%x" % pow(dhY, dhx, DH_N))[:32], 16)
+    
+    return dhX, dhK
+
+
+def _generate_login_key(server_key, username, password, keypair = None):
+    """
+    Generate login key by server_key, username and password. Keypair is
+    generated unless precomputed one is given.
+    """
+    
+    dhX, dhK = keypair or _generate_keypair()
     
     challenge = "%s|%s|%s" % (username, server_key, password)
     prefix    = struct.pack(">Q", random.randrange(0, 2 ** 64))
@@ -94,27 +116,49 @@ def _crypt(key, plain):
     if len(plain) % 8 != 0:
         raise ValueError("Length of plain text must be multiple of 8.")
     
-    crypted = ""
-    
-    cycle  = [0, 0]
-    result = [0, 0]
+    # Key and data are little-endian 32-bit words
+    keys  = struct.unpack("<4I", binascii.unhexlify("%032x" % key))
+    count = len(plain) / 4
+    data  = struct.unpack("<%dI" % count, plain)
     
-    keys = [socket.ntohl(int(s, 16)) for s in struct.unpack("8s" * (len(str(key)) / 8), "%x" % key)]
-    data = struct.unpack("I" * (len(plain) / 4), plain)
+    crypted = [0] * count
     
-    i = 0
+    a = b = 0
     
-    while i < len(data):
-        cycle[0] = data[i] ^ result[0]
-        cycle[1] = data[i + 1] ^ result[1]
+    for i in xrange(0, count, 2):
+        a, b = _tea_encrypt((data[i] ^ a, data[i + 1] ^ b), keys)
         
-        result = _tea_encrypt(cycle, keys)
+        crypted[i] = a
+        crypted[i + 1] = b
+    
+    return binascii.hexlify(struct.pack("<%dI" % count, *crypted))
+
+
+def _decrypt(key, crypted):
+    """
+    Decrypt text crypted by _crypt() with key.
+    """
+    
+    data = struct.unpack("<%dI" % (len(crypted) / 8), binascii.unhexlify(crypted))
+    keys = struct.unpack("<4I", binascii.unhexlify("%032x" % key))
+    
+    plain = [0] * len(data)
+    
+    a = b = 0
+    
+    for i in xrange(0, len(data), 2):
+        c, d = _tea_decrypt((data[i], data[i + 1]), keys)
         
-        crypted += "%08x%08x" % (socket.htonl(result[0]) & 0xFFFFFFFFL, socket.htonl(result[1]) & 0xFFFFFFFFL)
+        plain[i] = c ^ a
+        plain[i + 1] = d ^ b
         
-        i += 2
+        a, b = data[i], data[i + 1]
     
-    return crypted
+    return struct.pack("<%dI" % len(data), *plain)
+
+
+# Round sums of TEA delta. Plain ints keep arithmetic off long objects
+_TEA_SUMS = tuple(int(0x9E3779B9 * i & 0xFFFFFFFF) for i in range(1, 33))
 
 
 def _tea_encrypt(cycle, keys):
@@ -123,21 +167,27 @@ def _tea_encrypt(cycle, keys):
     """
     
     a, b = cycle
-    sum = 0
-    delta = 0x9E3779B9L
+    k0, k1, k2, k3 = keys
     
-    i = 32
+    # Only low 32 bits of sums matter, so mask once per round
+    for sum in _TEA_SUMS:
+        a = (a + (((b << 4) + k0) ^ (b + sum) ^ ((b >> 5) + k1))) & 0xFFFFFFFF
+        b = (b + (((a << 4) + k2) ^ (a + sum) ^ ((a >> 5) + k3))) & 0xFFFFFFFF
     
-    while i:
-        sum = (sum + delta) & 0xFFFFFFFFL
-        
-        a += (((b << 4 & 0xFFFFFFF0L) + keys[0]) ^ (b + sum) ^ ((b >> 5 & 0x7FFFFFFL) + keys[1])) & 0xFFFFFFFFL
-        a &= 0xFFFFFFFFL
-        
-        b += (((a << 4 & 0xFFFFFFF0L) + keys[2]) ^ (a + sum) ^ ((a >> 5 & 0x7FFFFFFL) + keys[3])) & 0xFFFFFFFFL
-        b &= 0xFFFFFFFFL
-        
-        i -= 1
+    return a, b
+
+
+def _tea_decrypt(cycle, keys):
+    """
+    TEA decrypt.
+    """
+    
+    a, b = cycle
+    k0, k1, k2, k3 = keys
+    
+    for sum in reversed(_TEA_SUMS):
+        b = (b - (((a << 4) + k2) ^ (a + sum) ^ ((a >> 5) + k3))) & 0xFFFFFFFF
+        a = (a - (((b << 4) + k0) ^ (b + sum) ^ ((b >> 5) + k1))) & 0xFFFFFFFF
     
     return a, b
 
@@ -152,68 +202,207 @@ class ChatError(Exception):
 class UnexpectedPacket(ChatError):
     pass
 
+class ConnectionLost(ChatError):
+    pass
+
 
 class Chat(object):
     """
     Anarchy Online chat protocol implementation.
     """
     
-    def __init__(self, username, password, host, port, timeout = 10):
+    def __init__(self, username, password, host, port, timeout = 10, queue = None, names = None, keys = None, metrics = None, capture = None, bulk_rate = BULK_RATE, bulk_burst = BULK_BURST):
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.keys = keys
+        
+        self.subscriptions = {}
+        self.queue = queue
+        self.metrics = metrics
+        self.capture = capture
+        
+        # Bulk sends of chat without send queue are paced by their own one,
+        # saving up bulk_burst packets for every write
+        self.bulk_queue = queue if queue is not None else SendQueue(bulk_rate, bulk_burst, bulk_burst)
+        
+        # Sending is shared by reader thread and callbacks in other threads
+        self.send_lock = threading.RLock()
+        
+        # Character names are cached from every packet carrying them
+        self.names = names if names is not None else CharacterCache()
+        self.subscribe((AOSP_CHARACTER_NAME, AOSP_CHARACTER_LOOKUP,), self.names.handle_packet)
+        
+        # Public channels announced by server
+        self.channels = Channels()
+        self.subscribe((AOSP_CHANNEL_JOIN, AOSP_CHANNEL_LEAVE,), self.channels.handle_packet)
+        
+        # Session state restored after reconnect
+        self.buddies = BuddyList()
+        self.subscribe((AOSP_FRIEND_UPDATE, AOSP_FRIEND_REMOVE,), self.buddies.handle_packet)
+        
+        self.private_channels = PrivateChannels()
+        self.subscribe((AOSP_PRIVATE_CHANNEL_INVITE, AOSP_PRIVATE_CHANNEL_KICK, AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, AOSP_PRIVATE_CHANNEL_CHARACTER_LEAVE,), self.private_channels.handle_packet)
+        
+        self.reconnects = 0
+        self.reconnect_time = None
+        
+        self.connect()
+    
+    def connect(self):
+        """
+        Connect to chat server and authenticate.
+        """
+        
         # Initialize connection
         try:
-            self.socket = socket.create_connection((host, port,), timeout)
+            self.socket = socket.create_connection((self.host, self.port,), self.timeout)
         except socket.error, error:
-            raise ChatError("Socket error %s: %s" % tuple(error))
+            raise ConnectionLost("Socket error %s: %s" % tuple(error))
+        
+        self.buffer = PacketBuffer()
         
         # Wait server key and generate login key
         try:
             server_key = self.wait_packet(AOSP_SEED).server_key
-            login_key  = _generate_login_key(server_key, username, password)
+            login_key  = _generate_login_key(server_key, self.username, self.password, self.keys.get() if self.keys is not None else None)
         except UnexpectedPacket, (type, packet):
             raise ChatError("Invalid greeting packet: %s" % type)
         
         # Authenticate
         try:
             self.character  = None
-            self.characters = self.send_packet(AOCP_AUTH(username, login_key), AOSP_CHARACTERS_LIST, AOSP_AUTH_ERROR).characters
+            self.characters = self.send_packet(AOCP_AUTH(self.username, login_key), AOSP_CHARACTERS_LIST, AOSP_AUTH_ERROR).characters
         except UnexpectedPacket, (type, packet):
             raise ChatError(packet.message)
     
-    def __read_socket(self, bytes):
-        data = ""
+    def close(self):
+        """
+        Close connection.
+        """
         
-        while bytes > 0:
-            try:
-                chunk = self.socket.recv(bytes)
-            except socket.error, error:
-                raise ChatError("Socket error %s: %s" % tuple(error))
-            except socket.timeout:
-                raise ChatError("Connection timed out.")
+        try:
+            self.socket.close()
+        except socket.error:
+            pass
+    
+    def reconnect(self, min_delay = 1.0, max_delay = 300.0, attempts = None):
+        """
+        Reconnect after lost connection, login the same character and
+        restore session state. Waits random delay between half and whole
+        of min_delay doubled after every failed attempt, up to max_delay.
+        Only lost connections are retried, ConnectionLost is raised when
+        attempts are exhausted. Other ChatErrors, such as rejected login,
+        are raised at once.
+        """
+        
+        character = self.character
+        started = time.time()
+        attempt = 0
+        
+        self.close()
+        
+        while True:
+            # Jittered exponential backoff, first attempt is immediate
+            if attempt:
+                time.sleep(min(max_delay, min_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
             
-            if chunk == "":
-                raise ChatError("Connection broken.")
+            attempt += 1
             
-            bytes = bytes - len(chunk)
-            data = data + chunk
+            try:
+                self.connect()
+                
+                if character:
+                    self.login(character.id)
+                
+                break
+            except ConnectionLost:
+                self.close()
+                
+                if attempts is not None and attempt >= attempts:
+                    raise
+            except ChatError:
+                self.close()
+                raise
         
-        return data
+        if character:
+            self.restore()
+        
+        self.reconnects += 1
+        self.reconnect_time = time.time() - started
     
-    def __write_socket(self, data):
-        bytes = len(data)
+    def restore(self):
+        """
+        Send buddy list, private channels and pending lookups again.
+        """
         
-        while bytes > 0:
+        self.buddies.restore(self)
+        self.private_channels.restore(self)
+        self.names.resend(self)
+    
+    def __read_socket(self):
+        if self.metrics is not None:
+            started = time.time()
+        
+        try:
+            received = self.buffer.recv(self.socket)
+        except socket.timeout:
+            raise ConnectionLost("Connection timed out.")
+        except socket.error, error:
+            raise ConnectionLost("Socket error %s: %s" % tuple(error))
+        
+        if received == 0:
+            raise ConnectionLost("Connection broken.")
+        
+        if self.metrics is not None:
+            self.metrics.received(received, time.time() - started)
+    
+    def __write_socket(self, data):
+        with self.send_lock:
+            if self.metrics is not None:
+                started = time.time()
+            
             try:
-                sent = self.socket.send(data)
-            except socket.error, error:
-                raise ChatError("Socket error %s: %s" % tuple(error))
+                self.socket.sendall(data)
             except socket.timeout:
-                raise ChatError("Connection timed out.")
+                raise ConnectionLost("Connection timed out.")
+            except socket.error, error:
+                raise ConnectionLost("Socket error %s: %s" % tuple(error))
             
-            if sent == 0:
-                raise ChatError("Connection broken.")
+            if self.metrics is not None:
+                self.metrics.sent(len(data), time.time() - started)
             
-            data = data[sent:]
-            bytes = bytes - sent
+            if self.capture is not None:
+                self.capture.sent(data)
+    
+    def __read_packet(self):
+        packet = self.buffer.packet()
+        
+        while packet is None:
+            self.__read_socket()
+            packet = self.buffer.packet()
+        
+        if self.capture is not None:
+            with self.send_lock:
+                self.capture.received(packet[0], packet[1])
+        
+        return packet
+    
+    def receive(self):
+        """
+        Receive available data from server without waiting whole packet.
+        """
+        
+        self.__read_socket()
+    
+    def has_packet(self):
+        """
+        Check if complete packet is already received.
+        """
+        
+        return self.buffer.has_packet()
     
     def wait_packet(self, Expect = None, Error = None):
         """
@@ -221,10 +410,14 @@ class Chat(object):
         """
         
         # Read data from server
-        head = self.__read_socket(4)
-        packet_type, packet_length = struct.unpack(">2H", head)
-        data = self.__read_socket(packet_length)
+        packet_type, data = self.__read_packet()
+        
+        if self.metrics is not None:
+            return self.__decode_measured(packet_type, data, Expect, Error)
         
+        return self.__decode(packet_type, data, Expect, Error)
+    
+    def __decode(self, packet_type, data, Expect, Error):
         if Expect:
             # Check packet type
             if packet_type != Expect.type:
@@ -242,24 +435,356 @@ class Chat(object):
             try:
                 packet = SERVER_PACKETS[packet_type](data)
             except KeyError:
-                raise UnexpectedPacket(packet_type, data)
+                raise UnexpectedPacket(packet_type, str(data))
         
         return packet
     
-    def send_packet(self, packet, Expect = None, Error = None):
+    def __decode_measured(self, packet_type, data, Expect, Error):
+        started = time.time()
+        
+        try:
+            packet = self.__decode(packet_type, data, Expect, Error)
+        except UnexpectedPacket:
+            self.metrics.packet_in(packet_type)
+            raise
+        except (ValueError, struct.error):
+            self.metrics.decode_error(packet_type)
+            raise
+        
+        self.metrics.decoded(packet_type, time.time() - started)
+        
+        return packet
+    
+    def wait_frame(self):
+        """
+        Wait packet from server and return it undecoded as (type, data).
+        """
+        
+        packet_type, data = self.__read_packet()
+        
+        if self.metrics is not None:
+            self.metrics.packet_in(packet_type)
+        
+        return packet_type, str(data)
+    
+    def subscribe(self, types, handler):
+        """
+        Subscribe handler(chat, packet) to packets of types (packet classes
+        or type numbers).
+        """
+        
+        for packet_type in types:
+            packet_type = getattr(packet_type, "type", packet_type)
+            
+            self.subscriptions[packet_type] = self.subscriptions.get(packet_type, ()) + (handler,)
+    
+    def unsubscribe(self, types, handler):
+        """
+        Unsubscribe handler from packets of types.
+        """
+        
+        for packet_type in types:
+            packet_type = getattr(packet_type, "type", packet_type)
+            handlers = tuple(filter(lambda item: item != handler, self.subscriptions.get(packet_type, ())))
+            
+            if handlers:
+                self.subscriptions[packet_type] = handlers
+            else:
+                self.subscriptions.pop(packet_type, None)
+    
+    def handle_packet(self, callback = None):
+        """
+        Pass next received packet to subscribed handlers and callback.
+        Packets nobody is interested in are dropped without decoding.
+        """
+        
+        packet_type = self.buffer.peek()
+        handlers = self.subscriptions.get(packet_type, ())
+        
+        if not handlers and not callback:
+            if packet_type is not None:
+                self.__read_packet()
+                
+                if self.metrics is not None:
+                    self.metrics.packet_in(packet_type)
+            
+            return
+        
+        packet = self.wait_packet()
+        
+        if self.metrics is not None:
+            started = time.time()
+        
+        for handler in handlers:
+            handler(self, packet)
+        
+        if callback:
+            callback(self, packet)
+        
+        if self.metrics is not None:
+            self.metrics.handled(time.time() - started)
+    
+    def iter_packets(self, types = None, timeout = None, ping_interval = 60000):
+        """
+        Iterate received packets of types (packet classes or type numbers,
+        all if None). Subscribed handlers still see every packet. Stops when
+        no packet of types comes for timeout seconds. Server is pinged when
+        nothing comes for ping_interval milliseconds, as by start().
+        """
+        
+        wanted = self.__packet_types(types)
+        received = []
+        
+        def collect(chat, packet):
+            received.append(packet)
+        
+        stop = time.time() + timeout if timeout is not None else None
+        
+        while self.__wait_buffered(max(stop - time.time(), 0) if stop is not None else None, ping_interval):
+            self.__handle_wanted(wanted, collect)
+            
+            if received:
+                yield received.pop()
+                
+                if timeout is not None:
+                    stop = time.time() + timeout
+            elif stop is not None and time.time() >= stop:
+                return
+    
+    def iter_batches(self, max_items = 100, max_wait = 0.1, types = None, timeout = None, ping_interval = 60000):
         """
-        Send packet to server.
+        Iterate lists of received packets, see iter_packets(). Batch takes
+        all packets already received and those coming within max_wait
+        seconds after its first one, up to max_items.
+        """
+        
+        wanted = self.__packet_types(types)
+        batch = []
+        
+        def collect(chat, packet):
+            batch.append(packet)
+        
+        stop = time.time() + timeout if timeout is not None else None
+        
+        while self.__wait_buffered(max(stop - time.time(), 0) if stop is not None else None, ping_interval):
+            deadline = time.time() + max_wait
+            
+            while len(batch) < max_items:
+                if not self.buffer.has_packet():
+                    remaining = deadline - time.time()
+                    
+                    if remaining <= 0 or not self.__wait_buffered(remaining):
+                        break
+                
+                self.__handle_wanted(wanted, collect)
+            
+            if batch:
+                yield batch
+                
+                batch = []
+                
+                if timeout is not None:
+                    stop = time.time() + timeout
+            elif stop is not None and time.time() >= stop:
+                return
+    
+    def iter_frames(self, timeout = None, ping_interval = 60000):
+        """
+        Iterate received packets undecoded as (type, data), see
+        wait_frame(). Subscribed handlers are not run. Stops when nothing
+        comes for timeout seconds. Queued packets are sent and server is
+        pinged meanwhile, as by iter_packets().
+        """
+        
+        while self.__wait_buffered(timeout, ping_interval):
+            yield self.wait_frame()
+    
+    def __packet_types(self, types):
+        if types is None:
+            return None
+        
+        return frozenset(map(lambda packet_type: getattr(packet_type, "type", packet_type), types))
+    
+    def __handle_wanted(self, wanted, callback):
+        """
+        Handle next buffered packet passing it to callback if wanted.
+        """
+        
+        if wanted is not None and self.buffer.peek() not in wanted:
+            callback = None
+        
+        try:
+            self.handle_packet(callback)
+        except UnexpectedPacket, (type, data):
+            print "Unexpected packet %s: %s" % (type, repr(data))
+    
+    def __wait_buffered(self, timeout = None, ping_interval = None):
+        """
+        Receive data until complete packet is buffered, sending queued
+        packets meanwhile and ping when nothing comes for ping_interval
+        milliseconds. Returns False on timeout.
+        """
+        
+        deadline = time.time() + timeout if timeout is not None else None
+        activity = time.time()
+        
+        while not self.buffer.has_packet():
+            self.flush()
+            
+            wait = max(deadline - time.time(), 0) if deadline is not None else None
+            
+            # Wake up when queued packets may be sent or ping is due
+            delay = self.delay()
+            
+            if delay is not None and (wait is None or delay < wait):
+                wait = delay
+            
+            if ping_interval is not None:
+                delay = max(activity + ping_interval / 1000.0 - time.time(), 0)
+                
+                if wait is None or delay < wait:
+                    wait = delay
+            
+            if select.select([self.socket], [], [], wait)[0]:
+                self.receive()
+                activity = time.time()
+            elif deadline is not None and time.time() >= deadline:
+                return False
+            elif ping_interval is not None and (time.time() - activity) * 1000 >= ping_interval:
+                activity = time.time()
+                self.ping()
+        
+        return True
+    
+    def send_packet(self, packet, Expect = None, Error = None, priority = PRIORITY_NORMAL):
+        """
+        Send packet to server. Packets without expected answer go through
+        send queue if chat has one.
         """
         
         # Pack
         data = packet.pack()
         
-        # Send data to server
-        self.__write_socket(data)
+        with self.send_lock:
+            if self.metrics is not None:
+                self.metrics.packet_out(packet.type)
+            
+            if self.queue is not None and not Expect:
+                self.queue.put(data, priority)
+                self.flush()
+                return
+            
+            # Send data to server
+            self.__write_socket(data)
         
         if Expect:
             return self.wait_packet(Expect, Error)
     
+    def send_packets(self, packets, priority = PRIORITY_NORMAL):
+        """
+        Send several packets in one write or put them all in send queue.
+        """
+        
+        packets = list(packets)
+        data = map(lambda packet: packet.pack(), packets)
+        
+        with self.send_lock:
+            if self.metrics is not None:
+                for packet in packets:
+                    self.metrics.packet_out(packet.type)
+            
+            if self.queue is not None:
+                for item in data:
+                    self.queue.put(item, priority)
+                
+                self.flush()
+                return
+            
+            self.__write_socket("".join(data))
+    
+    def flush(self):
+        """
+        Send queued packets allowed by rate limit in one write, then call
+        their callbacks.
+        """
+        
+        with self.send_lock:
+            if not self.bulk_queue:
+                return
+            
+            data = self.bulk_queue.take()
+            callbacks = self.bulk_queue.done()
+            
+            if data:
+                self.__write_socket("".join(data))
+        
+        for callback in callbacks:
+            callback()
+    
+    def delay(self):
+        """
+        Get seconds until next queued packet may be sent or None if nothing
+        is queued.
+        """
+        
+        return self.bulk_queue.delay()
+    
+    def drain(self, timeout = None):
+        """
+        Send queued packets, waiting for rate limit, for callers running no
+        chat loop. Received packets are left unread meanwhile. Returns False
+        if packets are still queued after timeout seconds.
+        """
+        
+        stop = time.time() + timeout if timeout is not None else None
+        
+        self.flush()
+        
+        delay = self.delay()
+        
+        while delay is not None:
+            if stop is not None:
+                remaining = stop - time.time()
+                
+                if remaining <= 0:
+                    return False
+                
+                delay = min(delay, remaining)
+            
+            time.sleep(delay)
+            
+            self.flush()
+            
+            delay = self.delay()
+        
+        return True
+    
+    def send_bulk(self, packets, callback = None):
+        """
+        Queue many packets with low priority. flush() sends them at rate of
+        send queue, or bulk_rate per second in writes of bulk_burst packets
+        for chat without one, so bulk sends neither block caller nor flood
+        server. Queued packets are sent while chat loop runs, callers
+        running none must call drain() before closing. callback() is called
+        after every packet is written.
+        """
+        
+        packets = list(packets)
+        
+        if self.metrics is not None:
+            with self.send_lock:
+                for packet in packets:
+                    self.metrics.packet_out(packet.type)
+        
+        self.__send_bulk(map(lambda packet: packet.pack(), packets), callback)
+    
+    def __send_bulk(self, data, callback):
+        with self.send_lock:
+            for item in data:
+                self.bulk_queue.put(item, PRIORITY_LOW, callback)
+        
+        self.flush()
+    
     def login(self, character_id):
         """
         Login to chat.
@@ -291,6 +816,20 @@ class Chat(object):
         # Unset current character
         self.character = None
     
+    def lookup_character(self, name, callback = None):
+        """
+        Resolve character name to ID, see CharacterCache.lookup().
+        """
+        
+        return self.names.lookup(self, name, callback)
+    
+    def get_character_name(self, character_id):
+        """
+        Get cached character name by ID or None.
+        """
+        
+        return self.names.get_name(character_id)
+    
     def send_private_message(self, character_id, message):
         """
         Send private message to player.
@@ -298,6 +837,38 @@ class Chat(object):
         
         self.send_packet(AOCP_PRIVATE_MESSAGE(character_id, message, AOFL_PRIVATE_MESSAGE))
     
+    def send_private_messages(self, character_ids, message, progress = None):
+        """
+        Send the same private message to many players. Message is packed
+        once and packets are sent as bulk, see send_bulk().
+        progress(done, total) is called as packets are written. Returns
+        number of messages.
+        """
+        
+        character_ids = list(character_ids)
+        total = len(character_ids)
+        done = [0]
+        
+        def sent():
+            done[0] += 1
+            
+            if progress:
+                progress(done[0], total)
+        
+        # Only recipient differs between packets
+        body = String(message).pack() + AOFL_PRIVATE_MESSAGE.pack()
+        header = struct.Struct(HEADER.format + "I")
+        length = 4 + len(body)
+        
+        if self.metrics is not None:
+            with self.send_lock:
+                for character_id in character_ids:
+                    self.metrics.packet_out(AOCP_PRIVATE_MESSAGE.type)
+        
+        self.__send_bulk(map(lambda character_id: header.pack(AOCP_PRIVATE_MESSAGE.type, length, character_id) + body, character_ids), sent)
+        
+        return total
+    
     def send_private_channel_message(self, channel_id, message):
         """
         Send message to private channel.
@@ -307,11 +878,46 @@ class Chat(object):
     
     def send_channel_message(self, channel_id, message):
         """
-        Send message to channel.
+        Send message to channel given by ID or name. Raises ValueError for
+        name of channel not announced by server.
         """
         
+        if isinstance(channel_id, basestring):
+            name, channel_id = channel_id, self.channels.get_id(channel_id)
+            
+            if channel_id is None:
+                raise ValueError("Unknown channel: %s" % name)
+        
         self.send_packet(AOCP_CHANNEL_MESSAGE(channel_id, message, AOFL_CHANNEL_MESSAGE))
     
+    def friend_add(self, character_id, flags = AOFL_FRIEND_BUDDY):
+        """
+        Add character to buddy list. Returns False if buddy list is full.
+        """
+        
+        return self.buddies.add(self, character_id, flags)
+    
+    def friend_remove(self, character_id):
+        """
+        Remove character from buddy list.
+        """
+        
+        self.buddies.remove(self, character_id)
+    
+    def private_channel_join(self, channel_id):
+        """
+        Join private channel after invite.
+        """
+        
+        self.private_channels.join(self, channel_id)
+    
+    def private_channel_leave(self, channel_id):
+        """
+        Leave private channel.
+        """
+        
+        self.private_channels.leave(self, channel_id)
+    
     def private_channel_invite(self, character_id):
         """
         Invite to private channel.
@@ -326,40 +932,91 @@ class Chat(object):
         
         self.send_packet(AOCP_PRIVATE_CHANNEL_KICK(character_id))
     
+    def private_channel_kick_many(self, character_ids):
+        """
+        Kick several characters from private channel, see
+        PrivateChannels.kick_many().
+        """
+        
+        self.private_channels.kick_many(self, character_ids)
+    
     def ping(self, message = "PING"):
         """
         Send ping to chat server.
         """
         
-        self.send_packet(AOCP_PING())
+        self.send_packet(AOCP_PING(), priority = PRIORITY_HIGH)
+    
+    def start(self, callback = None, ping_interval = 60000):
+        """
+        Start chat. Callback receives all packets, subscribed handlers only
+        packets of their types.
+        """
+        
+        self.__serve(callback, ping_interval)
+    
+    def supervise(self, callback = None, ping_interval = 60000, min_delay = 1.0, max_delay = 300.0):
+        """
+        Start chat and reconnect whenever connection is lost, see
+        reconnect(). Returns on KeyboardInterrupt. Other errors, also
+        ChatErrors raised by callback, are not handled.
+        """
+        
+        while True:
+            try:
+                if self.__serve(callback, ping_interval):
+                    return
+            except ConnectionLost:
+                pass
+            
+            self.reconnect(min_delay, max_delay)
     
-    def start(self, callback, ping_interval = 60000):
+    def __serve(self, callback, ping_interval):
         """
-        Start chat.
+        Run chat loop. Returns True when interrupted, False when connection
+        is closed by server.
         """
         
         poll = select.poll()
         poll.register(self.socket, select.POLLIN)
         
+        activity = time.time()
+        
         while True:
             try:
-                events = poll.poll(ping_interval)
+                self.flush()
                 
-                for socket, event in events:
-                    if event == select.POLLIN:
-                        try:
-                            packet = self.wait_packet()
-                        except UnexpectedPacket, (type, data):
-                            print "Unexpected packet %s: %s" % (type, repr(data))
-                            continue
+                # Handle already received packets before polling
+                if not self.buffer.has_packet():
+                    timeout = ping_interval
+                    
+                    # Wake up when queued packets may be sent
+                    delay = self.delay()
+                    
+                    if delay is not None:
+                        timeout = min(timeout, int(delay * 1000) + 1)
+                    
+                    events = poll.poll(timeout)
+                    
+                    if not events:
+                        if (time.time() - activity) * 1000 >= ping_interval:
+                            activity = time.time()
+                            self.ping()
                         
-                        callback(self, packet)
-                    elif event == select.POLLHUP:
-                        return
-                    elif event == select.POLLERR:
-                        return
+                        continue
+                    
+                    for fileno, event in events:
+                        if event & select.POLLIN:
+                            self.receive()
+                        elif event & (select.POLLHUP | select.POLLERR):
+                            return False
+                    
+                    activity = time.time()
+                    continue
                 
-                if not events:
-                    self.ping()
+                try:
+                    self.handle_packet(callback)
+                except UnexpectedPacket, (type, data):
+                    print "Unexpected packet %s: %s" % (type, repr(data))
             except KeyboardInterrupt:
-                break
+                return True
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Non-blocking chat client for asyncore event loop.
+"""
+
+
+import asyncore
+import errno
+import socket
+import time
+
+from aochat import SERVER_PACKETS, ChatError, _generate_login_key
+from aochat.buffer import PacketBuffer
+from aochat.packets import *
+
+
+### STATES #####################################################################
+
+
+STATE_SEED  = 0
+STATE_AUTH  = 1
+STATE_READY = 2
+STATE_LOGIN = 3
+STATE_CHAT  = 4
+
+
+### ANARCHY ONLINE CHAT PROTOCOL ###############################################
+
+
+class AsyncChat(asyncore.dispatcher):
+    """
+    Non-blocking Anarchy Online chat protocol implementation.
+    
+    Connection, authentication and login are driven by the event loop, so
+    many characters can share one loop() without threads. Override handle_*
+    methods or pass callback(chat, packet) to receive chat packets.
+    """
+    
+    def __init__(self, username, password, host, port, callback = None, map = None, keys = None):
+        asyncore.dispatcher.__init__(self, map = map)
+        
+        self.username = username
+        self.password = password
+        self.callback = callback
+        self.keys = keys
+        
+        self.state = STATE_SEED
+        self.character = None
+        self.characters = None
+        
+        self.buffer = PacketBuffer()
+        self.output = []
+        self.last_received = time.time()
+        
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect((host, port,))
+    
+    def send_packet(self, packet):
+        """
+        Queue packet to server.
+        """
+        
+        self.output.append(packet.pack())
+    
+    def login(self, character_id):
+        """
+        Login to chat. handle_login() is called once server accepts it.
+        """
+        
+        if self.state != STATE_READY:
+            raise ChatError("not authenticated.")
+        
+        # Lookup character
+        for character in self.characters:
+            if character_id == character.id:
+                break
+        else:
+            raise ChatError("no valid characters to login.")
+        
+        self.state = STATE_LOGIN
+        self.character = character
+        
+        self.send_packet(AOCP_LOGIN(character_id))
+    
+    def send_private_message(self, character_id, message):
+        """
+        Send private message to player.
+        """
+        
+        self.send_packet(AOCP_PRIVATE_MESSAGE(character_id, message, AOFL_PRIVATE_MESSAGE))
+    
+    def send_private_channel_message(self, channel_id, message):
+        """
+        Send message to private channel.
+        """
+        
+        self.send_packet(AOCP_PRIVATE_CHANNEL_MESSAGE(channel_id, message, AOFL_PRIVATE_CHANNEL_MESSAGE))
+    
+    def send_channel_message(self, channel_id, message):
+        """
+        Send message to channel.
+        """
+        
+        self.send_packet(AOCP_CHANNEL_MESSAGE(channel_id, message, AOFL_CHANNEL_MESSAGE))
+    
+    def private_channel_invite(self, character_id):
+        """
+        Invite to private channel.
+        """
+        
+        self.send_packet(AOCP_PRIVATE_CHANNEL_INVITE(character_id))
+    
+    def private_channel_kick(self, character_id):
+        """
+        Kick from private channel.
+        """
+        
+        self.send_packet(AOCP_PRIVATE_CHANNEL_KICK(character_id))
+    
+    def ping(self):
+        """
+        Send ping to chat server.
+        """
+        
+        self.send_packet(AOCP_PING())
+    
+    def handle_characters(self, characters):
+        """
+        Authenticated, characters list received.
+        """
+        
+        pass
+    
+    def handle_login(self):
+        """
+        Logged in with self.character.
+        """
+        
+        pass
+    
+    def handle_packet(self, packet):
+        """
+        Chat packet received.
+        """
+        
+        if self.callback:
+            self.callback(self, packet)
+    
+    def handle_unexpected_packet(self, packet_type, data):
+        """
+        Unknown packet received.
+        """
+        
+        pass
+    
+    def handle_auth_error(self, message):
+        """
+        Authentication or login failed.
+        """
+        
+        raise ChatError(message)
+    
+    def handle_connect(self):
+        pass
+    
+    def handle_close(self):
+        self.close()
+    
+    def writable(self):
+        return bool(self.output) or not self.connected
+    
+    def handle_write(self):
+        if not self.output:
+            return
+        
+        # Coalesce queued packets into one write
+        if len(self.output) > 1:
+            self.output = ["".join(self.output)]
+        
+        data = self.output[0]
+        sent = self.send(data)
+        
+        if sent < len(data):
+            self.output[0] = data[sent:]
+        else:
+            del self.output[0]
+    
+    def handle_read(self):
+        try:
+            received = self.buffer.recv(self.socket)
+        except socket.error, error:
+            if error.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            
+            raise
+        
+        if received == 0:
+            self.handle_close()
+            return
+        
+        self.last_received = time.time()
+        
+        for packet_type, data in self.buffer.packets():
+            try:
+                Packet = SERVER_PACKETS[packet_type]
+            except KeyError:
+                self.handle_unexpected_packet(packet_type, str(data))
+                continue
+            
+            self.handle_server_packet(Packet(data))
+    
+    def handle_server_packet(self, packet):
+        if self.state == STATE_CHAT:
+            self.handle_packet(packet)
+        elif self.state == STATE_SEED and packet.type == AOSP_SEED.type:
+            login_key = _generate_login_key(packet.server_key, self.username, self.password, self.keys.get() if self.keys is not None else None)
+            
+            self.state = STATE_AUTH
+            self.send_packet(AOCP_AUTH(self.username, login_key))
+        elif self.state == STATE_AUTH and packet.type == AOSP_CHARACTERS_LIST.type:
+            self.state = STATE_READY
+            self.characters = packet.characters
+            
+            self.handle_characters(self.characters)
+        elif self.state == STATE_LOGIN and packet.type == AOSP_LOGIN_OK.type:
+            self.state = STATE_CHAT
+            
+            self.handle_login()
+        elif packet.type == AOSP_AUTH_ERROR.type:
+            self.character = None
+            
+            self.handle_auth_error(packet.message)
+        else:
+            raise ChatError("Unexpected packet: %s" % packet.type)
+
+
+def loop(timeout = 1.0, ping_interval = 60000, map = None):
+    """
+    Run event loop for all chats, pinging idle ones.
+    """
+    
+    if map is None:
+        map = asyncore.socket_map
+    
+    while map:
+        asyncore.loop(timeout, map = map, count = 1)
+        
+        now = time.time()
+        
+        for chat in map.values():
+            if isinstance(chat, AsyncChat) and chat.state == STATE_CHAT:
+                if (now - chat.last_received) * 1000 >= ping_interval:
+                    chat.last_received = now
+                    chat.ping()
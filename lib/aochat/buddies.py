@@ -0,0 +1,452 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Buddy lists.
+"""
+
+
+import threading
+
+from aochat.packets import *
+
+
+class BuddyList(object):
+    """
+    Buddy list of one chat connection with online state of buddies.
+    
+    Feed it with AOSP_FRIEND_UPDATE and AOSP_FRIEND_REMOVE packets through
+    handle_packet(). Subscribed handlers receive only changes of online
+    state as handler(chat, character_id, online). Server accepts at most
+    limit buddies per character, see BuddyGroup for more. Buddies may be
+    added and removed by other threads than reader of chat.
+    """
+    
+    def __init__(self, limit = 1000):
+        self.limit = limit
+        
+        self.buddies = {}
+        self.online = {}
+        self.handlers = []
+        
+        self.lock = threading.RLock()
+    
+    def __len__(self):
+        return len(self.buddies)
+    
+    def __contains__(self, character_id):
+        return character_id in self.buddies
+    
+    def is_full(self):
+        return len(self.buddies) >= self.limit
+    
+    def is_online(self, character_id):
+        """
+        Get online state of buddy or None if server did not report it yet.
+        """
+        
+        return self.online.get(character_id)
+    
+    def get_online(self):
+        """
+        Get list of online buddies.
+        """
+        
+        with self.lock:
+            return [character_id for character_id, online in self.online.items() if online]
+    
+    def subscribe(self, handler):
+        """
+        Subscribe handler(chat, character_id, online) to logon and logoff.
+        """
+        
+        self.handlers.append(handler)
+    
+    def unsubscribe(self, handler):
+        """
+        Unsubscribe handler.
+        """
+        
+        self.handlers.remove(handler)
+    
+    def add(self, chat, character_id, flags = AOFL_FRIEND_BUDDY):
+        """
+        Add buddy. Returns False if buddy list is full.
+        """
+        
+        return not self.add_many(chat, (character_id,), flags)
+    
+    def add_many(self, chat, character_ids, flags = AOFL_FRIEND_BUDDY):
+        """
+        Add buddies sending packets as bulk, see Chat.send_bulk(). Returns
+        list of characters not added because buddy list is full.
+        """
+        
+        packets = []
+        rejected = []
+        
+        with self.lock:
+            for character_id in character_ids:
+                if self.buddies.get(character_id) == flags:
+                    continue
+                
+                if character_id not in self.buddies and self.is_full():
+                    rejected.append(character_id)
+                    continue
+                
+                self.buddies[character_id] = flags
+                
+                packets.append(AOCP_FRIEND_UPDATE(character_id, flags))
+        
+        if packets:
+            chat.send_bulk(packets)
+        
+        return rejected
+    
+    def remove(self, chat, character_id):
+        """
+        Remove buddy.
+        """
+        
+        self.remove_many(chat, (character_id,))
+    
+    def remove_many(self, chat, character_ids):
+        """
+        Remove buddies sending packets as bulk, see Chat.send_bulk().
+        """
+        
+        packets = []
+        
+        with self.lock:
+            for character_id in character_ids:
+                if self.buddies.pop(character_id, None) is None:
+                    continue
+                
+                self.online.pop(character_id, None)
+                
+                packets.append(AOCP_FRIEND_REMOVE(character_id))
+        
+        if packets:
+            chat.send_bulk(packets)
+    
+    def discard(self, character_id):
+        """
+        Forget buddy without telling server.
+        """
+        
+        with self.lock:
+            self.buddies.pop(character_id, None)
+            self.online.pop(character_id, None)
+    
+    def restore(self, chat):
+        """
+        Send whole buddy list to server again after reconnect, paced as
+        bulk.
+        """
+        
+        with self.lock:
+            packets = map(lambda (character_id, flags): AOCP_FRIEND_UPDATE(character_id, flags), self.buddies.items())
+        
+        if packets:
+            chat.send_bulk(packets)
+    
+    def handle_packet(self, chat, packet):
+        """
+        Update buddy state and notify handlers of logon and logoff.
+        """
+        
+        character_id = packet.character_id
+        
+        with self.lock:
+            if packet.type == AOSP_FRIEND_REMOVE.type:
+                self.buddies.pop(character_id, None)
+                self.online.pop(character_id, None)
+                return
+            
+            # Buddies added by other clients of the same character
+            self.buddies.setdefault(character_id, packet.flags)
+            
+            online = bool(packet.online)
+            previous = self.online.get(character_id)
+            
+            if previous == online:
+                return
+            
+            self.online[character_id] = online
+        
+        # First state report is a change only when buddy is online
+        if previous is None and not online:
+            return
+        
+        for handler in tuple(self.handlers):
+            handler(chat, character_id, online)
+
+
+class LeastUsed(object):
+    """
+    Buddy placement filling least used buddy lists first. Buddies stay on
+    their chat when chats are added.
+    """
+    
+    sticky = True
+    
+    def update(self, chats):
+        pass
+    
+    def locate(self, character_id, chats, counts):
+        """
+        Get chat for buddy having free space by counts or None.
+        """
+        
+        free = filter(lambda chat: counts[chat] < chat.buddies.limit, chats)
+        
+        return min(free, key = lambda chat: counts[chat]) if free else None
+
+
+class BuddyGroup(object):
+    """
+    Buddy list spread over several logged in <Chat>s, for more buddies than
+    one character is allowed to have.
+    
+    placement chooses buddy list of every buddy, LeastUsed() by default or
+    for example ConsistentHash(). Buddies of removed chats and buddies
+    rejected because all buddy lists were full are placed again when chats
+    change. Online state reported by chat having buddy is merged into one
+    view, subscribed handlers receive its changes as handler(chat,
+    character_id, online).
+    """
+    
+    def __init__(self, chats = (), placement = None):
+        self.placement = placement if placement is not None else LeastUsed()
+        
+        self.chats = []
+        
+        self.buddies = {}
+        self.owners = {}
+        self.online = {}
+        self.handlers = []
+        
+        for chat in chats:
+            self.add_chat(chat)
+    
+    def __len__(self):
+        return len(self.owners)
+    
+    def __contains__(self, character_id):
+        return character_id in self.owners
+    
+    def counts(self):
+        return dict(map(lambda chat: (chat, len(chat.buddies),), self.chats))
+    
+    def add_chat(self, chat):
+        """
+        Add logged in chat to group and move buddies placement now puts
+        on it.
+        """
+        
+        self.chats.append(chat)
+        self.placement.update(self.chats)
+        
+        chat.subscribe((AOSP_FRIEND_UPDATE,), self.handle_packet)
+        
+        self.rebalance()
+    
+    def remove_chat(self, chat):
+        """
+        Remove chat, for example disconnected one, and move its buddies to
+        other chats.
+        """
+        
+        self.chats.remove(chat)
+        self.placement.update(self.chats)
+        
+        chat.unsubscribe((AOSP_FRIEND_UPDATE,), self.handle_packet)
+        
+        for character_id, owner in self.owners.items():
+            if owner is chat:
+                # Connection may be gone, do not tell server
+                chat.buddies.discard(character_id)
+                
+                del self.owners[character_id]
+        
+        self.rebalance()
+    
+    def handle_disconnect(self, chat, error):
+        """
+        Remove disconnected chat, usable as ChatPool.handle_disconnect.
+        """
+        
+        self.remove_chat(chat)
+    
+    def rebalance(self):
+        """
+        Move buddies to chats chosen by placement. Returns list of buddies
+        without chat because all buddy lists are full.
+        """
+        
+        counts = self.counts()
+        added = {}
+        removed = {}
+        rejected = []
+        
+        for character_id, flags in self.buddies.items():
+            owner = self.owners.get(character_id)
+            
+            if owner is not None and self.placement.sticky:
+                continue
+            
+            if owner is not None:
+                counts[owner] -= 1
+            
+            chat = self.placement.locate(character_id, self.chats, counts) if self.chats else None
+            
+            if chat is None:
+                self.owners.pop(character_id, None)
+                rejected.append(character_id)
+            else:
+                counts[chat] += 1
+            
+            if chat is owner:
+                continue
+            
+            if owner is not None:
+                removed.setdefault(owner, []).append(character_id)
+            
+            if chat is not None:
+                self.owners[character_id] = chat
+                added.setdefault((chat, flags,), []).append(character_id)
+        
+        for chat, batch in removed.items():
+            chat.buddies.remove_many(chat, batch)
+        
+        for (chat, flags), batch in added.items():
+            chat.buddies.add_many(chat, batch, flags)
+        
+        return rejected
+    
+    def find(self, character_id):
+        """
+        Get chat having buddy or None.
+        """
+        
+        return self.owners.get(character_id)
+    
+    def is_online(self, character_id):
+        """
+        Get online state of buddy or None.
+        """
+        
+        return self.online.get(character_id)
+    
+    def get_online(self):
+        """
+        Get list of online buddies.
+        """
+        
+        return [character_id for character_id, online in self.online.items() if online]
+    
+    def subscribe(self, handler):
+        """
+        Subscribe handler(chat, character_id, online) to logon and logoff.
+        """
+        
+        self.handlers.append(handler)
+    
+    def unsubscribe(self, handler):
+        """
+        Unsubscribe handler.
+        """
+        
+        self.handlers.remove(handler)
+    
+    def add(self, character_id, flags = AOFL_FRIEND_BUDDY):
+        """
+        Add buddy. Returns False if all buddy lists are full.
+        """
+        
+        return not self.add_many((character_id,), flags)
+    
+    def add_many(self, character_ids, flags = AOFL_FRIEND_BUDDY):
+        """
+        Add buddies sending one batch per chat. Returns list of buddies not
+        added yet because all buddy lists are full.
+        """
+        
+        counts = self.counts()
+        batches = {}
+        rejected = []
+        
+        for character_id in character_ids:
+            self.buddies[character_id] = flags
+            
+            # Existing buddies stay on their chat
+            chat = self.owners.get(character_id)
+            
+            if chat is None:
+                chat = self.placement.locate(character_id, self.chats, counts) if self.chats else None
+                
+                if chat is None:
+                    rejected.append(character_id)
+                    continue
+                
+                counts[chat] += 1
+                self.owners[character_id] = chat
+            
+            batches.setdefault(chat, []).append(character_id)
+        
+        for chat, batch in batches.items():
+            chat.buddies.add_many(chat, batch, flags)
+        
+        return rejected
+    
+    def remove(self, character_id):
+        """
+        Remove buddy.
+        """
+        
+        self.remove_many((character_id,))
+    
+    def remove_many(self, character_ids):
+        """
+        Remove buddies sending one batch per chat.
+        """
+        
+        batches = {}
+        
+        for character_id in character_ids:
+            self.buddies.pop(character_id, None)
+            self.online.pop(character_id, None)
+            
+            chat = self.owners.pop(character_id, None)
+            
+            if chat is not None:
+                batches.setdefault(chat, []).append(character_id)
+        
+        for chat, batch in batches.items():
+            chat.buddies.remove_many(chat, batch)
+    
+    def handle_packet(self, chat, packet):
+        """
+        Merge online state reported by chat having buddy.
+        """
+        
+        character_id = packet.character_id
+        
+        if self.owners.get(character_id) is not chat:
+            return
+        
+        online = bool(packet.online)
+        previous = self.online.get(character_id)
+        
+        if previous == online:
+            return
+        
+        self.online[character_id] = online
+        
+        # First state report is a change only when buddy is online
+        if previous is None and not online:
+            return
+        
+        for handler in tuple(self.handlers):
+            handler(chat, character_id, online)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Receive buffer.
+"""
+
+
+import struct
+
+
+HEADER = struct.Struct(">2H")
+
+# Header and the longest possible packet body must always fit
+MIN_BUFFER_SIZE = HEADER.size + 0xFFFF
+
+
+class PacketBuffer(object):
+    """
+    Reusable receive buffer splitting incoming data into packets.
+    
+    Data is received straight into preallocated bytearray and packets are
+    returned as (packet_type, data) where data is read-only buffer over the
+    packet body. Body is valid only until the next recv() or feed() call.
+    """
+    
+    def __init__(self, size = MIN_BUFFER_SIZE * 2):
+        if size < MIN_BUFFER_SIZE:
+            raise ValueError("too small buffer")
+        
+        self.data = bytearray(size)
+        self.view = memoryview(self.data)
+        
+        self.start = 0
+        self.end = 0
+    
+    def __len__(self):
+        return self.end - self.start
+    
+    def compact(self):
+        """
+        Move unparsed data to the beginning of buffer.
+        """
+        
+        if self.start:
+            length = self.end - self.start
+            
+            # Ranges may overlap, so unparsed data is copied out first
+            if length:
+                self.data[:length] = self.data[self.start:self.end]
+            
+            self.start = 0
+            self.end = length
+    
+    def reserve(self):
+        """
+        Get number of bytes available for receiving.
+        """
+        
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif len(self.data) - self.end < MIN_BUFFER_SIZE:
+            self.compact()
+        
+        return len(self.data) - self.end
+    
+    def recv(self, sock):
+        """
+        Receive data from socket. Returns number of received bytes.
+        """
+        
+        size = self.reserve()
+        received = sock.recv_into(self.view[self.end:], size)
+        
+        self.end += received
+        
+        return received
+    
+    def feed(self, data):
+        """
+        Append data received elsewhere.
+        """
+        
+        offset = 0
+        
+        while offset < len(data):
+            length = min(len(data) - offset, self.reserve())
+            
+            if not length:
+                raise ValueError("buffer overflow")
+            
+            self.data[self.end:self.end + length] = data[offset:offset + length]
+            self.end += length
+            offset += length
+    
+    def has_packet(self):
+        """
+        Check if buffer contains complete packet.
+        """
+        
+        length = self.end - self.start
+        
+        if length < HEADER.size:
+            return False
+        
+        return length >= HEADER.size + HEADER.unpack_from(self.data, self.start)[1]
+    
+    def peek(self):
+        """
+        Get type of the next complete packet or None.
+        """
+        
+        if not self.has_packet():
+            return None
+        
+        return HEADER.unpack_from(self.data, self.start)[0]
+    
+    def packet(self):
+        """
+        Get next complete packet as (packet_type, data) or None.
+        """
+        
+        if self.end - self.start < HEADER.size:
+            return None
+        
+        packet_type, packet_length = HEADER.unpack_from(self.data, self.start)
+        
+        offset = self.start + HEADER.size
+        
+        if self.end - offset < packet_length:
+            return None
+        
+        self.start = offset + packet_length
+        
+        return packet_type, buffer(self.data, offset, packet_length)
+    
+    def packets(self):
+        """
+        Iterate over complete packets.
+        """
+        
+        packet = self.packet()
+        
+        while packet is not None:
+            yield packet
+            
+            packet = self.packet()
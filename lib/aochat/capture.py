@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Packet capture files.
+
+Capture file is MAGIC followed by records of RECORD header (timestamp,
+direction, packet type, body length) and packet body. Records are only
+appended, so capture of crashed program is readable up to its last
+complete record.
+"""
+
+
+import mmap
+import os
+import struct
+import time
+
+from aochat import SERVER_PACKETS, CLIENT_PACKETS, UnexpectedPacket
+from aochat.buffer import HEADER
+from aochat.packets import *
+
+
+MAGIC = "AOCAP\x00\x01\n"
+RECORD = struct.Struct(">dBHH")
+
+DIRECTION_IN  = 0
+DIRECTION_OUT = 1
+
+
+class CaptureWriter(object):
+    """
+    Appends packets to capture file. Use as Chat(capture = writer) to
+    record everything chat receives and sends.
+    """
+    
+    def __init__(self, path, buffering = 65536):
+        self.file = open(path, "ab", buffering)
+        self.count = 0
+        
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+    
+    def write(self, direction, packet_type, data, timestamp = None):
+        """
+        Append packet body.
+        """
+        
+        self.file.write(RECORD.pack(time.time() if timestamp is None else timestamp, direction, packet_type, len(data)))
+        self.file.write(data)
+        
+        self.count += 1
+    
+    def write_frames(self, direction, data):
+        """
+        Append all packets of sent data.
+        """
+        
+        now = time.time()
+        offset = 0
+        
+        while offset < len(data):
+            packet_type, length = HEADER.unpack_from(data, offset)
+            offset = offset + HEADER.size
+            
+            self.write(direction, packet_type, buffer(data, offset, length), now)
+            
+            offset = offset + length
+    
+    def received(self, packet_type, data):
+        """
+        Append received packet.
+        """
+        
+        self.write(DIRECTION_IN, packet_type, data)
+    
+    def sent(self, data):
+        """
+        Append packets of sent data.
+        """
+        
+        self.write_frames(DIRECTION_OUT, data)
+    
+    def flush(self):
+        self.file.flush()
+    
+    def close(self):
+        self.file.close()
+
+
+class CaptureReader(object):
+    """
+    Memory mapped capture file. Iteration yields records (timestamp,
+    direction, packet type, body) with body as buffer over the file.
+    """
+    
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        
+        size = os.fstat(self.file.fileno()).st_size
+        
+        if size < len(MAGIC):
+            self.file.close()
+            raise ValueError("not a capture file")
+        
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("not a capture file")
+    
+    def __iter__(self):
+        data = self.map
+        end = len(data)
+        
+        offset = len(MAGIC)
+        
+        # Incomplete last record is ignored
+        while offset + RECORD.size <= end:
+            timestamp, direction, packet_type, length = RECORD.unpack_from(data, offset)
+            offset = offset + RECORD.size
+            
+            if offset + length > end:
+                break
+            
+            yield timestamp, direction, packet_type, buffer(data, offset, length)
+            
+            offset = offset + length
+    
+    def packets(self, direction = DIRECTION_IN):
+        """
+        Yield (timestamp, packet) of direction decoded by SERVER_PACKETS or
+        CLIENT_PACKETS. Unknown packets are yielded as UnexpectedPacket.
+        """
+        
+        packets = SERVER_PACKETS if direction == DIRECTION_IN else CLIENT_PACKETS
+        
+        for timestamp, record_direction, packet_type, data in self:
+            if record_direction != direction:
+                continue
+            
+            try:
+                Class = packets[packet_type]
+            except KeyError:
+                yield timestamp, UnexpectedPacket(packet_type, str(data))
+                continue
+            
+            if direction == DIRECTION_IN:
+                yield timestamp, Class(data)
+            else:
+                yield timestamp, Packet.__new__(Class, Class.type, Class.codec.unpack(data))
+    
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def replay(path, callback = None, speed = None, direction = DIRECTION_IN):
+    """
+    Decode packets of capture file and pass them to callback(packet). With
+    speed packets are replayed in recorded pace, speed times faster,
+    otherwise as fast as possible. Returns number of packets.
+    """
+    
+    reader = CaptureReader(path)
+    
+    count = 0
+    
+    try:
+        start = None
+        
+        for timestamp, packet in reader.packets(direction):
+            if speed:
+                if start is None:
+                    start = (time.time(), timestamp,)
+                
+                delay = (timestamp - start[1]) / speed - (time.time() - start[0])
+                
+                if delay > 0:
+                    time.sleep(delay)
+            
+            if callback:
+                callback(packet)
+            
+            count += 1
+    finally:
+        reader.close()
+    
+    return count
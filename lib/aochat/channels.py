@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Channel state.
+"""
+
+
+from aochat.packets import *
+
+
+class PrivateChannels(object):
+    """
+    Members of private channels, own one and joined ones.
+    
+    Feed it with AOSP_PRIVATE_CHANNEL_INVITE, AOSP_PRIVATE_CHANNEL_KICK,
+    AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN and
+    AOSP_PRIVATE_CHANNEL_CHARACTER_LEAVE packets through handle_packet().
+    Own private channel has ID of logged in character.
+    """
+    
+    def __init__(self):
+        self.members = {}
+        self.invites = set()
+        self.joined = set()
+    
+    def __contains__(self, channel_id):
+        return channel_id in self.members
+    
+    def is_member(self, channel_id, character_id):
+        """
+        Check if character is in private channel.
+        """
+        
+        return character_id in self.members.get(channel_id, ())
+    
+    def get_members(self, channel_id):
+        """
+        Get set of characters in private channel.
+        """
+        
+        return frozenset(self.members.get(channel_id, ()))
+    
+    def join(self, chat, channel_id):
+        """
+        Join private channel after invite.
+        """
+        
+        self.invites.discard(channel_id)
+        self.joined.add(channel_id)
+        
+        chat.send_packet(AOCP_PRIVATE_CHANNEL_JOIN(channel_id))
+    
+    def leave(self, chat, channel_id):
+        """
+        Leave private channel.
+        """
+        
+        self.joined.discard(channel_id)
+        self.members.pop(channel_id, None)
+        
+        chat.send_packet(AOCP_PRIVATE_CHANNEL_LEAVE(channel_id))
+    
+    def kick_many(self, chat, character_ids):
+        """
+        Kick characters from own private channel. Kicks are sent as bulk
+        with low priority, see Chat.send_bulk(), so they are paced without
+        holding back other packets or blocking caller.
+        """
+        
+        chat.send_bulk(map(AOCP_PRIVATE_CHANNEL_KICK, character_ids))
+    
+    def kick_all(self, chat):
+        """
+        Kick all members of own private channel.
+        """
+        
+        self.kick_many(chat, sorted(self.members.get(chat.character.id, ())))
+    
+    def restore(self, chat):
+        """
+        Join private channels again after reconnect. Members are reported
+        by server again.
+        """
+        
+        self.members = {}
+        
+        for channel_id in self.joined:
+            chat.send_packet(AOCP_PRIVATE_CHANNEL_JOIN(channel_id))
+    
+    def handle_packet(self, chat, packet):
+        """
+        Update channels from packet.
+        """
+        
+        if packet.type == AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN.type:
+            self.members.setdefault(packet.channel_id, set()).add(packet.character_id)
+        elif packet.type == AOSP_PRIVATE_CHANNEL_CHARACTER_LEAVE.type:
+            members = self.members.get(packet.channel_id)
+            
+            if members is not None:
+                members.discard(packet.character_id)
+                
+                if not members:
+                    del self.members[packet.channel_id]
+        elif packet.type == AOSP_PRIVATE_CHANNEL_INVITE.type:
+            self.invites.add(packet.channel_id)
+        elif packet.type == AOSP_PRIVATE_CHANNEL_KICK.type:
+            self.joined.discard(packet.channel_id)
+            self.members.pop(packet.channel_id, None)
+
+
+class Channels(object):
+    """
+    Public channels announced by server, indexed by ID and case-insensitive
+    name.
+    
+    Feed it with AOSP_CHANNEL_JOIN and AOSP_CHANNEL_LEAVE packets through
+    handle_packet().
+    """
+    
+    def __init__(self):
+        self.ids = {}
+        self.names = {}
+        self.statuses = {}
+    
+    def __len__(self):
+        return len(self.names)
+    
+    def __contains__(self, channel):
+        if isinstance(channel, basestring):
+            return channel.lower() in self.ids
+        
+        return channel in self.names
+    
+    def get_id(self, name):
+        """
+        Get channel ID by name or None.
+        """
+        
+        return self.ids.get(name.lower())
+    
+    def get_name(self, channel_id):
+        """
+        Get channel name by ID or None.
+        """
+        
+        return self.names.get(channel_id)
+    
+    def get_status(self, channel_id):
+        """
+        Get channel status flags by ID or None.
+        """
+        
+        return self.statuses.get(channel_id)
+    
+    def handle_packet(self, chat, packet):
+        """
+        Update channels from packet.
+        """
+        
+        channel_id = packet.channel_id
+        name = self.names.pop(channel_id, None)
+        
+        if name is not None:
+            # Name may be taken by other channel meanwhile
+            if self.ids.get(name.lower()) == channel_id:
+                del self.ids[name.lower()]
+            
+            self.statuses.pop(channel_id, None)
+        
+        if packet.type == AOSP_CHANNEL_JOIN.type:
+            self.ids[packet.channel_name.lower()] = channel_id
+            self.names[channel_id] = packet.channel_name
+            self.statuses[channel_id] = packet.channel_status
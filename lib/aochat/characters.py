@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Character names cache.
+"""
+
+
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+
+from aochat.packets import *
+
+
+class CharacterCache(object):
+    """
+    Bidirectional character name <-> ID cache with LRU eviction.
+    
+    Names are case-insensitive. Names reported unknown by server are kept
+    for unknown_ttl seconds. Lookups not answered in lookup_timeout seconds
+    are sent again. Feed it with AOSP_CHARACTER_NAME and
+    AOSP_CHARACTER_LOOKUP packets through handle_packet(). Cache may be
+    used by several threads, for example callbacks run by Dispatcher.
+    """
+    
+    def __init__(self, size = 10000, unknown_ttl = 600, lookup_timeout = 30):
+        self.size = size
+        self.unknown_ttl = unknown_ttl
+        self.lookup_timeout = lookup_timeout
+        
+        self.ids = OrderedDict()
+        self.names = {}
+        self.unknown = OrderedDict()
+        self.pending = {}
+        
+        # Answers are handled by reader thread while workers look up names
+        self.lock = threading.RLock()
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __contains__(self, name):
+        return name.lower() in self.ids
+    
+    def add(self, character_id, name):
+        """
+        Remember character.
+        """
+        
+        key = name.lower()
+        
+        with self.lock:
+            if character_id == AOFL_CHARACTER_UNKNOWN:
+                self.unknown.pop(key, None)
+                self.unknown[key] = time.time()
+                
+                if len(self.unknown) > self.size:
+                    self.unknown.popitem(last = False)
+                
+                return
+            
+            self.unknown.pop(key, None)
+            
+            # Character may be renamed
+            if self.names.get(character_id, name).lower() != key:
+                self.ids.pop(self.names[character_id].lower(), None)
+            
+            old_id = self.ids.pop(key, None)
+            
+            if old_id is not None and old_id != character_id:
+                self.names.pop(old_id, None)
+            
+            self.ids[key] = character_id
+            self.names[character_id] = name
+            
+            while len(self.ids) > self.size:
+                key, character_id = self.ids.popitem(last = False)
+                self.names.pop(character_id, None)
+    
+    def get_id(self, name):
+        """
+        Get cached character ID by name. Returns AOFL_CHARACTER_UNKNOWN for
+        names known to be unknown and None if name is not cached.
+        """
+        
+        key = name.lower()
+        
+        with self.lock:
+            try:
+                character_id = self.ids.pop(key)
+            except KeyError:
+                if self.is_unknown(name):
+                    return AOFL_CHARACTER_UNKNOWN
+                
+                return None
+            
+            # Recently used
+            self.ids[key] = character_id
+        
+        return character_id
+    
+    def get_name(self, character_id):
+        """
+        Get cached character name by ID or None.
+        """
+        
+        with self.lock:
+            name = self.names.get(character_id)
+            
+            if name is not None:
+                self.get_id(name)
+        
+        return name
+    
+    def is_unknown(self, name):
+        """
+        Check if server recently reported name as unknown.
+        """
+        
+        key = name.lower()
+        
+        with self.lock:
+            reported = self.unknown.get(key)
+            
+            if reported is None:
+                return False
+            
+            if time.time() - reported >= self.unknown_ttl:
+                del self.unknown[key]
+                
+                return False
+        
+        return True
+    
+    def lookup(self, chat, name, callback = None):
+        """
+        Resolve name to character ID, asking chat server if it is not
+        cached. callback(name, character_id) is called at once for cached
+        names or when server answers; lookups of the same name in flight
+        share one request until it times out. Returns character ID or None
+        if it is not known yet.
+        """
+        
+        key = name.lower()
+        now = time.time()
+        send = False
+        
+        with self.lock:
+            character_id = self.get_id(name)
+            
+            if character_id is None:
+                entry = self.pending.setdefault(key, [None, []])
+                
+                # Callback waits before request is sent, answer may come
+                # before send returns
+                if callback:
+                    entry[1].append(callback)
+                
+                # Unanswered request is sent again, waiting callbacks are kept
+                if entry[0] is None or now - entry[0] >= self.lookup_timeout:
+                    entry[0] = now
+                    send = True
+        
+        if character_id is not None:
+            if callback:
+                callback(name, character_id)
+            
+            return character_id
+        
+        if send:
+            chat.send_packet(AOCP_CHARACTER_LOOKUP(name))
+        
+        return None
+    
+    def expire(self):
+        """
+        Forget lookups not answered in lookup_timeout seconds.
+        """
+        
+        now = time.time()
+        
+        with self.lock:
+            for key, (sent, callbacks) in self.pending.items():
+                if now - sent >= self.lookup_timeout:
+                    del self.pending[key]
+    
+    def resend(self, chat):
+        """
+        Send pending lookups again after reconnect, expired ones are
+        forgotten.
+        """
+        
+        self.expire()
+        
+        now = time.time()
+        
+        with self.lock:
+            keys = self.pending.keys()
+            
+            for key in keys:
+                self.pending[key][0] = now
+        
+        for key in keys:
+            chat.send_packet(AOCP_CHARACTER_LOOKUP(key))
+    
+    def handle_packet(self, chat, packet):
+        """
+        Update cache from packet and complete pending lookups.
+        """
+        
+        with self.lock:
+            self.add(packet.character_id, packet.character_name)
+            
+            sent, callbacks = self.pending.pop(packet.character_name.lower(), (None, ()))
+        
+        for callback in callbacks:
+            callback(packet.character_name, packet.character_id)
+
+
+class PersistentCharacterCache(CharacterCache):
+    """
+    Character cache backed by SQLite database file.
+    
+    Database is opened on first use and queried on memory cache misses, so
+    restarted bots do not look up known names again. New entries are
+    written in batches of batch_size or every save_interval seconds, call
+    save() before exit. Entries older than max_age seconds are ignored.
+    One connection is shared by all threads using the cache, guarded by
+    lock of the cache.
+    """
+    
+    def __init__(self, path, size = 10000, unknown_ttl = 600, max_age = None, batch_size = 100, save_interval = 10, lookup_timeout = 30):
+        CharacterCache.__init__(self, size, unknown_ttl, lookup_timeout)
+        
+        self.path = path
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.save_interval = save_interval
+        
+        self.connection = None
+        self.dirty = {}
+        self.saved = time.time()
+    
+    def database(self):
+        """
+        Get database connection, opening it on first use.
+        """
+        
+        with self.lock:
+            if self.connection is None:
+                self.connection = sqlite3.connect(self.path, check_same_thread = False)
+                self.connection.executescript("""
+                    CREATE TABLE IF NOT EXISTS characters (
+                        id      INTEGER PRIMARY KEY,
+                        name    TEXT NOT NULL,
+                        key     TEXT NOT NULL,
+                        updated REAL NOT NULL
+                    );
+                    
+                    CREATE INDEX IF NOT EXISTS characters_key ON characters (key);
+                """)
+            
+            return self.connection
+    
+    def load(self, column, value):
+        """
+        Load character from database into memory cache.
+        """
+        
+        oldest = time.time() - self.max_age if self.max_age else 0
+        
+        with self.lock:
+            row = self.database().execute("SELECT id, name FROM characters WHERE %s = ? AND updated >= ? ORDER BY updated DESC LIMIT 1" % column, (value, oldest,)).fetchone()
+        
+        if row is None:
+            return None
+        
+        character_id, name = Integer(row[0]), row[1].encode("latin-1")
+        
+        CharacterCache.add(self, character_id, name)
+        
+        return character_id, name
+    
+    def add(self, character_id, name):
+        CharacterCache.add(self, character_id, name)
+        
+        if character_id != AOFL_CHARACTER_UNKNOWN:
+            with self.lock:
+                self.dirty[character_id] = (name, time.time(),)
+                
+                if len(self.dirty) >= self.batch_size or time.time() - self.saved >= self.save_interval:
+                    self.save()
+    
+    def get_id(self, name):
+        character_id = CharacterCache.get_id(self, name)
+        
+        if character_id is None:
+            character = self.load("key", name.lower().decode("latin-1"))
+            
+            if character:
+                character_id = character[0]
+        
+        return character_id
+    
+    def get_name(self, character_id):
+        name = CharacterCache.get_name(self, character_id)
+        
+        if name is None:
+            character = self.load("id", long(character_id))
+            
+            if character:
+                name = character[1]
+        
+        return name
+    
+    def save(self):
+        """
+        Write new entries to database.
+        """
+        
+        with self.lock:
+            self.saved = time.time()
+            
+            if not self.dirty:
+                return
+            
+            rows = []
+            
+            for character_id, (name, updated) in self.dirty.items():
+                rows.append((long(character_id), name.decode("latin-1"), name.lower().decode("latin-1"), updated,))
+            
+            database = self.database()
+            
+            with database:
+                database.executemany("INSERT OR REPLACE INTO characters (id, name, key, updated) VALUES (?, ?, ?, ?)", rows)
+            
+            self.dirty = {}
+    
+    def close(self):
+        """
+        Save new entries and close database.
+        """
+        
+        with self.lock:
+            self.save()
+            
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Precompiled packet codecs.
+"""
+
+
+import struct
+
+from aochat.buffer import HEADER
+
+
+class Codec(object):
+    """
+    Packer and unpacker compiled once for sequence of data types.
+    
+    Runs of fixed-width types (having format) are handled by one
+    struct.Struct each, other types by their own pack() and unpack_from().
+    Both functions are generated as straight-line code for the layout, the
+    same way collections.namedtuple builds its classes.
+    """
+    
+    def __init__(self, types):
+        self.types = tuple(types)
+        
+        namespace = {
+            "HEADER": HEADER,
+        }
+        
+        items = map(lambda index: "item%d" % index, range(len(self.types)))
+        
+        unpack = ["def unpack(data):", "offset = 0"]
+        pack = ["def pack(packet_type, args):"]
+        
+        if items:
+            pack.append("%s, = args" % ", ".join(items))
+        
+        parts = []
+        arguments = []
+        
+        index = 0
+        
+        for fixed, types in self.split():
+            if fixed is None:
+                namespace["unpack%d" % index] = types[0].unpack_from
+                
+                unpack.append("item%d, offset = unpack%d(data, offset)" % (index, index,))
+                parts.append("item%d.pack()" % index)
+                
+                index = index + 1
+                continue
+            
+            namespace["struct%d" % index] = fixed
+            
+            unpack.append("if len(data) < offset + %d: raise ValueError('too short data')" % fixed.size)
+            
+            values = []
+            convert = []
+            arguments = []
+            
+            for Type in types:
+                names = map(lambda i: "value%d_%d" % (index, i), range(len(Type.format)))
+                
+                namespace["from_struct%d" % index] = Type.from_struct
+                
+                convert.append("item%d = from_struct%d(%s)" % (index, index, ", ".join(names),))
+                
+                # Single value types are numbers packed as is
+                if len(names) == 1:
+                    arguments.append("item%d" % index)
+                else:
+                    pack.append("%s, = item%d.to_struct()" % (", ".join(names), index,))
+                    arguments.extend(names)
+                
+                values.extend(names)
+                
+                index = index + 1
+            
+            unpack.append("%s, = struct%d.unpack_from(data, offset)" % (", ".join(values), index - len(types),))
+            unpack.append("offset = offset + %d" % fixed.size)
+            unpack.extend(convert)
+            
+            parts.append("struct%d.pack(%s)" % (index - len(types), ", ".join(arguments),))
+        
+        unpack.append("return [%s]" % ", ".join(items))
+        
+        if all(map(lambda Type: Type.format, self.types)):
+            # Fixed-width packet is packed together with header
+            packet = struct.Struct(HEADER.format + "".join(map(lambda Type: Type.format, self.types)))
+            
+            namespace["PACKET"] = packet
+            
+            pack.append("return PACKET.pack(%s)" % ", ".join(["packet_type", str(packet.size - HEADER.size)] + arguments))
+        else:
+            pack.append("data = ''.join((%s,))" % ", ".join(parts))
+            pack.append("return HEADER.pack(packet_type, len(data)) + data")
+        
+        self.source = "\n    ".join(unpack) + "\n\n" + "\n    ".join(pack) + "\n"
+        
+        exec self.source in namespace
+        
+        self.unpack = namespace["unpack"]
+        self.pack = namespace["pack"]
+    
+    def split(self):
+        """
+        Split types into runs of fixed-width types and single other types.
+        Returns list of (struct.Struct or None, types).
+        """
+        
+        steps = []
+        run = []
+        
+        for Type in self.types + (None,):
+            if Type is not None and Type.format:
+                run.append(Type)
+                continue
+            
+            if run:
+                steps.append((struct.Struct(">" + "".join(map(lambda Type: Type.format, run))), tuple(run),))
+                
+                run = []
+            
+            if Type is not None:
+                steps.append((None, (Type,),))
+        
+        return steps
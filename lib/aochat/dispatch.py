@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Callbacks run by worker threads.
+"""
+
+
+import itertools
+import threading
+import time
+import traceback
+
+from Queue import Queue, Full
+
+
+def sender_key(packet):
+    """
+    Get channel or character the packet is from, None for other packets.
+    """
+    
+    key = getattr(packet, "channel_id", None)
+    
+    if key is None:
+        key = getattr(packet, "character_id", None)
+    
+    return key
+
+
+class Dispatcher(object):
+    """
+    Callback wrapper passing packets to pool of worker threads.
+    
+    Use it as callback, chat.start(Dispatcher(callback)), so reader thread
+    only decodes packets. Packets with the same key(packet) go to the same
+    worker and are handled in order, packets with key None to any worker.
+    Callbacks may send through chat, Chat serializes writes of all threads,
+    and use its character cache and buddy list, which are guarded by their
+    locks. Other state shared with reader thread needs own locking.
+    Every worker has queue of size packets; reader waits while it is full
+    and time spent waiting is counted in stats().
+    """
+    
+    def __init__(self, callback, workers = 4, size = 1000, key = sender_key):
+        self.callback = callback
+        self.key = key
+        
+        self.queues = map(lambda i: Queue(size), range(workers))
+        self.counter = itertools.count()
+        
+        self.lock = threading.Lock()
+        self.dispatched = 0
+        self.processed = 0
+        self.errors = 0
+        self.blocked = 0
+        self.blocked_time = 0.0
+        self.max_depth = 0
+        
+        self.workers = []
+        
+        for queue in self.queues:
+            worker = threading.Thread(target = self.run, args = (queue,), name = "Dispatcher")
+            worker.daemon = True
+            worker.start()
+            
+            self.workers.append(worker)
+    
+    def __call__(self, chat, packet):
+        self.dispatch(chat, packet)
+    
+    def dispatch(self, chat, packet):
+        """
+        Queue packet for worker.
+        """
+        
+        key = self.key(packet)
+        
+        if key is None:
+            index = next(self.counter)
+        else:
+            index = hash(key)
+        
+        queue = self.queues[index % len(self.queues)]
+        
+        try:
+            queue.put_nowait((chat, packet,))
+        except Full:
+            # Backpressure: reader waits for worker
+            started = time.time()
+            queue.put((chat, packet,))
+            
+            self.blocked += 1
+            self.blocked_time += time.time() - started
+        
+        self.dispatched += 1
+        self.max_depth = max(self.max_depth, queue.qsize())
+    
+    def run(self, queue):
+        while True:
+            item = queue.get()
+            
+            if item is None:
+                return
+            
+            chat, packet = item
+            
+            try:
+                self.callback(chat, packet)
+            except Exception:
+                with self.lock:
+                    self.errors += 1
+                
+                traceback.print_exc()
+            
+            with self.lock:
+                self.processed += 1
+    
+    def close(self):
+        """
+        Handle queued packets and stop workers.
+        """
+        
+        for queue in self.queues:
+            queue.put(None)
+        
+        for worker in self.workers:
+            worker.join()
+    
+    def stats(self):
+        """
+        Get dispatch statistics.
+        """
+        
+        return {
+            "depth":        sum(map(lambda queue: queue.qsize(), self.queues)),
+            "max_depth":    self.max_depth,
+            "dispatched":   self.dispatched,
+            "processed":    self.processed,
+            "errors":       self.errors,
+            "blocked":      self.blocked,
+            "blocked_time": self.blocked_time,
+        }
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Extended messages.
+
+Extended message refers to text template by (category, instance) and
+carries its arguments. Channel messages from system (character 0) carry
+them encoded as "~&" blob:
+    
+    ~& category instance (type value)* ~
+
+where numbers are five base 85 digits and types are
+    
+    s - string prefixed by length byte (including itself)
+    i - signed number
+    u - unsigned number
+    R - reference to other template (category, instance)
+    l - reference to template of category 20000, instance as 4 bytes
+
+Chat notices carry arguments of category 20000 templates as "S" String and
+"I" Integer values.
+"""
+
+
+import re
+import struct
+import threading
+
+from collections import OrderedDict
+
+from aochat.types import Integer, String
+
+
+NOTICE_CATEGORY = 20000
+
+# Most recently used parsed blobs kept
+CACHE_SIZE = 4096
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _b85(data, offset, end):
+    """
+    Decode five base 85 digits at offset, not reading past end.
+    """
+    
+    if end < offset + 5:
+        raise ValueError("too short data")
+    
+    a, b, c, d, e = map(ord, data[offset:offset + 5])
+    
+    return (((((a - 33) * 85 + b - 33) * 85 + c - 33) * 85 + d - 33) * 85 + e - 33), offset + 5
+
+
+def parse_extended(message):
+    """
+    Parse "~&" blob to (category, instance, args). References are returned
+    as (category, instance) tuples. Arguments of unknown types are skipped
+    and parsing stops at truncated argument. Blobs seen recently are not
+    parsed again.
+    """
+    
+    with _cache_lock:
+        try:
+            extended = _cache.pop(message)
+        except KeyError:
+            pass
+        else:
+            # Recently used
+            _cache[message] = extended
+            
+            return extended
+    
+    extended = _parse_extended(message)
+    
+    with _cache_lock:
+        _cache[message] = extended
+        
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last = False)
+    
+    return extended
+
+
+def _parse_extended(message):
+    """
+    Parse "~&" blob without cache.
+    """
+    
+    if not message.startswith("~&"):
+        raise ValueError("not extended message")
+    
+    # Closing "~" is not part of arguments
+    end = len(message) - 1
+    
+    category, offset = _b85(message, 2, end)
+    instance, offset = _b85(message, offset, end)
+    
+    args = []
+    
+    while offset < end:
+        arg_type = message[offset]
+        offset = offset + 1
+        
+        try:
+            if arg_type == "s":
+                if end <= offset:
+                    break
+                
+                # Length includes length byte itself
+                length = max(ord(message[offset]), 1)
+                
+                args.append(message[offset + 1:min(offset + length, end)])
+                
+                offset = offset + length
+            elif arg_type == "i" or arg_type == "u":
+                number, offset = _b85(message, offset, end)
+                
+                args.append(number)
+            elif arg_type == "R":
+                reference_category, offset = _b85(message, offset, end)
+                reference_instance, offset = _b85(message, offset, end)
+                
+                args.append((reference_category, reference_instance,))
+            elif arg_type == "l":
+                if end < offset + 4:
+                    break
+                
+                args.append((NOTICE_CATEGORY, struct.unpack_from(">I", message, offset)[0],))
+                
+                offset = offset + 4
+        except ValueError:
+            break
+    
+    return (category, instance, tuple(args),)
+
+
+def parse_notice(message):
+    """
+    Parse chat notice arguments.
+    """
+    
+    args = []
+    
+    offset = 0
+    end = len(message)
+    
+    while offset < end:
+        arg_type = message[offset]
+        offset = offset + 1
+        
+        if arg_type == "S":
+            string, offset = String.unpack_from(message, offset)
+            args.append(string)
+        elif arg_type == "I":
+            number, offset = Integer.unpack_from(message, offset)
+            args.append(number)
+    
+    return tuple(args)
+
+
+class Templates(object):
+    """
+    Text templates of extended messages.
+    
+    Templates are printf style strings given by add() or loaded on demand
+    by loader(category, instance) returning text or None, for example from
+    game text database. Every template is compiled once and kept by
+    (category, instance).
+    """
+    
+    SPEC = re.compile(r"%(?:%|[-+ #0]*\d*(?:\.\d+)?([diouxXeEfFgGcrs]))")
+    
+    def __init__(self, loader = None):
+        self.loader = loader
+        
+        self.texts = {}
+        self.compiled = {}
+    
+    def __len__(self):
+        return len(self.compiled)
+    
+    def add(self, category, instance, text):
+        """
+        Add template text.
+        """
+        
+        self.texts[(category, instance)] = text
+        self.compiled.pop((category, instance), None)
+    
+    def compile(self, text):
+        """
+        Compile template text to (format, number of arguments). Unknown
+        specifications are kept as literal text.
+        """
+        
+        parts = []
+        count = 0
+        
+        last = 0
+        
+        for match in self.SPEC.finditer(text):
+            parts.append(text[last:match.start()].replace("%", "%%"))
+            parts.append(match.group())
+            
+            if match.group(1):
+                count = count + 1
+            
+            last = match.end()
+        
+        parts.append(text[last:].replace("%", "%%"))
+        
+        return "".join(parts), count
+    
+    def get(self, category, instance):
+        """
+        Get compiled template (format, number of arguments) or None.
+        """
+        
+        key = (category, instance)
+        
+        try:
+            return self.compiled[key]
+        except KeyError:
+            pass
+        
+        text = self.texts.get(key)
+        
+        if text is None and self.loader is not None:
+            text = self.loader(category, instance)
+        
+        template = self.compiled[key] = self.compile(text) if text is not None else None
+        
+        return template
+    
+    def render(self, category, instance, args = ()):
+        """
+        Render template with arguments, references are rendered
+        recursively. Returns None for unknown templates.
+        """
+        
+        template = self.get(category, instance)
+        
+        if template is None:
+            return None
+        
+        format, count = template
+        
+        values = []
+        
+        for arg in args:
+            if isinstance(arg, tuple):
+                text = self.render(arg[0], arg[1])
+                arg = text if text is not None else "%d:%d" % arg
+            
+            values.append(arg)
+        
+        # Tolerate templates not matching arguments
+        if len(values) != count:
+            values = (values + [""] * count)[:count]
+        
+        try:
+            return format % tuple(values)
+        except (TypeError, ValueError):
+            return format.replace("%%", "%")
+    
+    def render_packet(self, packet):
+        """
+        Render extended message packet, AOSP_CHANNEL_MESSAGE or
+        AOSP_CHAT_NOTICE. Returns None if packet is not extended message or
+        template is unknown.
+        """
+        
+        if packet.category is None:
+            return None
+        
+        return self.render(packet.category, packet.instance, packet.args)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Precomputed login keypairs.
+"""
+
+
+import threading
+
+from collections import deque
+
+from aochat import DH_Y, _generate_keypair
+
+
+class KeyPool(object):
+    """
+    Pool of Diffie-Hellman keypairs precomputed by background thread.
+    
+    Worker fills pool up to size whenever it drops to threshold, so
+    Chat(keys = pool) does not spend two modular exponentiations on login.
+    get() falls back to computing keypair in place when pool is empty.
+    Every keypair is used once.
+    """
+    
+    def __init__(self, size = 16, threshold = 4, public_key = DH_Y):
+        if not 0 <= threshold < size:
+            raise ValueError("threshold must be between 0 and size")
+        
+        self.size = size
+        self.threshold = threshold
+        self.public_key = public_key
+        
+        self.keypairs = deque()
+        self.hits = 0
+        self.misses = 0
+        
+        self.condition = threading.Condition()
+        self.closed = False
+        
+        self.worker = threading.Thread(target = self.run, name = "KeyPool")
+        self.worker.daemon = True
+        self.worker.start()
+    
+    def __len__(self):
+        return len(self.keypairs)
+    
+    def get(self):
+        """
+        Get unused keypair (dhX, dhK).
+        """
+        
+        with self.condition:
+            try:
+                keypair = self.keypairs.popleft()
+            except IndexError:
+                keypair = None
+            
+            if len(self.keypairs) <= self.threshold:
+                self.condition.notify()
+        
+        if keypair is None:
+            self.misses += 1
+            
+            return _generate_keypair(self.public_key)
+        
+        self.hits += 1
+        
+        return keypair
+    
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.closed and len(self.keypairs) > self.threshold:
+                    self.condition.wait()
+                
+                if self.closed:
+                    return
+                
+                count = self.size - len(self.keypairs)
+            
+            for i in range(count):
+                keypair = _generate_keypair(self.public_key)
+                
+                with self.condition:
+                    if self.closed:
+                        return
+                    
+                    self.keypairs.append(keypair)
+    
+    def close(self):
+        """
+        Stop worker thread.
+        """
+        
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        
+        self.worker.join()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Chat metrics.
+"""
+
+
+import bisect
+
+
+# Upper bounds of latency buckets in seconds
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class Histogram(object):
+    """
+    Histogram of observed values with fixed buckets.
+    """
+    
+    def __init__(self, bounds = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def cumulative(self):
+        """
+        Get list of (upper bound, count of values up to bound).
+        """
+        
+        total = 0
+        result = []
+        
+        for bound, count in zip(self.bounds + (float("inf"),), self.buckets):
+            total += count
+            result.append((bound, total,))
+        
+        return result
+    
+    def stats(self):
+        return {
+            "count": self.count,
+            "sum":   self.sum,
+            "avg":   self.sum / self.count if self.count else 0.0,
+        }
+
+
+class Metrics(object):
+    """
+    Counters and latency histograms of one or more <Chat>s.
+    
+    Chat(metrics = Metrics()) counts packets in and out by type, bytes,
+    decode errors and times socket reads, packet decoding, handlers with
+    callback and socket writes. Chats without metrics only test for None.
+    Read results as dictionary by stats() or in Prometheus text format by
+    exposition().
+    """
+    
+    HISTOGRAMS = ("read", "decode", "callback", "send")
+    
+    def __init__(self, prefix = "aochat", bounds = LATENCY_BUCKETS):
+        self.prefix = prefix
+        
+        self.packets_in = {}
+        self.packets_out = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.decode_errors = 0
+        
+        self.histograms = dict(map(lambda name: (name, Histogram(bounds),), self.HISTOGRAMS))
+    
+    def received(self, size, seconds):
+        self.bytes_in += size
+        self.histograms["read"].observe(seconds)
+    
+    def packet_in(self, packet_type):
+        self.packets_in[packet_type] = self.packets_in.get(packet_type, 0) + 1
+    
+    def decoded(self, packet_type, seconds):
+        self.packets_in[packet_type] = self.packets_in.get(packet_type, 0) + 1
+        self.histograms["decode"].observe(seconds)
+    
+    def decode_error(self, packet_type):
+        self.packets_in[packet_type] = self.packets_in.get(packet_type, 0) + 1
+        self.decode_errors += 1
+    
+    def handled(self, seconds):
+        self.histograms["callback"].observe(seconds)
+    
+    def packet_out(self, packet_type):
+        self.packets_out[packet_type] = self.packets_out.get(packet_type, 0) + 1
+    
+    def sent(self, size, seconds):
+        self.bytes_out += size
+        self.histograms["send"].observe(seconds)
+    
+    def stats(self):
+        """
+        Get metrics as dictionary.
+        """
+        
+        return {
+            "packets_in":    dict(self.packets_in),
+            "packets_out":   dict(self.packets_out),
+            "bytes_in":      self.bytes_in,
+            "bytes_out":     self.bytes_out,
+            "decode_errors": self.decode_errors,
+            "latency":       dict(map(lambda (name, histogram): (name, histogram.stats(),), self.histograms.items())),
+        }
+    
+    def collect(self):
+        """
+        Get list of samples (name, labels, value) in Prometheus naming.
+        """
+        
+        prefix = self.prefix
+        samples = []
+        
+        for packet_type, count in sorted(self.packets_in.items()):
+            samples.append(("%s_packets_received_total" % prefix, {"type": str(packet_type)}, count,))
+        
+        for packet_type, count in sorted(self.packets_out.items()):
+            samples.append(("%s_packets_sent_total" % prefix, {"type": str(packet_type)}, count,))
+        
+        samples.append(("%s_bytes_received_total" % prefix, {}, self.bytes_in,))
+        samples.append(("%s_bytes_sent_total" % prefix, {}, self.bytes_out,))
+        samples.append(("%s_decode_errors_total" % prefix, {}, self.decode_errors,))
+        
+        for name in self.HISTOGRAMS:
+            histogram = self.histograms[name]
+            
+            for bound, count in histogram.cumulative():
+                samples.append(("%s_%s_seconds_bucket" % (prefix, name,), {"le": "+Inf" if bound == float("inf") else repr(bound)}, count,))
+            
+            samples.append(("%s_%s_seconds_sum" % (prefix, name,), {}, histogram.sum,))
+            samples.append(("%s_%s_seconds_count" % (prefix, name,), {}, histogram.count,))
+        
+        return samples
+    
+    def exposition(self):
+        """
+        Get metrics in Prometheus text exposition format.
+        """
+        
+        histograms = set(map(lambda name: "%s_%s_seconds" % (self.prefix, name,), self.HISTOGRAMS))
+        families = set()
+        
+        lines = []
+        
+        for name, labels, value in self.collect():
+            family = name
+            
+            for suffix in ("_bucket", "_sum", "_count"):
+                if name.endswith(suffix) and name[:-len(suffix)] in histograms:
+                    family = name[:-len(suffix)]
+            
+            # Samples of family follow its type
+            if family not in families:
+                families.add(family)
+                lines.append("# TYPE %s %s" % (family, "histogram" if family in histograms else "counter",))
+            
+            if labels:
+                name = "%s{%s}" % (name, ",".join(map(lambda item: '%s="%s"' % item, sorted(labels.items()))))
+            
+            lines.append("%s %s" % (name, value,))
+        
+        return "\n".join(lines) + "\n"
@@ -11,8 +11,10 @@ AOFL_* - Flags
 """
 
 
-import struct
+from operator import itemgetter
 
+from aochat.codec import Codec
+from aochat.extended import NOTICE_CATEGORY, parse_extended, parse_notice
 from aochat.types import *
 
 
@@ -59,30 +61,85 @@ AOFL_CHAT_COMMAND            = Integer(0x00000001)
 ### BASE PACKET CLASSES ########################################################
 
 
+class lazy(object):
+    """
+    Attribute computed on first access and stored in instance dictionary.
+    """
+    
+    def __init__(self, function):
+        self.function = function
+        self.__doc__ = function.__doc__
+    
+    def __get__(self, instance, Class):
+        if instance is None:
+            return self
+        
+        value = instance.__dict__[self.function.__name__] = self.function(instance)
+        
+        return value
+
+
+class PacketType(type):
+    """
+    Packet metaclass making field properties and compiling codec of fields.
+    """
+    
+    def __new__(Meta, name, bases, attrs):
+        # Fields are read from tuple items on access
+        for index, (field, Type) in enumerate(attrs.get("fields", ())):
+            attrs.setdefault(field, property(itemgetter(index)))
+        
+        # Packets keep no instance dictionary unless they have lazy attributes
+        if not filter(lambda value: isinstance(value, lazy), attrs.values()):
+            attrs.setdefault("__slots__", ())
+        
+        return type.__new__(Meta, name, bases, attrs)
+    
+    def __init__(Class, name, bases, attrs):
+        type.__init__(Class, name, bases, attrs)
+        
+        Class.codec = Codec(map(lambda field: field[1], Class.fields))
+
+
 class Packet(tuple):
     """
     Anarchy Online chat packet.
     """
     
+    __metaclass__ = PacketType
+    
+    fields = ()
+    
+    type = None
+    
     def __new__(Class, packet_type, args):
-        self = tuple.__new__(Class, args)
-        
-        self.type = packet_type
+        if packet_type != Class.type:
+            raise ValueError("packet type mismatch")
         
-        return self
+        return tuple.__new__(Class, args)
     
     def pack(self):
         """
         Pack to binary data.
         """
         
-        data = "".join(map(lambda arg: arg.pack(), self))
-        data = struct.pack(">2H", self.type, len(data)) + data
-        
-        return data
+        return self.codec.pack(self.type, self)
     
     def __repr__(self):
         return "<Packet %d [%s]>" % (self.type, ", ".join(map(repr, self)) or "no data")
+    
+    def __reduce__(self):
+        # Constructors of subclasses take other arguments, lazy attributes
+        # already computed go along
+        return (_restore_packet, (self.__class__, tuple(self),), getattr(self, "__dict__", None) or None)
+
+
+def _restore_packet(Class, args):
+    """
+    Make unpickled packet.
+    """
+    
+    return Packet.__new__(Class, Class.type, args)
 
 
 class ServerPacket(Packet):
@@ -90,14 +147,8 @@ class ServerPacket(Packet):
     Server to client Anarchy Online chat packet.
     """
     
-    def __new__(Class, packet_type, types, data):
-        args = []
-        
-        for item_type in types:
-            arg, data = item_type.unpack(data)
-            args.append(arg)
-        
-        return Packet.__new__(Class, packet_type, args)
+    def __new__(Class, data):
+        return Packet.__new__(Class, Class.type, Class.codec.unpack(data))
 
 
 class ClientPacket(Packet):
@@ -121,11 +172,9 @@ class AOSP_SEED(ServerPacket):
     
     type = 0
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_SEED.type, (String,), data)
-    
-    def __init__(self, data):
-        self.server_key = self[0]
+    fields = (
+        ("server_key", String),
+    )
 
 
 class AOSP_LOGIN_OK(ServerPacket):
@@ -137,8 +186,7 @@ class AOSP_LOGIN_OK(ServerPacket):
     
     type = 5
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_LOGIN_OK.type, (), data)
+    fields = ()
 
 
 class AOSP_AUTH_ERROR(ServerPacket):
@@ -150,11 +198,9 @@ class AOSP_AUTH_ERROR(ServerPacket):
     
     type = 6
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_AUTH_ERROR.type, (String,), data)
-    
-    def __init__(self, data):
-        self.message = self[0]
+    fields = (
+        ("message", String),
+    )
 
 
 class AOSP_CHARACTERS_LIST(ServerPacket):
@@ -171,22 +217,16 @@ class AOSP_CHARACTERS_LIST(ServerPacket):
     
     type = 7
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_CHARACTERS_LIST.type, (TupleOfIntegers, TupleOfStrings, TupleOfIntegers, TupleOfIntegers,), data)
+    fields = (
+        ("characters_id",     TupleOfIntegers),
+        ("characters_name",   TupleOfStrings),
+        ("characters_level",  TupleOfIntegers),
+        ("characters_online", TupleOfIntegers),
+    )
     
-    def __init__(self, data):
-        self.characters_id = self[0]
-        self.characters_name = self[1]
-        self.characters_level = self[2]
-        self.characters_online = self[3]
-        
-        characters = []
-        
-        for i in range(len(self[0])):
-            character = Character(self[0][i], self[1][i], self[2][i], self[3][i])
-            characters.append(character)
-        
-        self.characters = tuple(characters)
+    @lazy
+    def characters(self):
+        return tuple(map(Character, *self))
 
 
 class AOSP_CHARACTER_NAME(ServerPacket):
@@ -199,12 +239,10 @@ class AOSP_CHARACTER_NAME(ServerPacket):
     
     type = 20
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_CHARACTER_NAME.type, (Integer, String,), data)
-    
-    def __init__(self, data):
-        self.character_id = self[0]
-        self.character_name = self[1]
+    fields = (
+        ("character_id",   Integer),
+        ("character_name", String),
+    )
 
 
 class AOSP_CHARACTER_LOOKUP(ServerPacket):
@@ -217,12 +255,10 @@ class AOSP_CHARACTER_LOOKUP(ServerPacket):
     
     type = 21
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_CHARACTER_LOOKUP.type, (Integer, String,), data)
-    
-    def __init__(self, data):
-        self.character_id = self[0]
-        self.character_name = self[1]
+    fields = (
+        ("character_id",   Integer),
+        ("character_name", String),
+    )
 
 
 class AOSP_PRIVATE_MESSAGE(ServerPacket):
@@ -236,13 +272,11 @@ class AOSP_PRIVATE_MESSAGE(ServerPacket):
     
     type = 30
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_PRIVATE_MESSAGE.type, (Integer, String, String,), data)
-    
-    def __init__(self, data):
-        self.character_id = self[0]
-        self.message = self[1]
-        self.unknown = self[2]
+    fields = (
+        ("character_id", Integer),
+        ("message",      String),
+        ("unknown",      String),
+    )
 
 
 class AOSP_VICINITY_MESSAGE(ServerPacket):
@@ -256,13 +290,11 @@ class AOSP_VICINITY_MESSAGE(ServerPacket):
     
     type = 34
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_VICINITY_MESSAGE.type, (Integer, String, String,), data)
-    
-    def __init__(self, data):
-        self.character_id = self[0]
-        self.message = self[1]
-        self.flags = self[2]
+    fields = (
+        ("character_id", Integer),
+        ("message",      String),
+        ("flags",        String),
+    )
 
 
 class AOSP_BROADCAST_MESSAGE(ServerPacket):
@@ -276,13 +308,11 @@ class AOSP_BROADCAST_MESSAGE(ServerPacket):
     
     type = 35
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_BROADCAST_MESSAGE.type, (String, String, String,), data)
-    
-    def __init__(self, data):
-        self.character_name = self[0]
-        self.message = self[1]
-        self.flags = self[2]
+    fields = (
+        ("character_name", String),
+        ("message",        String),
+        ("flags",          String),
+    )
 
 
 class AOSP_SYSTEM_MESSAGE(ServerPacket):
@@ -294,11 +324,9 @@ class AOSP_SYSTEM_MESSAGE(ServerPacket):
     
     type = 36
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_SYSTEM_MESSAGE.type, (String,), data)
-    
-    def __init__(self, data):
-        self.message = self[0]
+    fields = (
+        ("message", String),
+    )
 
 
 class AOSP_CHAT_NOTICE(ServerPacket):
@@ -313,29 +341,18 @@ class AOSP_CHAT_NOTICE(ServerPacket):
     
     type = 37
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_CHAT_NOTICE.type, (Integer, Integer, Integer, String,), data)
-    
-    def __init__(self, data):
-        self.character_id = self[0]
-        self.unknown = self[1]
-        self.category = 20000
-        self.instance = self[2]
-        self.message = self[3]
-        self.args = []
-        
-        # Extended message
-        data = self.message
-        
-        while data:
-            arg_type, data = data[0], data[1:]
-            
-            if arg_type == "S":
-                string, data = String.unpack(data)
-                self.args.append(string)
-            elif arg_type == "I":
-                number, data = Integer.unpack(data)
-                self.args.append(number)
+    fields = (
+        ("character_id", Integer),
+        ("unknown",      Integer),
+        ("instance",     Integer),
+        ("message",      String),
+    )
+    
+    category = NOTICE_CATEGORY
+    
+    @lazy
+    def args(self):
+        return parse_notice(self.message)
 
 
 class AOSP_FRIEND_UPDATE(ServerPacket):
@@ -349,13 +366,11 @@ class AOSP_FRIEND_UPDATE(ServerPacket):
     
     type = 40
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_FRIEND_UPDATE.type, (Integer, Integer, String,), data)
-    
-    def __init__(self, data):
-        self.character_id = self[0]
-        self.online = self[1]
-        self.flags = self[2]
+    fields = (
+        ("character_id", Integer),
+        ("online",       Integer),
+        ("flags",        String),
+    )
 
 
 class AOSP_FRIEND_REMOVE(ServerPacket):
@@ -367,11 +382,9 @@ class AOSP_FRIEND_REMOVE(ServerPacket):
     
     type = 41
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_FRIEND_REMOVE.type, (Integer,), data)
-    
-    def __init__(self, data):
-        self.character_id = self[0]
+    fields = (
+        ("character_id", Integer),
+    )
 
 
 class AOSP_PRIVATE_CHANNEL_INVITE(ServerPacket):
@@ -383,11 +396,9 @@ class AOSP_PRIVATE_CHANNEL_INVITE(ServerPacket):
     
     type = 50
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_PRIVATE_CHANNEL_INVITE.type, (Integer,), data)
-    
-    def __init__(self, data):
-        self.channel_id = self[0]
+    fields = (
+        ("channel_id", Integer),
+    )
 
 
 class AOSP_PRIVATE_CHANNEL_KICK(ServerPacket):
@@ -399,11 +410,9 @@ class AOSP_PRIVATE_CHANNEL_KICK(ServerPacket):
     
     type = 51
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_PRIVATE_CHANNEL_KICK.type, (Integer,), data)
-    
-    def __init__(self, data):
-        self.channel_id = self[0]
+    fields = (
+        ("channel_id", Integer),
+    )
 
 
 class AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN(ServerPacket):
@@ -416,12 +425,10 @@ class AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN(ServerPacket):
     
     type = 55
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN.type, (Integer, Integer,), data)
-    
-    def __init__(self, data):
-        self.channel_id = self[0]
-        self.character_id = self[1]
+    fields = (
+        ("channel_id",   Integer),
+        ("character_id", Integer),
+    )
 
 
 class AOSP_PRIVATE_CHANNEL_CHARACTER_LEAVE(ServerPacket):
@@ -434,12 +441,10 @@ class AOSP_PRIVATE_CHANNEL_CHARACTER_LEAVE(ServerPacket):
     
     type = 56
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_PRIVATE_CHANNEL_CHARACTER_LEAVE.type, (Integer, Integer,), data)
-    
-    def __init__(self, data):
-        self.channel_id = self[0]
-        self.character_id = self[1]
+    fields = (
+        ("channel_id",   Integer),
+        ("character_id", Integer),
+    )
 
 
 class AOSP_PRIVATE_CHANNEL_MESSAGE(ServerPacket):
@@ -454,14 +459,12 @@ class AOSP_PRIVATE_CHANNEL_MESSAGE(ServerPacket):
     
     type = 57
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_PRIVATE_CHANNEL_MESSAGE.type, (Integer, Integer, String, String,), data)
-    
-    def __init__(self, data):
-        self.channel_id = self[0]
-        self.character_id = self[1]
-        self.message = self[2]
-        self.unknown = self[3]
+    fields = (
+        ("channel_id",   Integer),
+        ("character_id", Integer),
+        ("message",      String),
+        ("unknown",      String),
+    )
 
 
 class AOSP_CHANNEL_JOIN(ServerPacket):
@@ -476,14 +479,12 @@ class AOSP_CHANNEL_JOIN(ServerPacket):
     
     type = 60
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_CHANNEL_JOIN.type, (ChannelID, String, Integer, String,), data)
-    
-    def __init__(self, data):
-        self.channel_id = self[0]
-        self.channel_name = self[1]
-        self.channel_status = self[2]
-        self.unknown = self[3]
+    fields = (
+        ("channel_id",     ChannelID),
+        ("channel_name",   String),
+        ("channel_status", Integer),
+        ("unknown",        String),
+    )
 
 
 class AOSP_CHANNEL_LEAVE(ServerPacket):
@@ -495,11 +496,9 @@ class AOSP_CHANNEL_LEAVE(ServerPacket):
     
     type = 61
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_CHANNEL_LEAVE.type, (ChannelID,), data)
-    
-    def __init__(self, data):
-        self.channel_id = self[0]
+    fields = (
+        ("channel_id", ChannelID),
+    )
 
 
 class AOSP_CHANNEL_MESSAGE(ServerPacket):
@@ -514,51 +513,24 @@ class AOSP_CHANNEL_MESSAGE(ServerPacket):
     
     type = 65
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_CHANNEL_MESSAGE.type, (ChannelID, Integer, String, String,), data)
-    
-    def __init__(self, data):
-        self.channel_id = self[0]
-        self.character_id = self[1]
-        self.message = self[2]
-        self.unknown = self[3]
-        self.category = None
-        self.instance = None
-        self.args = []
-        
+    fields = (
+        ("channel_id",   ChannelID),
+        ("character_id", Integer),
+        ("message",      String),
+        ("unknown",      String),
+    )
+    
+    category = property(lambda self: self.extended[0])
+    instance = property(lambda self: self.extended[1])
+    args = property(lambda self: self.extended[2])
+    
+    @lazy
+    def extended(self):
         # Extended message
         if self.character_id == 0L and self.message.startswith("~&"):
-            def b85g(string):
-                number = 0
-                
-                for i in range(5):
-                    number = number * 85 + ord(string[i]) - 33
-                
-                return number, string[5:]
-            
-            # Parse arguments
-            data = self.message[2:-1]
-            
-            self.category, data = b85g(data)
-            self.instance, data = b85g(data)
-            
-            while data:
-                arg_type, data = data[0], data[1:]
-                
-                if arg_type == "s":
-                    length = ord(data[0])
-                    string, data = data[1:length], data[length:]
-                    
-                    self.args.append(string)
-                elif arg_type in "iu":
-                    number, data = b85g(data)
-                    
-                    self.args.append(number)
-                elif arg_type == "R":
-                    category, data = b85g(data)
-                    instance, data = b85g(data)
-                    
-                    self.args.append((category, instance,))
+            return parse_extended(self.message)
+        
+        return None, None, ()
 
 
 class AOSP_PING(ServerPacket):
@@ -570,11 +542,9 @@ class AOSP_PING(ServerPacket):
     
     type = 100
     
-    def __new__(Class, data):
-        return ServerPacket.__new__(Class, AOSP_PING.type, (String,), data)
-    
-    def __init__(self, data):
-        self.unknown = self[0]
+    fields = (
+        ("unknown", String),
+    )
 
 
 ### PACKETS TO SERVER ##########################################################
@@ -592,14 +562,15 @@ class AOCP_SEED(ClientPacket):
     
     type = 0
     
+    fields = (
+        ("unknown",      Integer),
+        ("character_id", Integer),
+        ("username",     String),
+        ("login_key",    String),
+    )
+    
     def __new__(Class, character_id, username, login_key, unknown = AOFL_AUTH):
         return ClientPacket.__new__(Class, AOCP_SEED.type, (Integer(unknown), Integer(character_id), String(username), String(login_key),))
-    
-    def __init__(self, character_id, username, login_key, unknown = AOFL_AUTH):
-        self.unknown = self[0]
-        self.character_id = self[1]
-        self.username = self[2]
-        self.login_key = self[3]
 
 
 class AOCP_AUTH(ClientPacket):
@@ -613,13 +584,14 @@ class AOCP_AUTH(ClientPacket):
     
     type = 2
     
+    fields = (
+        ("unknown",   Integer),
+        ("username",  String),
+        ("login_key", String),
+    )
+    
     def __new__(Class, username, login_key, unknown = AOFL_AUTH):
         return ClientPacket.__new__(Class, AOCP_AUTH.type, (Integer(unknown), String(username), String(login_key),))
-    
-    def __init__(self, username, login_key, unknown = AOFL_AUTH):
-        self.unknown = self[0]
-        self.username = self[1]
-        self.login_key = self[2]
 
 
 class AOCP_LOGIN(ClientPacket):
@@ -631,11 +603,12 @@ class AOCP_LOGIN(ClientPacket):
     
     type = 3
     
+    fields = (
+        ("character_id", Integer),
+    )
+    
     def __new__(Class, character_id):
         return ClientPacket.__new__(Class, AOCP_LOGIN.type, (Integer(character_id),))
-    
-    def __init__(self, character_id):
-        self.character_id = self[0]
 
 
 class AOCP_CHARACTER_LOOKUP(ClientPacket):
@@ -647,11 +620,12 @@ class AOCP_CHARACTER_LOOKUP(ClientPacket):
     
     type = 21
     
+    fields = (
+        ("character_name", String),
+    )
+    
     def __new__(Class, character_name):
         return ClientPacket.__new__(Class, AOCP_CHARACTER_LOOKUP.type, (String(character_name),))
-    
-    def __init__(self, character_name):
-        self.character_name = self[0]
 
 
 class AOCP_PRIVATE_MESSAGE(ClientPacket):
@@ -665,13 +639,14 @@ class AOCP_PRIVATE_MESSAGE(ClientPacket):
     
     type = 30
     
+    fields = (
+        ("character_id", Integer),
+        ("message",      String),
+        ("unknown",      String),
+    )
+    
     def __new__(Class, character_id, message, unknown):
         return ClientPacket.__new__(Class, AOCP_PRIVATE_MESSAGE.type, (Integer(character_id), String(message), String(unknown),))
-    
-    def __init__(self, character_id, message, unknown):
-        self.character_id = self[0]
-        self.message = self[1]
-        self.unknown = self[2]
 
 
 class AOCP_FRIEND_UPDATE(ClientPacket):
@@ -684,12 +659,13 @@ class AOCP_FRIEND_UPDATE(ClientPacket):
     
     type = 40
     
+    fields = (
+        ("character_id", Integer),
+        ("flags",        String),
+    )
+    
     def __new__(Class, character_id, flags):
         return ClientPacket.__new__(Class, AOCP_FRIEND_UPDATE.type, (Integer(character_id), String(flags),))
-    
-    def __init__(self, character_id, flags):
-        self.character_id = self[0]
-        self.flags = self[1]
 
 
 class AOCP_FRIEND_REMOVE(ClientPacket):
@@ -701,11 +677,12 @@ class AOCP_FRIEND_REMOVE(ClientPacket):
     
     type = 41
     
+    fields = (
+        ("character_id", Integer),
+    )
+    
     def __new__(Class, character_id):
         return ClientPacket.__new__(Class, AOCP_FRIEND_REMOVE.type, (Integer(character_id),))
-    
-    def __init__(self, character_id):
-        self.character_id = self[0]
 
 
 class AOCP_PRIVATE_CHANNEL_INVITE(ClientPacket):
@@ -717,11 +694,12 @@ class AOCP_PRIVATE_CHANNEL_INVITE(ClientPacket):
     
     type = 50
     
+    fields = (
+        ("character_id", Integer),
+    )
+    
     def __new__(Class, character_id):
         return ClientPacket.__new__(Class, AOCP_PRIVATE_CHANNEL_INVITE.type, (Integer(character_id),))
-    
-    def __init__(self, character_id):
-        self.character_id = self[0]
 
 
 class AOCP_PRIVATE_CHANNEL_KICK(ClientPacket):
@@ -733,11 +711,12 @@ class AOCP_PRIVATE_CHANNEL_KICK(ClientPacket):
     
     type = 51
     
+    fields = (
+        ("character_id", Integer),
+    )
+    
     def __new__(Class, character_id):
         return ClientPacket.__new__(Class, AOCP_PRIVATE_CHANNEL_KICK.type, (Integer(character_id),))
-    
-    def __init__(self, character_id):
-        self.character_id = self[0]
 
 
 class AOCP_PRIVATE_CHANNEL_JOIN(ClientPacket):
@@ -749,11 +728,12 @@ class AOCP_PRIVATE_CHANNEL_JOIN(ClientPacket):
     
     type = 52
     
-    def __new__(Class, owner_character_id):
-        return ClientPacket.__new__(Class, AOCP_PRIVATE_CHANNEL_JOIN.type, (Integer(channel_id),))
+    fields = (
+        ("channel_id", Integer),
+    )
     
-    def __init__(self, owner_character_id):
-        self.channel_id = self[0]
+    def __new__(Class, channel_id):
+        return ClientPacket.__new__(Class, AOCP_PRIVATE_CHANNEL_JOIN.type, (Integer(channel_id),))
 
 
 class AOCP_PRIVATE_CHANNEL_LEAVE(ClientPacket):
@@ -765,11 +745,12 @@ class AOCP_PRIVATE_CHANNEL_LEAVE(ClientPacket):
     
     type = 53
     
+    fields = (
+        ("channel_id", Integer),
+    )
+    
     def __new__(Class, channel_id):
         return ClientPacket.__new__(Class, AOCP_PRIVATE_CHANNEL_LEAVE.type, (Integer(channel_id),))
-    
-    def __init__(self, channel_id):
-        self.channel_id = self[0]
 
 
 #class AOCP_PRIVATE_CHANNEL_KICKALL(ClientPacket):
@@ -799,13 +780,14 @@ class AOCP_PRIVATE_CHANNEL_MESSAGE(ClientPacket):
     
     type = 57
     
+    fields = (
+        ("channel_id", Integer),
+        ("message",    String),
+        ("unknown",    String),
+    )
+    
     def __new__(Class, channel_id, message, unknown = AOFL_PRIVATE_CHANNEL_MESSAGE):
         return ClientPacket.__new__(Class, AOCP_PRIVATE_CHANNEL_MESSAGE.type, (Integer(channel_id), String(message), String(unknown),))
-    
-    def __init__(self, channel_id, message, unknown = AOFL_PRIVATE_CHANNEL_MESSAGE):
-        self.channel_id = self[0]
-        self.message = self[1]
-        self.unknown = self[2]
 
 
 class AOCP_CHANNEL_MESSAGE(ClientPacket):
@@ -819,13 +801,14 @@ class AOCP_CHANNEL_MESSAGE(ClientPacket):
     
     type = 65
     
+    fields = (
+        ("channel_id", ChannelID),
+        ("message",    String),
+        ("unknown",    String),
+    )
+    
     def __new__(Class, channel_id, message, unknown = AOFL_CHANNEL_MESSAGE):
         return ClientPacket.__new__(Class, AOCP_CHANNEL_MESSAGE.type, (ChannelID(channel_id), String(message), String(unknown),))
-    
-    def __init__(self, channel_id, message, unknown = AOFL_CHANNEL_MESSAGE):
-        self.channel_id = self[0]
-        self.message = self[1]
-        self.unknown = self[2]
 
 
 class AOCP_PING(ClientPacket):
@@ -837,11 +820,12 @@ class AOCP_PING(ClientPacket):
     
     type = 100
     
+    fields = (
+        ("unknown", String),
+    )
+    
     def __new__(Class, unknown = AOFL_PING):
         return ClientPacket.__new__(Class, AOCP_PING.type, (String(unknown),))
-    
-    def __init__(self, unknown = AOFL_PING):
-        self.unknown = self[0]
 
 
 class AOCP_CHAT_COMMAND(ClientPacket):
@@ -854,9 +838,10 @@ class AOCP_CHAT_COMMAND(ClientPacket):
     
     type = 120
     
+    fields = (
+        ("command", TupleOfStrings),
+        ("unknown", Integer),
+    )
+    
     def __new__(Class, command, unknown = AOFL_CHAT_COMMAND):
         return ClientPacket.__new__(Class, AOCP_CHAT_COMMAND.type, (TupleOfStrings(command), Integer(unknown),))
-    
-    def __init__(self, command, unknown = AOFL_CHAT_COMMAND):
-        self.command = self[0]
-        self.unknown = self[1]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Packets decoded by process pool.
+"""
+
+
+import multiprocessing
+
+from aochat import SERVER_PACKETS, UnexpectedPacket
+from aochat.packets import *
+
+
+def decode_batch(frames):
+    """
+    Decode list of frames (type, data). Extended messages are parsed too.
+    Frames of unknown type or invalid data become UnexpectedPacket.
+    
+    Packets decoded this way bypass Chat.subscriptions, so chat does not
+    update its name cache, buddies and channels from them.
+    """
+    
+    packets = []
+    
+    for packet_type, data in frames:
+        try:
+            packet = SERVER_PACKETS[packet_type](data)
+            
+            if packet_type == AOSP_CHANNEL_MESSAGE.type or packet_type == AOSP_CHAT_NOTICE.type:
+                packet.args
+        except (KeyError, ValueError):
+            packets.append(UnexpectedPacket(packet_type, data))
+            continue
+        
+        packets.append(packet)
+    
+    return packets
+
+
+def batches(chat, size = 500, timeout = None, ping_interval = 60000):
+    """
+    Read frames of chat in batches of received ones, at most size each.
+    Waits only for first frame of batch, see Chat.iter_frames() for
+    timeout and ping_interval.
+    """
+    
+    for frame in chat.iter_frames(timeout, ping_interval):
+        batch = [frame]
+        
+        while len(batch) < size and chat.has_packet():
+            batch.append(chat.wait_frame())
+        
+        yield batch
+
+
+class ParallelDecoder(object):
+    """
+    Pool of processes decoding batches of frames.
+    
+    Batches are decoded concurrently and returned in order. Frames are
+    (type, data) as returned by Chat.wait_frame(); see decode_batch() for
+    chat state not updated from them. It pays off only for
+    floods of large packets, small batches cost more in pickling than
+    decoding.
+    """
+    
+    def __init__(self, processes = None):
+        self.pool = multiprocessing.Pool(processes)
+    
+    def decode(self, frames, size = 500):
+        """
+        Decode list of frames. Returns list of packets.
+        """
+        
+        result = []
+        
+        for packets in self.pool.imap(decode_batch, map(lambda i: frames[i:i + size], range(0, len(frames), size))):
+            result.extend(packets)
+        
+        return result
+    
+    def imap(self, batches):
+        """
+        Decode iterable of frame batches, for example batches(chat). Yields
+        packets in order. Pool reads batches in its own thread, so close()
+        waits until they end, see timeout of batches().
+        """
+        
+        for packets in self.pool.imap(decode_batch, batches):
+            for packet in packets:
+                yield packet
+    
+    def close(self):
+        """
+        Stop processes.
+        """
+        
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Many chat sessions driven by one poller.
+"""
+
+
+import heapq
+import select
+import time
+
+from aochat import ConnectionLost, UnexpectedPacket
+
+
+class ChatPool(object):
+    """
+    Single epoll reactor for many logged in <Chat>s.
+    """
+    
+    def __init__(self, ping_interval = 60000):
+        self.ping_interval = ping_interval
+        
+        self.poll = select.epoll()
+        
+        self.chats = {}
+        self.callbacks = {}
+        self.activity = {}
+        self.deadlines = {}
+        self.pings = []
+        self.buffered = set()
+    
+    def __len__(self):
+        return len(self.chats)
+    
+    def add(self, chat, callback = None):
+        """
+        Register chat with callback(chat, packet). Without callback only
+        handlers subscribed on chat receive packets. Packets already
+        received by chat, for example along with login, are handled first
+        by start().
+        """
+        
+        fileno = chat.socket.fileno()
+        
+        if fileno in self.chats:
+            raise ValueError("chat is already registered")
+        
+        self.chats[fileno] = chat
+        self.callbacks[fileno] = callback
+        self.activity[fileno] = time.time()
+        self.schedule(fileno)
+        
+        # Socket is not readable for data already in buffer
+        if chat.has_packet():
+            self.buffered.add(fileno)
+        
+        self.poll.register(fileno, select.EPOLLIN)
+    
+    def remove(self, chat):
+        """
+        Unregister chat.
+        """
+        
+        fileno = chat.socket.fileno()
+        
+        if self.chats.get(fileno) is not chat:
+            raise ValueError("chat is not registered")
+        
+        self.poll.unregister(fileno)
+        
+        del self.chats[fileno]
+        del self.callbacks[fileno]
+        del self.activity[fileno]
+        del self.deadlines[fileno]
+        
+        self.buffered.discard(fileno)
+    
+    def handle_disconnect(self, chat, error):
+        """
+        Chat connection is lost. Chat is already unregistered.
+        """
+        
+        pass
+    
+    def dispatch(self, fileno):
+        """
+        Read data of one chat and run callback for every received packet.
+        """
+        
+        chat = self.chats[fileno]
+        
+        try:
+            chat.receive()
+        except ConnectionLost, error:
+            self.remove(chat)
+            self.handle_disconnect(chat, error)
+            return
+        
+        self.activity[fileno] = time.time()
+        
+        self.handle(fileno)
+    
+    def handle(self, fileno):
+        """
+        Run callback for every packet already received by chat.
+        """
+        
+        chat = self.chats[fileno]
+        callback = self.callbacks[fileno]
+        
+        while chat.has_packet():
+            try:
+                chat.handle_packet(callback)
+            except UnexpectedPacket, (type, data):
+                print "Unexpected packet %s: %s" % (type, repr(data))
+                continue
+            except ConnectionLost, error:
+                # Sends of handlers fail like reads, other errors propagate
+                if self.chats.get(fileno) is chat:
+                    self.remove(chat)
+                
+                self.handle_disconnect(chat, error)
+                return
+            
+            # Callback may remove chat from pool
+            if self.chats.get(fileno) is not chat:
+                return
+    
+    def schedule(self, fileno):
+        """
+        Schedule next ping check of chat.
+        """
+        
+        deadline = self.activity[fileno] + self.ping_interval / 1000.0
+        
+        self.deadlines[fileno] = deadline
+        
+        heapq.heappush(self.pings, (deadline, fileno,))
+    
+    def ping(self, now):
+        """
+        Ping chats which were idle for ping interval.
+        """
+        
+        interval = self.ping_interval / 1000.0
+        
+        while self.pings and self.pings[0][0] <= now:
+            deadline, fileno = heapq.heappop(self.pings)
+            
+            # Skip entries of removed or rescheduled chats
+            if self.deadlines.get(fileno) != deadline:
+                continue
+            
+            if self.activity[fileno] + interval <= now:
+                chat = self.chats[fileno]
+                
+                try:
+                    chat.ping()
+                except ConnectionLost, error:
+                    self.remove(chat)
+                    self.handle_disconnect(chat, error)
+                    continue
+                
+                self.activity[fileno] = now
+            
+            self.schedule(fileno)
+    
+    def flush(self):
+        """
+        Send packets queued by chats. Returns seconds until next queued
+        packet may be sent or None.
+        """
+        
+        timeout = None
+        
+        # Callbacks of one chat may send through others, so every queue is
+        # checked
+        for fileno, chat in self.chats.items():
+            # Callbacks of flushed chats may remove others
+            if self.chats.get(fileno) is not chat or not chat.bulk_queue:
+                continue
+            
+            try:
+                chat.flush()
+            except ConnectionLost, error:
+                self.remove(chat)
+                self.handle_disconnect(chat, error)
+                continue
+            
+            delay = chat.delay()
+            
+            if delay is not None and (timeout is None or delay < timeout):
+                timeout = delay
+        
+        return timeout
+    
+    def start(self):
+        """
+        Start all chats. Returns when no chats left. Chats losing
+        connection are removed, other ChatErrors, also raised by callbacks,
+        are not handled.
+        """
+        
+        while self.chats:
+            try:
+                while self.buffered:
+                    fileno = self.buffered.pop()
+                    
+                    if fileno in self.chats:
+                        self.handle(fileno)
+                
+                timeout = self.flush()
+                
+                # Callbacks may remove last chat
+                if not self.chats:
+                    break
+                
+                if self.pings:
+                    deadline = max(self.pings[0][0] - time.time(), 0)
+                    
+                    if timeout is None or deadline < timeout:
+                        timeout = deadline
+                
+                if timeout is None:
+                    timeout = -1
+                
+                for fileno, event in self.poll.poll(timeout):
+                    if fileno not in self.chats:
+                        continue
+                    
+                    if event & select.EPOLLIN:
+                        self.dispatch(fileno)
+                    elif event & (select.EPOLLHUP | select.EPOLLERR):
+                        chat = self.chats[fileno]
+                        
+                        self.remove(chat)
+                        self.handle_disconnect(chat, ConnectionLost("Connection broken."))
+                
+                self.ping(time.time())
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Local chat server for tests.
+"""
+
+
+import binascii
+import random
+import socket
+import SocketServer
+import struct
+import threading
+import time
+
+from aochat import DH_G, DH_N, CLIENT_PACKETS, _decrypt
+from aochat.buffer import PacketBuffer
+from aochat.packets import *
+
+
+def make_packet(Class, *args):
+    """
+    Make server packet from field values, the way server would send it.
+    """
+    
+    return Packet.__new__(Class, Class.type, map(lambda ((name, Type), value): Type(value), zip(Class.fields, args)))
+
+
+class MockHandler(SocketServer.BaseRequestHandler):
+    """
+    One client connection of <MockServer>.
+    """
+    
+    def setup(self):
+        self.buffer = PacketBuffer()
+        self.lock = threading.Lock()
+        self.character = None
+        
+        self.server.connect(self)
+    
+    def finish(self):
+        self.server.disconnect(self)
+    
+    def send(self, *packets):
+        """
+        Send packets (or packed data) in one write.
+        """
+        
+        data = "".join(map(lambda packet: packet if isinstance(packet, str) else packet.pack(), packets))
+        
+        with self.lock:
+            self.request.sendall(data)
+    
+    def read_packet(self):
+        """
+        Read next client packet or None when client disconnects.
+        """
+        
+        while not self.buffer.has_packet():
+            try:
+                if self.buffer.recv(self.request) == 0:
+                    return None
+            except socket.error:
+                return None
+        
+        packet_type, data = self.buffer.packet()
+        
+        try:
+            Class = CLIENT_PACKETS[packet_type]
+        except KeyError:
+            return (packet_type, str(data),)
+        
+        return Packet.__new__(Class, Class.type, Class.codec.unpack(data))
+    
+    def handle(self):
+        server = self.server
+        
+        # Greeting
+        server_key = binascii.hexlify(struct.pack(">Q", random.randrange(0, 2 ** 64)))
+        
+        self.send(make_packet(AOSP_SEED, server_key))
+        
+        # Authentication
+        packet = self.read_packet()
+        
+        if not isinstance(packet, AOCP_AUTH) or not server.authenticate(packet.username, packet.login_key, server_key):
+            self.send(make_packet(AOSP_AUTH_ERROR, "Invalid username or password."))
+            return
+        
+        characters = server.characters
+        
+        self.send(make_packet(AOSP_CHARACTERS_LIST, *map(lambda field: map(lambda character: character[field], characters), range(4))))
+        
+        # Login
+        packet = self.read_packet()
+        
+        if not isinstance(packet, AOCP_LOGIN) or packet.character_id not in map(lambda character: character[0], characters):
+            self.send(make_packet(AOSP_AUTH_ERROR, "Invalid character."))
+            return
+        
+        self.character = packet.character_id
+        
+        self.send(make_packet(AOSP_LOGIN_OK), *map(lambda channel: make_packet(AOSP_CHANNEL_JOIN, *(channel + ("",))), server.channels))
+        
+        # Scripted packets go concurrently with answers
+        streamer = threading.Thread(target = self.stream, name = "MockHandler")
+        streamer.daemon = True
+        streamer.start()
+        
+        while True:
+            packet = self.read_packet()
+            
+            if packet is None:
+                return
+            
+            server.record(packet)
+            
+            answer = server.answer(self, packet)
+            
+            if answer:
+                try:
+                    self.send(*answer)
+                except socket.error:
+                    return
+    
+    def stream(self):
+        """
+        Send script of server at its rate.
+        """
+        
+        script = self.server.script
+        
+        if callable(script):
+            script = script(self)
+        
+        rate = self.server.rate
+        
+        started = time.time()
+        
+        batch = []
+        
+        try:
+            for index, packet in enumerate(script):
+                batch.append(packet)
+                
+                # Packets already due are sent together
+                if rate:
+                    delay = started + (index + 1) / float(rate) - time.time()
+                    
+                    if delay <= 0 and len(batch) < 1000:
+                        continue
+                    
+                    self.send(*batch)
+                    batch = []
+                    
+                    if delay > 0:
+                        time.sleep(delay)
+                elif len(batch) >= 1000:
+                    self.send(*batch)
+                    batch = []
+            
+            if batch:
+                self.send(*batch)
+        except socket.error:
+            pass
+
+
+class MockServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """
+    Local chat server speaking chat protocol to <Chat>s for tests.
+    
+    Every connection gets seed, authenticates by accounts (username ->
+    password) and logs in one of characters (id, name, level, online).
+    Login key is checked against own Diffie-Hellman key, so clients must
+    use KeyPool(public_key = server.public_key), or validate = False.
+    After login server joins client to channels (id, name, status),
+    answers pings, name lookups and buddy updates, echoes channel messages
+    and sends script, iterable of packets or packed data, or callable(handler)
+    returning one, at rate packets per second (as fast as possible if
+    rate is None). Received client packets are kept in received.
+    """
+    
+    allow_reuse_address = True
+    daemon_threads = True
+    
+    def __init__(self, address = ("127.0.0.1", 0), accounts = None, characters = None, script = (), rate = None, validate = True, channels = ()):
+        SocketServer.TCPServer.__init__(self, address, MockHandler)
+        
+        self.accounts = accounts if accounts is not None else {"username": "password"}
+        self.characters = characters if characters is not None else [(1, "Character", 220, 1)]
+        self.script = script
+        self.rate = rate
+        self.validate = validate
+        self.channels = list(channels)
+        
+        # Names known to lookups and buddies reported online
+        self.names = dict(map(lambda character: (character[1].lower(), character[0],), self.characters))
+        self.online = set()
+        
+        self.private_key = random.randrange(0, 2 ** 256)
+        self.public_key = pow(DH_G, self.private_key, DH_N)
+        
+        self.received = []
+        self.received_lock = threading.Lock()
+        
+        self.handlers = set()
+        self.handlers_lock = threading.Lock()
+        
+        self.thread = None
+    
+    @property
+    def host(self):
+        return self.server_address[0]
+    
+    @property
+    def port(self):
+        return self.server_address[1]
+    
+    def start(self):
+        """
+        Serve in background thread.
+        """
+        
+        self.thread = threading.Thread(target = self.serve_forever, name = "MockServer")
+        self.thread.daemon = True
+        self.thread.start()
+    
+    def stop(self):
+        """
+        Stop serving and close server socket.
+        """
+        
+        self.shutdown()
+        self.server_close()
+    
+    def connect(self, handler):
+        with self.handlers_lock:
+            self.handlers.add(handler)
+    
+    def disconnect(self, handler = None):
+        """
+        Close client connection of handler, all if None.
+        """
+        
+        with self.handlers_lock:
+            handlers = [handler] if handler is not None else list(self.handlers)
+            
+            self.handlers.difference_update(handlers)
+        
+        for handler in handlers:
+            try:
+                handler.request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+    
+    def authenticate(self, username, login_key, server_key):
+        """
+        Check login key made by _generate_login_key().
+        """
+        
+        if username not in self.accounts:
+            return False
+        
+        if not self.validate:
+            return True
+        
+        try:
+            dhX, crypted = login_key.split("-", 1)
+            
+            dhK = int(("%x" % pow(int(dhX, 16), self.private_key, DH_N))[:32], 16)
+            
+            plain = _decrypt(dhK, crypted)
+            length = struct.unpack_from(">I", plain, 8)[0]
+        except (ValueError, TypeError, struct.error):
+            return False
+        
+        return plain[12:12 + length] == "%s|%s|%s" % (username, server_key, self.accounts[username])
+    
+    def record(self, packet):
+        with self.received_lock:
+            self.received.append(packet)
+    
+    def answer(self, handler, packet):
+        """
+        Get list of packets answering client packet.
+        """
+        
+        if isinstance(packet, AOCP_PING):
+            return [make_packet(AOSP_PING, packet.unknown)]
+        
+        if isinstance(packet, AOCP_CHARACTER_LOOKUP):
+            character_id = self.names.get(packet.character_name.lower(), AOFL_CHARACTER_UNKNOWN)
+            
+            return [make_packet(AOSP_CHARACTER_LOOKUP, character_id, packet.character_name)]
+        
+        if isinstance(packet, AOCP_FRIEND_UPDATE):
+            return [make_packet(AOSP_FRIEND_UPDATE, packet.character_id, int(packet.character_id in self.online), packet.flags)]
+        
+        if isinstance(packet, AOCP_FRIEND_REMOVE):
+            return [make_packet(AOSP_FRIEND_REMOVE, packet.character_id)]
+        
+        if isinstance(packet, AOCP_CHANNEL_MESSAGE):
+            return [make_packet(AOSP_CHANNEL_MESSAGE, packet.channel_id, handler.character, packet.message, packet.unknown)]
+        
+        return None
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Consistent hashing placement of buddies.
+"""
+
+
+import bisect
+import hashlib
+
+
+class ConsistentHash(object):
+    """
+    Buddy placement of <BuddyGroup> by consistent hashing.
+    
+    Every chat owns replicas points on hash ring and buddy goes to the chat
+    owning next point after buddy hash, or following ones while their
+    buddy lists are full. Adding or removing chat moves only buddies of
+    ring arcs which changed owner.
+    """
+    
+    sticky = False
+    
+    def __init__(self, replicas = 100):
+        self.replicas = replicas
+        
+        self.ring = []
+        self.points = []
+    
+    @staticmethod
+    def hash(key):
+        return int(hashlib.md5(key).hexdigest()[:8], 16)
+    
+    def update(self, chats):
+        """
+        Build hash ring of chats.
+        """
+        
+        self.ring = []
+        
+        for chat in chats:
+            for replica in range(self.replicas):
+                self.ring.append((self.hash("%d-%d" % (chat.character.id, replica,)), chat,))
+        
+        self.ring.sort(key = lambda (point, chat): point)
+        self.points = map(lambda (point, chat): point, self.ring)
+    
+    def locate(self, character_id, chats, counts):
+        """
+        Get chat for buddy having free space by counts or None.
+        """
+        
+        index = bisect.bisect(self.points, self.hash(str(character_id)))
+        seen = set()
+        
+        for i in range(len(self.ring)):
+            chat = self.ring[(index + i) % len(self.ring)][1]
+            
+            if chat in seen:
+                continue
+            
+            if counts[chat] < chat.buddies.limit:
+                return chat
+            
+            seen.add(chat)
+            
+            if len(seen) == len(chats):
+                break
+        
+        return None
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Python implementation of Anarchy Online chat protocol.
+Outgoing packets queue and rate limiter.
+"""
+
+
+import heapq
+import itertools
+import time
+
+
+PRIORITY_HIGH   = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW    = 2
+
+# Packets per second of bulk sends by chats without send queue, and how
+# many of them are saved up to go in one write
+BULK_RATE  = 5
+BULK_BURST = 10
+
+
+class TokenBucket(object):
+    """
+    Token bucket: rate tokens per second, up to burst tokens saved.
+    """
+    
+    def __init__(self, rate, burst = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = float(burst)
+        self.time = time.time()
+    
+    def update(self, now):
+        """
+        Add tokens earned since last update.
+        """
+        
+        if now > self.time:
+            self.tokens = min(self.burst, self.tokens + (now - self.time) * self.rate)
+            self.time = now
+    
+    def consume(self, now, count = 1):
+        """
+        Take count tokens if available.
+        """
+        
+        self.update(now)
+        
+        if self.tokens < count:
+            return False
+        
+        self.tokens -= count
+        
+        return True
+    
+    def delay(self, now, count = 1):
+        """
+        Get seconds until count tokens are available.
+        """
+        
+        self.update(now)
+        
+        return max(count - self.tokens, 0) / self.rate
+
+
+class SendQueue(object):
+    """
+    Priority queue of packed packets released by optional token bucket.
+    
+    Packets of the same priority are sent in order. With chunk above 1
+    rate limited packets are held until chunk of them (or all queued, if
+    fewer) may be taken together, so they go in large writes. Callbacks of
+    taken packets are returned by done(), to be called once packets are
+    written.
+    Queue depth and time spent by packets in queue are collected for
+    stats().
+    """
+    
+    def __init__(self, rate = None, burst = 1, chunk = 1):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.chunk = max(min(chunk, burst), 1)
+        
+        self.heap = []
+        self.counter = itertools.count()
+        self.callbacks = []
+        
+        self.sent = 0
+        self.max_depth = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+    
+    def __len__(self):
+        return len(self.heap)
+    
+    def put(self, data, priority = PRIORITY_NORMAL, callback = None):
+        """
+        Queue packed packet.
+        """
+        
+        heapq.heappush(self.heap, (priority, next(self.counter), time.time(), data, callback,))
+        
+        self.max_depth = max(self.max_depth, len(self.heap))
+    
+    def take(self, now = None):
+        """
+        Get list of packed packets allowed to be sent now.
+        """
+        
+        if now is None:
+            now = time.time()
+        
+        items = []
+        
+        if self.bucket and self.bucket.delay(now, self.__chunk()) > 0:
+            return items
+        
+        while self.heap:
+            if self.bucket and not self.bucket.consume(now):
+                break
+            
+            priority, number, queued, data, callback = heapq.heappop(self.heap)
+            
+            wait = max(now - queued, 0)
+            
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+            
+            items.append(data)
+            
+            if callback is not None:
+                self.callbacks.append(callback)
+        
+        self.sent += len(items)
+        
+        return items
+    
+    def done(self):
+        """
+        Get callbacks of packets taken since last call.
+        """
+        
+        callbacks, self.callbacks = self.callbacks, []
+        
+        return callbacks
+    
+    def delay(self, now = None):
+        """
+        Get seconds until next packet may be sent or None if queue is empty.
+        """
+        
+        if not self.heap:
+            return None
+        
+        if not self.bucket:
+            return 0.0
+        
+        return self.bucket.delay(time.time() if now is None else now, self.__chunk())
+    
+    def __chunk(self):
+        return min(self.chunk, len(self.heap))
+    
+    def stats(self):
+        """
+        Get queue statistics.
+        """
+        
+        return {
+            "depth":     len(self.heap),
+            "max_depth": self.max_depth,
+            "sent":      self.sent,
+            "wait_time": self.wait_time,
+            "max_wait":  self.max_wait,
+            "avg_wait":  self.wait_time / self.sent if self.sent else 0.0,
+        }
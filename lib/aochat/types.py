@@ -15,6 +15,8 @@ class Integer(long):
     Unsigned 32-bit integer.
     """
     
+    format = "I"
+    
     def __new__(Class, x = 0L, base = 10):
         return long.__new__(Class, str(x), base)
     
@@ -35,10 +37,35 @@ class Integer(long):
         Unpack from binary data.
         """
         
-        if len(data) < 4:
+        item, offset = Class.unpack_from(data)
+        
+        return item, data[offset:]
+    
+    @classmethod
+    def unpack_from(Class, data, offset = 0):
+        """
+        Unpack from binary data starting at offset.
+        """
+        
+        if len(data) < offset + 4:
             raise ValueError("too short data")
         
-        return Class(struct.unpack(">I", data[:4])[0]), data[4:]
+        return Class(struct.unpack_from(">I", data, offset)[0]), offset + 4
+    
+    @classmethod
+    def from_struct(Class, value):
+        """
+        Make from values unpacked by format.
+        """
+        
+        return long.__new__(Class, value)
+    
+    def to_struct(self):
+        """
+        Get values to pack by format.
+        """
+        
+        return (self,)
 
 
 class String(str):
@@ -46,6 +73,8 @@ class String(str):
     16-bit length string.
     """
     
+    format = None
+    
     def __new__(Class, x = ""):
         return str.__new__(Class, x or "")
     
@@ -66,12 +95,26 @@ class String(str):
         Unpack from binary data.
         """
         
-        if len(data) < 2:
+        item, offset = Class.unpack_from(data)
+        
+        return item, data[offset:]
+    
+    @classmethod
+    def unpack_from(Class, data, offset = 0):
+        """
+        Unpack from binary data starting at offset.
+        """
+        
+        if len(data) < offset + 2:
             raise ValueError("too short data")
         
-        length, data = struct.unpack(">H", data[:2])[0], data[2:]
+        length = struct.unpack_from(">H", data, offset)[0]
+        offset = offset + 2
         
-        return Class(data[:length]), data[length:]
+        if len(data) < offset + length:
+            raise ValueError("too short data")
+        
+        return str.__new__(Class, data[offset:offset + length]), offset + length
 
 
 class ChannelID(long):
@@ -79,6 +122,8 @@ class ChannelID(long):
     Channel ID.
     """
     
+    format = "BI"
+    
     def __new__(Class, x = 0L, base = 10):
         return long.__new__(Class, str(x), base)
     
@@ -99,12 +144,37 @@ class ChannelID(long):
         Unpack from binary data.
         """
         
-        if len(data) < 5:
+        item, offset = Class.unpack_from(data)
+        
+        return item, data[offset:]
+    
+    @classmethod
+    def unpack_from(Class, data, offset = 0):
+        """
+        Unpack from binary data starting at offset.
+        """
+        
+        if len(data) < offset + 5:
             raise ValueError("too short data")
         
-        a, b = struct.unpack(">BI", data[:5])
+        a, b = struct.unpack_from(">BI", data, offset)
+        
+        return Class((a << 32) + b), offset + 5
+    
+    @classmethod
+    def from_struct(Class, a, b):
+        """
+        Make from values unpacked by format.
+        """
         
-        return Class((a << 32) + b), data[5:]
+        return long.__new__(Class, (a << 32) + b)
+    
+    def to_struct(self):
+        """
+        Get values to pack by format.
+        """
+        
+        return (self >> 32, self & 0xFFFFFFFFL,)
 
 
 class Tuple(tuple):
@@ -112,6 +182,8 @@ class Tuple(tuple):
     Tuple of <Type>s.
     """
     
+    format = None
+    
     def __new__(Class, Type, sequence = ()):
         return tuple.__new__(Class, map(Type, sequence))
     
@@ -132,18 +204,29 @@ class Tuple(tuple):
         Unpack from binary data.
         """
         
-        if len(data) < 2:
+        items, offset = Tuple.unpack_from(Type, data)
+        
+        return items, data[offset:]
+    
+    @staticmethod
+    def unpack_from(Type, data, offset = 0):
+        """
+        Unpack from binary data starting at offset.
+        """
+        
+        if len(data) < offset + 2:
             raise ValueError("too short data")
         
-        count, data = struct.unpack(">H", data[:2])[0], data[2:]
+        count = struct.unpack_from(">H", data, offset)[0]
+        offset = offset + 2
         
         items = []
         
         for i in range(count):
-            item, data = Type.unpack(data)
+            item, offset = Type.unpack_from(data, offset)
             items.append(item)
         
-        return items, data
+        return items, offset
 
 
 class TupleOfIntegers(Tuple):
@@ -163,6 +246,16 @@ class TupleOfIntegers(Tuple):
         items, data = Tuple.unpack(Integer, data)
         
         return Class(items), data
+    
+    @classmethod
+    def unpack_from(Class, data, offset = 0):
+        """
+        Unpack from binary data starting at offset.
+        """
+        
+        items, offset = Tuple.unpack_from(Integer, data, offset)
+        
+        return Class(items), offset
 
 
 class TupleOfStrings(Tuple):
@@ -182,6 +275,16 @@ class TupleOfStrings(Tuple):
         items, data = Tuple.unpack(String, data)
         
         return Class(items), data
+    
+    @classmethod
+    def unpack_from(Class, data, offset = 0):
+        """
+        Unpack from binary data starting at offset.
+        """
+        
+        items, offset = Tuple.unpack_from(String, data, offset)
+        
+        return Class(items), offset
 
 
 class Character(object):
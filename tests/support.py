@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+
+"""
+Shared helpers for aochat tests.
+"""
+
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lib"))
+
+from aochat import Chat
+from aochat.buddies import BuddyList
+from aochat.keys import KeyPool
+from aochat.types import Character
+
+
+class RecordingChat(object):
+    """
+    Stand-in for <Chat> remembering sent packets. Subscribed handlers are
+    run by feed().
+    """
+    
+    def __init__(self, character_id = 1):
+        self.character = Character(character_id, "Character%d" % character_id, 1, 1)
+        self.buddies = BuddyList()
+        self.subscriptions = {}
+        self.sent = []
+    
+    def subscribe(self, types, handler):
+        for Type in types:
+            self.subscriptions.setdefault(Type.type, []).append(handler)
+    
+    def unsubscribe(self, types, handler):
+        for Type in types:
+            self.subscriptions[Type.type].remove(handler)
+    
+    def feed(self, packet):
+        self.buddies.handle_packet(self, packet)
+        
+        for handler in tuple(self.subscriptions.get(packet.type, ())):
+            handler(self, packet)
+    
+    def send_packet(self, packet, Expect = None, Error = None, priority = None):
+        self.sent.append(packet)
+    
+    def send_bulk(self, packets, callback = None):
+        self.sent.extend(packets)
+
+
+def login(server, character_id = None, **kwargs):
+    """
+    Connect chat to MockServer and log in its first character.
+    """
+    
+    keys = KeyPool(size = 1, threshold = 0, public_key = server.public_key)
+    
+    try:
+        chat = Chat("username", "password", server.host, server.port, keys = keys, **kwargs)
+    finally:
+        keys.close()
+    
+    chat.login(character_id if character_id is not None else server.characters[0][0])
+    
+    return chat
+
+
+def wait(condition, timeout = 5.0):
+    """
+    Wait until condition() is true, for things done by server threads.
+    """
+    
+    stop = time.time() + timeout
+    
+    while not condition():
+        if time.time() > stop:
+            raise AssertionError("Timed out")
+        
+        time.sleep(0.01)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+
+import asyncore
+import time
+import unittest
+
+import support
+
+from aochat.async_chat import AsyncChat, STATE_CHAT
+from aochat.keys import KeyPool
+from aochat.packets import *
+from aochat.server import MockServer, make_packet
+
+
+class RecordingAsyncChat(AsyncChat):
+    """
+    Chat logging in the first character and keeping received packets.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        AsyncChat.__init__(self, *args, **kwargs)
+        
+        self.received = []
+        self.errors = []
+    
+    def handle_characters(self, characters):
+        self.login(characters[0].id)
+    
+    def handle_packet(self, packet):
+        self.received.append(packet)
+        
+        if isinstance(packet, AOSP_PRIVATE_MESSAGE):
+            self.send_private_message(packet.character_id, "pong")
+    
+    def handle_auth_error(self, message):
+        self.errors.append(message)
+        self.close()
+
+
+class AsyncChatTest(unittest.TestCase):
+    COUNT = 50
+    
+    def setUp(self):
+        script = map(lambda i: make_packet(AOSP_PRIVATE_MESSAGE, 100 + i, "ping %d" % i, "\0"), range(self.COUNT))
+        
+        self.server = MockServer(
+            characters = [(11, "Bob", 200, 1), (12, "Alice", 10, 0)],
+            script = script,
+        )
+        self.server.start()
+        
+        self.keys = KeyPool(size = 2, threshold = 0, public_key = self.server.public_key)
+        self.map = {}
+    
+    def tearDown(self):
+        for chat in self.map.values():
+            chat.close()
+        
+        self.keys.close()
+        self.server.stop()
+    
+    def run_until(self, condition, timeout = 5.0):
+        """
+        Run event loop until condition() is true.
+        """
+        
+        deadline = time.time() + timeout
+        
+        while not condition():
+            self.assertTrue(time.time() < deadline, "timed out")
+            
+            asyncore.loop(0.05, map = self.map, count = 1)
+    
+    def test_login_and_receive(self):
+        chat = RecordingAsyncChat("username", "password", self.server.host, self.server.port, map = self.map, keys = self.keys)
+        
+        self.run_until(lambda: len(chat.received) == self.COUNT)
+        
+        self.assertEqual(chat.state, STATE_CHAT)
+        self.assertEqual(chat.character.id, 11)
+        self.assertEqual(map(lambda packet: packet.character_id, chat.received), range(100, 100 + self.COUNT))
+        
+        self.run_until(lambda: len(self.server.received) == self.COUNT)
+        
+        self.assertEqual(map(lambda packet: (packet.character_id, packet.message,), self.server.received), map(lambda i: (100 + i, "pong",), range(self.COUNT)))
+    
+    def test_chats_share_loop(self):
+        chats = map(lambda i: RecordingAsyncChat("username", "password", self.server.host, self.server.port, map = self.map, keys = self.keys), range(2))
+        
+        self.run_until(lambda: all(map(lambda chat: len(chat.received) == self.COUNT, chats)))
+        self.run_until(lambda: len(self.server.received) == 2 * self.COUNT)
+    
+    def test_bad_password(self):
+        chat = RecordingAsyncChat("username", "wrong", self.server.host, self.server.port, map = self.map, keys = self.keys)
+        
+        self.run_until(lambda: chat.errors)
+        
+        self.assertEqual(chat.errors, ["Invalid username or password."])
+        self.assertEqual(chat.character, None)
+        self.assertEqual(self.map, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+
+import unittest
+
+from support import RecordingChat, login, wait
+
+from aochat.buddies import BuddyGroup
+from aochat.packets import *
+from aochat.server import MockServer, make_packet
+from aochat.sharding import ConsistentHash
+
+
+class BuddyGroupTest(unittest.TestCase):
+    def make_chats(self, count, limit):
+        chats = map(RecordingChat, range(100, 100 + count))
+        
+        for chat in chats:
+            chat.buddies.limit = limit
+        
+        return chats
+    
+    def test_least_used(self):
+        chats = self.make_chats(2, 3)
+        group = BuddyGroup(chats)
+        
+        self.assertEqual(group.add_many(range(1, 8)), [7])
+        self.assertEqual(map(lambda chat: len(chat.buddies), chats), [3, 3])
+        
+        # Rejected buddy is placed when there is room
+        chat = RecordingChat(102)
+        group.add_chat(chat)
+        
+        self.assertEqual(len(chat.buddies), 1)
+        self.assertEqual(len(group), 7)
+        self.assertEqual(group.find(7), chat)
+    
+    def test_consistent_hash_moves_few(self):
+        chats = self.make_chats(4, 1000)
+        group = BuddyGroup(chats[:3], ConsistentHash())
+        
+        self.assertEqual(group.add_many(range(1000, 2000)), [])
+        
+        before = dict(group.owners)
+        group.add_chat(chats[3])
+        moved = filter(lambda character_id: before[character_id] is not group.owners[character_id], before)
+        
+        self.assertEqual(set(map(lambda character_id: group.owners[character_id], moved)), set([chats[3]]))
+        self.assertEqual(len(moved), len(chats[3].buddies))
+        
+        before = dict(group.owners)
+        group.remove_chat(chats[0])
+        moved = filter(lambda character_id: before[character_id] is not group.owners[character_id], before)
+        
+        self.assertEqual(set(map(lambda character_id: before[character_id], moved)), set([chats[0]]))
+        self.assertEqual(len(chats[0].buddies), 0)
+        self.assertEqual(len(group), 1000)
+    
+    def test_online_merged(self):
+        chats = self.make_chats(2, 1000)
+        group = BuddyGroup(chats, ConsistentHash())
+        events = []
+        group.subscribe(lambda chat, character_id, online: events.append((character_id, online,)))
+        group.add(5)
+        
+        owner = group.find(5)
+        other = chats[1 - chats.index(owner)]
+        
+        owner.feed(make_packet(AOSP_FRIEND_UPDATE, 5, 1, "\x01"))
+        other.feed(make_packet(AOSP_FRIEND_UPDATE, 5, 0, "\x01"))
+        owner.feed(make_packet(AOSP_FRIEND_UPDATE, 5, 1, "\x01"))
+        owner.feed(make_packet(AOSP_FRIEND_UPDATE, 5, 0, "\x01"))
+        
+        self.assertEqual(events, [(5, True,), (5, False,)])
+        self.assertEqual(group.get_online(), [])
+
+
+
+class BuddyListTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer()
+        self.server.start()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def test_paced(self):
+        chat = login(self.server, bulk_rate = 1000, bulk_burst = 10)
+        chat.buddies.add_many(chat, range(100, 125))
+        
+        # Only one burst is written at once, rest waits for chat loop
+        self.assertEqual(len(chat.bulk_queue), 15)
+        
+        chat.buddies.restore(chat)
+        
+        self.assertEqual(len(chat.bulk_queue), 40)
+        self.assertTrue(chat.drain())
+        
+        received = lambda: filter(lambda packet: isinstance(packet, AOCP_FRIEND_UPDATE), self.server.received)
+        
+        wait(lambda: len(received()) == 50)
+        
+        self.assertEqual(map(lambda packet: packet.character_id, received()[:25]), range(100, 125))
+        
+        chat.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+
+import socket
+import unittest
+
+import support
+
+from aochat.buffer import HEADER, MIN_BUFFER_SIZE, PacketBuffer
+
+
+def frame(packet_type, body):
+    return HEADER.pack(packet_type, len(body)) + body
+
+
+class PacketBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.sender, self.receiver = socket.socketpair()
+    
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+    
+    def receive(self, buffer, data):
+        """
+        Send data through socket pair and receive all of it into buffer.
+        """
+        
+        self.sender.sendall(data)
+        
+        received = 0
+        
+        while received < len(data):
+            received += buffer.recv(self.receiver)
+    
+    def test_split_frame(self):
+        buffer = PacketBuffer()
+        data = frame(30, "hello world")
+        
+        self.receive(buffer, data[:9])
+        
+        self.assertFalse(buffer.has_packet())
+        self.assertEqual(buffer.peek(), None)
+        self.assertEqual(buffer.packet(), None)
+        self.assertEqual(len(buffer), 9)
+        
+        self.receive(buffer, data[9:] + frame(31, ""))
+        
+        self.assertEqual(buffer.peek(), 30)
+        self.assertEqual(map(lambda (packet_type, body): (packet_type, str(body)), buffer.packets()), [(30, "hello world"), (31, "")])
+        self.assertEqual(len(buffer), 0)
+    
+    def test_split_header(self):
+        buffer = PacketBuffer()
+        data = frame(30, "hello")
+        
+        for end in range(1, HEADER.size):
+            self.receive(buffer, data[end - 1:end])
+            
+            self.assertFalse(buffer.has_packet())
+            self.assertEqual(buffer.packet(), None)
+        
+        self.receive(buffer, data[HEADER.size - 1:])
+        
+        packet_type, body = buffer.packet()
+        
+        self.assertEqual((packet_type, str(body)), (30, "hello"))
+    
+    def test_compact_at_end(self):
+        buffer = PacketBuffer(MIN_BUFFER_SIZE)
+        first = frame(30, "a" * (MIN_BUFFER_SIZE - 10))
+        second = frame(31, "bcdefgh")
+        
+        # Second packet is cut at the end of buffer
+        buffer.feed(first + second[:6])
+        
+        self.assertEqual(buffer.end, len(buffer.data))
+        self.assertEqual(buffer.packet()[0], 30)
+        self.assertEqual(buffer.packet(), None)
+        
+        self.assertEqual(buffer.reserve(), len(buffer.data) - 6)
+        self.assertEqual((buffer.start, buffer.end,), (0, 6,))
+        
+        self.receive(buffer, second[6:])
+        
+        packet_type, body = buffer.packet()
+        
+        self.assertEqual((packet_type, str(body)), (31, "bcdefgh"))
+        
+        # Empty buffer starts over without copying
+        self.assertEqual(buffer.reserve(), len(buffer.data))
+        self.assertEqual((buffer.start, buffer.end,), (0, 0,))
+    
+    def test_compact_overlapping(self):
+        buffer = PacketBuffer(MIN_BUFFER_SIZE)
+        body = "".join(map(chr, range(256))) * 8
+        second = frame(30, body)
+        
+        # Unparsed data is longer than consumed one, so moved data overlaps
+        buffer.feed(frame(29, "x") + second[:1500])
+        buffer.packet()
+        
+        self.assertTrue(len(buffer) > buffer.start)
+        
+        buffer.reserve()
+        
+        self.assertEqual((buffer.start, buffer.end,), (0, 1500,))
+        self.assertEqual(str(buffer.data[:1500]), second[:1500])
+        
+        self.receive(buffer, second[1500:])
+        
+        packet_type, data = buffer.packet()
+        
+        self.assertEqual((packet_type, str(data)), (30, body))
+    
+    def test_longest_body(self):
+        buffer = PacketBuffer(MIN_BUFFER_SIZE)
+        body = "".join(map(chr, range(256))) * 256
+        
+        # Space of consumed packet is reused
+        buffer.feed(frame(29, "x"))
+        buffer.packet()
+        
+        self.receive(buffer, frame(30, body[:0xFFFF]))
+        
+        self.assertEqual(len(buffer), MIN_BUFFER_SIZE)
+        self.assertEqual(buffer.reserve(), 0)
+        
+        packet_type, data = buffer.packet()
+        
+        self.assertEqual(packet_type, 30)
+        self.assertEqual(str(data), body[:0xFFFF])
+    
+    def test_overflow(self):
+        buffer = PacketBuffer(MIN_BUFFER_SIZE)
+        
+        self.assertRaises(ValueError, buffer.feed, "x" * (MIN_BUFFER_SIZE + 1))
+        self.assertRaises(ValueError, PacketBuffer, MIN_BUFFER_SIZE - 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
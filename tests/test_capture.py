@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+from aochat import UnexpectedPacket
+from aochat.capture import MAGIC, RECORD, DIRECTION_IN, DIRECTION_OUT, CaptureReader, CaptureWriter, replay
+from aochat.packets import *
+from aochat.server import make_packet
+
+
+class CaptureTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "capture")
+        
+        self.incoming = [
+            make_packet(AOSP_PRIVATE_MESSAGE, 11, "Hello", "\0"),
+            make_packet(AOSP_LOGIN_OK),
+            make_packet(AOSP_CHANNEL_MESSAGE, 0x0300000001, 11, "Hi all", ""),
+        ]
+        self.outgoing = [
+            AOCP_PRIVATE_MESSAGE(11, "Hello to you", "\0"),
+            AOCP_PING("ping"),
+        ]
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def write(self):
+        writer = CaptureWriter(self.path)
+        
+        for index, packet in enumerate(self.incoming):
+            writer.write(DIRECTION_IN, packet.type, packet.pack()[4:], 1000.0 + index)
+        
+        # Frames of one write are split into records
+        writer.sent("".join(map(lambda packet: packet.pack(), self.outgoing)))
+        writer.received(999, "unknown")
+        writer.close()
+        
+        self.assertEqual(writer.count, len(self.incoming) + len(self.outgoing) + 1)
+    
+    def read(self):
+        reader = CaptureReader(self.path)
+        
+        try:
+            return map(lambda (timestamp, direction, packet_type, data): (timestamp, direction, packet_type, str(data),), reader)
+        finally:
+            reader.close()
+    
+    def test_round_trip(self):
+        self.write()
+        
+        records = self.read()
+        
+        self.assertEqual(map(lambda record: record[1:], records), map(lambda packet: (DIRECTION_IN, packet.type, packet.pack()[4:],), self.incoming) + map(lambda packet: (DIRECTION_OUT, packet.type, packet.pack()[4:],), self.outgoing) + [(DIRECTION_IN, 999, "unknown",)])
+        self.assertEqual(map(lambda record: record[0], records[:3]), [1000.0, 1001.0, 1002.0])
+        self.assertEqual(records[3][0], records[4][0])
+        
+        reader = CaptureReader(self.path)
+        
+        try:
+            incoming = map(lambda (timestamp, packet): packet, reader.packets())
+            outgoing = map(lambda (timestamp, packet): packet, reader.packets(DIRECTION_OUT))
+        finally:
+            reader.close()
+        
+        self.assertEqual(incoming[:-1], self.incoming)
+        self.assertEqual(map(type, incoming[:-1]), map(type, self.incoming))
+        self.assertTrue(isinstance(incoming[-1], UnexpectedPacket))
+        self.assertEqual(incoming[-1].args, (999, "unknown",))
+        self.assertEqual(outgoing, self.outgoing)
+        self.assertEqual(map(type, outgoing), map(type, self.outgoing))
+        
+        packets = []
+        
+        self.assertEqual(replay(self.path, packets.append, direction = DIRECTION_OUT), 2)
+        self.assertEqual(packets, self.outgoing)
+    
+    def test_append(self):
+        self.write()
+        self.write()
+        
+        with open(self.path, "rb") as file:
+            self.assertEqual(file.read().count(MAGIC), 1)
+        
+        self.assertEqual(len(self.read()), 2 * (len(self.incoming) + len(self.outgoing) + 1))
+    
+    def test_magic(self):
+        with open(self.path, "wb") as file:
+            file.write("AOCAP\x00\x02\n" + RECORD.pack(0, DIRECTION_IN, 1, 0))
+        
+        self.assertRaises(ValueError, CaptureReader, self.path)
+        
+        for data in ("", MAGIC[:-1]):
+            with open(self.path, "wb") as file:
+                file.write(data)
+            
+            self.assertRaises(ValueError, CaptureReader, self.path)
+        
+        with open(self.path, "wb") as file:
+            file.write(MAGIC)
+        
+        self.assertEqual(self.read(), [])
+    
+    def test_truncated(self):
+        self.write()
+        
+        size = os.path.getsize(self.path)
+        last = RECORD.size + len("unknown")
+        
+        # Cut in body and in header of the last record
+        for length in (size - 1, size - len("unknown"), size - last + RECORD.size - 1, size - last + 1):
+            shutil.copy(self.path, self.path + ".full")
+            
+            with open(self.path, "r+b") as file:
+                file.truncate(length)
+            
+            records = self.read()
+            
+            self.assertEqual(len(records), len(self.incoming) + len(self.outgoing))
+            self.assertEqual(records[-1][2], AOCP_PING.type)
+            
+            shutil.move(self.path + ".full", self.path)
+        
+        with open(self.path, "r+b") as file:
+            file.truncate(size - last)
+        
+        self.assertEqual(len(self.read()), len(self.incoming) + len(self.outgoing))
+
+
+if __name__ == "__main__":
+    unittest.main()
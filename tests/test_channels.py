@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+import unittest
+
+from support import RecordingChat, login, wait
+
+from aochat.channels import Channels, PrivateChannels
+from aochat.packets import *
+from aochat.server import MockServer, make_packet
+from aochat.throttle import BULK_RATE, SendQueue
+
+
+class PrivateChannelsTest(unittest.TestCase):
+    def setUp(self):
+        self.chat = RecordingChat(character_id = 1)
+        self.channels = PrivateChannels()
+    
+    def feed(self, Class, *args):
+        self.channels.handle_packet(self.chat, make_packet(Class, *args))
+    
+    def test_members(self):
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 1, 11)
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 1, 12)
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 1, 12)
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 2, 11)
+        
+        self.assertTrue(1 in self.channels)
+        self.assertTrue(self.channels.is_member(1, 11))
+        self.assertTrue(self.channels.is_member(2, 11))
+        self.assertFalse(self.channels.is_member(2, 12))
+        self.assertFalse(self.channels.is_member(3, 11))
+        self.assertEqual(self.channels.get_members(1), frozenset([11, 12]))
+        self.assertEqual(self.channels.get_members(3), frozenset())
+        
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_LEAVE, 1, 11)
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_LEAVE, 3, 11)
+        
+        self.assertFalse(self.channels.is_member(1, 11))
+        self.assertEqual(self.channels.get_members(1), frozenset([12]))
+        
+        # Empty channel is forgotten
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_LEAVE, 1, 12)
+        
+        self.assertFalse(1 in self.channels)
+        self.assertTrue(2 in self.channels)
+    
+    def test_invite_join_kick(self):
+        self.feed(AOSP_PRIVATE_CHANNEL_INVITE, 5)
+        
+        self.assertEqual(self.channels.invites, set([5]))
+        
+        self.channels.join(self.chat, 5)
+        
+        self.assertEqual(self.channels.invites, set())
+        self.assertEqual(self.channels.joined, set([5]))
+        self.assertEqual(map(lambda packet: (type(packet), packet.channel_id,), self.chat.sent), [(AOCP_PRIVATE_CHANNEL_JOIN, 5,)])
+        
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 5, 1)
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 5, 11)
+        
+        # Kicked from channel, its members are cleared
+        self.feed(AOSP_PRIVATE_CHANNEL_KICK, 5)
+        
+        self.assertFalse(5 in self.channels)
+        self.assertEqual(self.channels.get_members(5), frozenset())
+        self.assertEqual(self.channels.joined, set())
+    
+    def test_leave(self):
+        self.channels.join(self.chat, 5)
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 5, 11)
+        
+        self.channels.leave(self.chat, 5)
+        
+        self.assertFalse(5 in self.channels)
+        self.assertEqual(self.channels.joined, set())
+        self.assertEqual(type(self.chat.sent[-1]), AOCP_PRIVATE_CHANNEL_LEAVE)
+    
+    def test_restore(self):
+        self.channels.join(self.chat, 5)
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 5, 11)
+        self.chat.sent = []
+        
+        self.channels.restore(self.chat)
+        
+        self.assertFalse(5 in self.channels)
+        self.assertEqual(map(lambda packet: packet.channel_id, self.chat.sent), [5])
+    
+    def test_kick_all(self):
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 1, 12)
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 1, 11)
+        self.feed(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN, 2, 13)
+        
+        self.channels.kick_all(self.chat)
+        
+        self.assertEqual(map(lambda packet: (type(packet), packet.character_id,), self.chat.sent), [(AOCP_PRIVATE_CHANNEL_KICK, 11,), (AOCP_PRIVATE_CHANNEL_KICK, 12,)])
+
+
+class ChannelsTest(unittest.TestCase):
+    def setUp(self):
+        self.channels = Channels()
+    
+    def feed(self, Class, *args):
+        self.channels.handle_packet(None, make_packet(Class, *args))
+    
+    def test_join_leave(self):
+        self.feed(AOSP_CHANNEL_JOIN, 0x0300000001L, "Clan OOC", 0x8000, "")
+        
+        self.assertEqual(self.channels.get_id("clan ooc"), 0x0300000001L)
+        self.assertEqual(self.channels.get_name(0x0300000001L), "Clan OOC")
+        self.assertTrue("CLAN OOC" in self.channels)
+        
+        # Renamed channel
+        self.feed(AOSP_CHANNEL_JOIN, 0x0300000001L, "Clan Chat", 0x8000, "")
+        
+        self.assertEqual(self.channels.get_id("clan ooc"), None)
+        self.assertEqual(self.channels.get_id("clan chat"), 0x0300000001L)
+        
+        self.feed(AOSP_CHANNEL_LEAVE, 0x0300000001L)
+        
+        self.assertEqual(len(self.channels), 0)
+        self.assertEqual(self.channels.ids, {})
+    
+    def test_name_taken(self):
+        self.feed(AOSP_CHANNEL_JOIN, 0x0300000001L, "Clan OOC", 0x8000, "")
+        self.feed(AOSP_CHANNEL_JOIN, 0x0300000002L, "clan ooc", 0x8000, "")
+        
+        # Leaving old channel keeps name of new one
+        self.feed(AOSP_CHANNEL_LEAVE, 0x0300000001L)
+        
+        self.assertEqual(self.channels.get_id("Clan OOC"), 0x0300000002L)
+        
+        self.feed(AOSP_CHANNEL_JOIN, 0x0300000001L, "Clan OOC", 0x8000, "")
+        self.feed(AOSP_CHANNEL_JOIN, 0x0300000002L, "Clan Shopping", 0x8000, "")
+        
+        self.assertEqual(self.channels.get_id("clan ooc"), 0x0300000001L)
+        self.assertEqual(self.channels.get_id("clan shopping"), 0x0300000002L)
+
+
+class KickManyTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer()
+        self.server.start()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def kicks(self):
+        return filter(lambda packet: isinstance(packet, AOCP_PRIVATE_CHANNEL_KICK), self.server.received)
+    
+    def test_paced_without_queue(self):
+        chat = login(self.server)
+        
+        started = time.time()
+        chat.private_channel_kick_many(range(10, 13))
+        
+        self.assertTrue(time.time() - started < 0.1)
+        
+        # Chat loop sends the rest
+        list(chat.iter_packets(timeout = 3.0 / BULK_RATE))
+        
+        wait(lambda: len(self.kicks()) == 3)
+        self.assertEqual(map(lambda packet: packet.character_id, self.kicks()), range(10, 13))
+        
+        chat.close()
+    
+    def test_queued(self):
+        chat = login(self.server, queue = SendQueue(rate = 100))
+        chat.private_channel_kick_many(range(10, 15))
+        
+        self.assertTrue(len(chat.queue) > 0)
+        
+        list(chat.iter_packets(timeout = 0.2))
+        
+        wait(lambda: len(self.kicks()) == 5)
+        
+        chat.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
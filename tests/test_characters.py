@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from support import RecordingChat
+
+from aochat.characters import CharacterCache, PersistentCharacterCache
+from aochat.packets import *
+from aochat.server import make_packet
+
+
+class CharacterCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.chat = RecordingChat()
+        self.cache = CharacterCache(lookup_timeout = 30)
+        self.answers = []
+    
+    def callback(self, name, character_id):
+        self.answers.append((name, character_id,))
+    
+    def test_lookup_shares_request(self):
+        self.assertEqual(self.cache.lookup(self.chat, "Bob", self.callback), None)
+        self.assertEqual(self.cache.lookup(self.chat, "bob", self.callback), None)
+        self.assertEqual(len(self.chat.sent), 1)
+        
+        self.cache.handle_packet(self.chat, make_packet(AOSP_CHARACTER_LOOKUP, 11, "Bob"))
+        
+        self.assertEqual(self.answers, [("Bob", 11,), ("Bob", 11,)])
+        self.assertEqual(self.cache.pending, {})
+        self.assertEqual(self.cache.lookup(self.chat, "BOB"), 11)
+    
+    def test_lookup_answered_during_send(self):
+        cache = self.cache
+        
+        class AnsweringChat(RecordingChat):
+            # Reader thread handles answer before send_packet() returns
+            def send_packet(self, packet, Expect = None, Error = None, priority = None):
+                RecordingChat.send_packet(self, packet)
+                cache.handle_packet(self, make_packet(AOSP_CHARACTER_LOOKUP, 11, packet.character_name))
+        
+        self.assertEqual(cache.lookup(AnsweringChat(), "Bob", self.callback), None)
+        self.assertEqual(self.answers, [("Bob", 11,)])
+        self.assertEqual(cache.pending, {})
+    
+    def test_lookup_threads(self):
+        chat = RecordingChat()
+        
+        def work(offset):
+            for i in range(200):
+                self.cache.lookup(chat, "Character%d" % (offset + i), self.callback)
+        
+        threads = map(lambda offset: threading.Thread(target = work, args = (offset,)), (0, 100,))
+        
+        for thread in threads:
+            thread.start()
+        
+        for i in range(300):
+            self.cache.handle_packet(chat, make_packet(AOSP_CHARACTER_LOOKUP, 1000 + i, "Character%d" % i))
+        
+        for thread in threads:
+            thread.join()
+        
+        # Every name is requested once and every callback runs once it is answered
+        for i in range(300):
+            self.cache.handle_packet(chat, make_packet(AOSP_CHARACTER_LOOKUP, 1000 + i, "Character%d" % i))
+        
+        self.assertEqual(len(chat.sent), len(set(map(lambda packet: packet.character_name, chat.sent))))
+        self.assertEqual(len(self.answers), 400)
+        self.assertEqual(self.cache.pending, {})
+    
+    def test_lookup_resent_after_timeout(self):
+        self.cache.lookup(self.chat, "Bob", self.callback)
+        self.cache.pending["bob"][0] -= 31
+        self.cache.lookup(self.chat, "Bob", self.callback)
+        
+        self.assertEqual(len(self.chat.sent), 2)
+        
+        self.cache.handle_packet(self.chat, make_packet(AOSP_CHARACTER_LOOKUP, 11, "Bob"))
+        
+        self.assertEqual(len(self.answers), 2)
+    
+    def test_resend_forgets_expired(self):
+        self.cache.lookup(self.chat, "Bob")
+        self.cache.lookup(self.chat, "Alice")
+        self.cache.pending["bob"][0] -= 31
+        self.chat.sent = []
+        
+        self.cache.resend(self.chat)
+        
+        self.assertEqual(self.cache.pending.keys(), ["alice"])
+        self.assertEqual(map(lambda packet: packet.character_name, self.chat.sent), ["alice"])
+
+
+
+class PersistentCharacterCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "characters.db")
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def reopen(self, cache, **kwargs):
+        """
+        Close cache and open new one on the same database.
+        """
+        
+        cache.close()
+        
+        return PersistentCharacterCache(self.path, **kwargs)
+    
+    def test_reload(self):
+        cache = PersistentCharacterCache(self.path)
+        cache.add(11, "Bob")
+        cache.add(12, "Alice")
+        cache.add(AOFL_CHARACTER_UNKNOWN, "Nobody")
+        
+        cache = self.reopen(cache)
+        
+        self.assertEqual(cache.get_id("bob"), 11)
+        self.assertEqual(cache.get_name(12), "Alice")
+        self.assertEqual(cache.get_id("nobody"), None)
+        self.assertEqual(cache.get_name(13), None)
+        
+        # Loaded entries are kept in memory
+        cache.close()
+        
+        self.assertEqual(cache.get_id("Alice"), 12)
+        self.assertEqual(cache.connection, None)
+    
+    def test_batch_saved(self):
+        cache = PersistentCharacterCache(self.path, batch_size = 2)
+        cache.add(11, "Bob")
+        
+        self.assertEqual(len(cache.dirty), 1)
+        
+        cache.add(12, "Alice")
+        
+        self.assertEqual(cache.dirty, {})
+        self.assertEqual(PersistentCharacterCache(self.path).get_id("alice"), 12)
+        
+        cache.close()
+    
+    def test_rename(self):
+        cache = PersistentCharacterCache(self.path)
+        cache.add(11, "Bob")
+        cache.save()
+        
+        # Character renamed, then its old name taken by new character
+        cache.dirty[11] = ("Robert", time.time() + 1,)
+        cache.dirty[12] = ("Bob", time.time() + 2,)
+        
+        cache = self.reopen(cache)
+        
+        self.assertEqual(cache.get_name(11), "Robert")
+        self.assertEqual(cache.get_id("bob"), 12)
+        self.assertEqual(cache.get_id("robert"), 11)
+        
+        cache.close()
+    
+    def test_newest_wins(self):
+        cache = PersistentCharacterCache(self.path)
+        cache.dirty[11] = ("Bob", time.time() - 20,)
+        cache.dirty[12] = ("Bob", time.time() - 10,)
+        
+        cache = self.reopen(cache)
+        
+        self.assertEqual(cache.get_id("bob"), 12)
+        
+        cache.close()
+    
+    def test_max_age(self):
+        cache = PersistentCharacterCache(self.path)
+        cache.dirty[11] = ("Bob", time.time() - 120,)
+        cache.dirty[12] = ("Alice", time.time(),)
+        
+        cache = self.reopen(cache, max_age = 60)
+        
+        self.assertEqual(cache.get_id("bob"), None)
+        self.assertEqual(cache.get_name(11), None)
+        self.assertEqual(cache.get_id("alice"), 12)
+        
+        cache = self.reopen(cache)
+        
+        self.assertEqual(cache.get_id("bob"), 11)
+        
+        cache.close()
+    
+    def test_threads(self):
+        cache = PersistentCharacterCache(self.path, batch_size = 10)
+        cache.add(11, "Bob")
+        
+        errors = []
+        
+        def work(offset):
+            try:
+                for i in range(100):
+                    cache.add(1000 + offset + i, "Character%d" % (offset + i))
+                    cache.get_id("bob")
+                    cache.get_name(5000 + i)
+            except Exception, error:
+                errors.append(error)
+        
+        # Connection is opened by this thread and used by others
+        threads = map(lambda offset: threading.Thread(target = work, args = (offset,)), (0, 100,))
+        
+        for thread in threads:
+            thread.start()
+        
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        
+        cache = self.reopen(cache, size = 10)
+        
+        self.assertEqual(cache.get_id("character0"), 1000)
+        self.assertEqual(cache.get_id("character199"), 1199)
+        
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+import unittest
+
+from support import login, wait
+
+import aochat
+
+from aochat.packets import *
+from aochat.server import MockServer, make_packet
+from aochat.throttle import SendQueue
+
+from test_throttle import CountingSocket
+
+
+class IterPacketsTest(unittest.TestCase):
+    def setUp(self):
+        script = map(lambda i: make_packet(AOSP_PRIVATE_MESSAGE, 100 + i, "Hello", "\0"), range(250))
+        
+        self.server = MockServer(script = script)
+        self.server.start()
+        
+        self.chat = login(self.server)
+    
+    def tearDown(self):
+        self.chat.close()
+        self.server.stop()
+    
+    def pings(self):
+        return filter(lambda packet: isinstance(packet, AOCP_PING), self.server.received)
+    
+    def test_iter_packets(self):
+        packets = list(self.chat.iter_packets((AOSP_PRIVATE_MESSAGE,), timeout = 0.5))
+        
+        self.assertEqual(map(lambda packet: packet.character_id, packets), range(100, 350))
+    
+    def test_iter_batches(self):
+        batches = list(self.chat.iter_batches(100, types = (AOSP_PRIVATE_MESSAGE,), timeout = 0.5))
+        
+        self.assertTrue(max(map(len, batches)) <= 100)
+        self.assertEqual(sum(map(len, batches)), 250)
+    
+    def test_idle_ping(self):
+        packets = list(self.chat.iter_packets((AOSP_PRIVATE_MESSAGE,), timeout = 0.75, ping_interval = 200))
+        
+        self.assertEqual(len(packets), 250)
+        self.assertTrue(len(self.pings()) >= 2)
+        
+        list(self.chat.iter_batches(types = (AOSP_PRIVATE_MESSAGE,), timeout = 0.5, ping_interval = 200))
+        
+        self.assertTrue(len(self.pings()) >= 3)
+    
+    def test_no_ping_before_interval(self):
+        list(self.chat.iter_packets(timeout = 0.5))
+        
+        self.assertEqual(self.pings(), [])
+
+
+class SubscribeTest(unittest.TestCase):
+    def setUp(self):
+        script = []
+        
+        # Flood of packets nobody subscribed to with some subscribed ones
+        for i in range(1000):
+            script.append(make_packet(AOSP_PRIVATE_MESSAGE, 100 + i, "Hello", "\0"))
+            
+            if i % 100 == 99:
+                script.append(make_packet(AOSP_VICINITY_MESSAGE, i, "Hello", "\0"))
+        
+        self.server = MockServer(script = script)
+        self.server.start()
+        
+        self.chat = login(self.server)
+        
+        # Count decoded packets by type
+        self.decoded = {}
+        self.packets = aochat.SERVER_PACKETS.copy()
+        
+        for Class in (AOSP_PRIVATE_MESSAGE, AOSP_VICINITY_MESSAGE,):
+            aochat.SERVER_PACKETS[Class.type] = self.counting(Class)
+    
+    def tearDown(self):
+        aochat.SERVER_PACKETS.update(self.packets)
+        
+        self.chat.close()
+        self.server.stop()
+    
+    def counting(self, Class):
+        def decode(data):
+            self.decoded[Class] = self.decoded.get(Class, 0) + 1
+            
+            return Class(data)
+        
+        return decode
+    
+    def test_unsubscribed_not_decoded(self):
+        handled = []
+        
+        first = lambda chat, packet: handled.append(("first", packet.character_id,))
+        second = lambda chat, packet: handled.append(("second", packet.character_id,))
+        
+        self.chat.subscribe((AOSP_VICINITY_MESSAGE,), first)
+        self.chat.subscribe((AOSP_VICINITY_MESSAGE.type,), second)
+        
+        while len(handled) < 20:
+            while self.chat.has_packet():
+                self.chat.handle_packet()
+            
+            if len(handled) < 20:
+                self.chat.receive()
+        
+        # Handlers run in order of subscription
+        self.assertEqual(handled, [(name, i,) for i in range(99, 1000, 100) for name in ("first", "second",)])
+        self.assertEqual(self.decoded, {AOSP_VICINITY_MESSAGE: 10})
+        self.assertFalse(self.chat.has_packet())
+    
+    def test_unsubscribe(self):
+        first = lambda chat, packet: None
+        second = lambda chat, packet: None
+        
+        self.chat.subscribe((AOSP_VICINITY_MESSAGE, AOSP_PRIVATE_MESSAGE,), first)
+        self.chat.subscribe((AOSP_VICINITY_MESSAGE,), second)
+        
+        self.chat.unsubscribe((AOSP_VICINITY_MESSAGE,), first)
+        
+        self.assertEqual(self.chat.subscriptions[AOSP_VICINITY_MESSAGE.type], (second,))
+        
+        self.chat.unsubscribe((AOSP_VICINITY_MESSAGE.type, AOSP_PRIVATE_MESSAGE,), second)
+        self.chat.unsubscribe((AOSP_PRIVATE_MESSAGE,), first)
+        
+        self.assertFalse(AOSP_VICINITY_MESSAGE.type in self.chat.subscriptions)
+        self.assertFalse(AOSP_PRIVATE_MESSAGE.type in self.chat.subscriptions)
+
+
+class SendPrivateMessagesTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer()
+        self.server.start()
+        
+        self.progress = []
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def report(self, done, total):
+        self.progress.append((done, total,))
+    
+    def messages(self):
+        return filter(lambda packet: isinstance(packet, AOCP_PRIVATE_MESSAGE), self.server.received)
+    
+    def test_paced_without_queue(self):
+        chat = login(self.server, bulk_rate = 50, bulk_burst = 10)
+        chat.socket = CountingSocket(chat.socket)
+        
+        started = time.time()
+        chat.send_private_messages(range(10, 35), "Hello", self.report)
+        
+        # Caller is not blocked, only packets already written are reported
+        self.assertTrue(time.time() - started < 0.1)
+        self.assertEqual(self.progress, map(lambda done: (done, 25,), range(1, 11)))
+        
+        self.assertTrue(chat.drain())
+        
+        # Packets are saved up to go in writes of burst
+        self.assertTrue(time.time() - started >= 0.3)
+        self.assertEqual(map(len, chat.socket.writes), map(lambda count: count * len(chat.socket.writes[0]) / 10, (10, 10, 5,)))
+        self.assertEqual(self.progress, map(lambda done: (done, 25,), range(1, 26)))
+        
+        wait(lambda: len(self.messages()) == 25)
+        self.assertEqual(map(lambda packet: (packet.character_id, packet.message,), self.messages()), map(lambda character_id: (character_id, "Hello",), range(10, 35)))
+        
+        chat.close()
+    
+    def test_drain_timeout(self):
+        chat = login(self.server, bulk_rate = 10, bulk_burst = 2)
+        chat.send_private_messages(range(10, 20), "Hello", self.report)
+        
+        self.assertFalse(chat.drain(timeout = 0.1))
+        self.assertTrue(len(self.progress) < 10)
+        
+        self.assertTrue(chat.drain())
+        self.assertEqual(self.progress[-1], (10, 10,))
+        
+        chat.close()
+    
+    def test_queued(self):
+        chat = login(self.server, queue = SendQueue(rate = 20))
+        chat.send_private_messages(range(10, 15), "Hello", self.report)
+        
+        self.assertEqual(self.progress, [(1, 5,)])
+        
+        chat.drain()
+        
+        self.assertEqual(self.progress, map(lambda done: (done, 5,), range(1, 6)))
+        
+        wait(lambda: len(self.messages()) == 5)
+        
+        chat.close()
+    
+    def test_unlimited_queue(self):
+        chat = login(self.server, queue = SendQueue())
+        chat.send_private_messages(range(1000), "Hello", self.report)
+        
+        # All packets go in one write
+        self.assertEqual(self.progress[-1], (1000, 1000,))
+        self.assertEqual(chat.delay(), None)
+        
+        wait(lambda: len(self.messages()) == 1000)
+        
+        chat.close()
+
+if __name__ == "__main__":
+    unittest.main()
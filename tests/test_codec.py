@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+
+import pickle
+import unittest
+
+import support
+
+from aochat import SERVER_PACKETS, CLIENT_PACKETS
+from aochat.buffer import HEADER
+from aochat.codec import Codec
+from aochat.packets import *
+from aochat.server import make_packet
+from aochat.types import *
+
+
+SAMPLE_VALUES = {
+    Integer:         123456,
+    String:          "WTS Combined Sharpshooter's Sleeves, ql 300. Tell me!",
+    ChannelID:       0x0300000001,
+    TupleOfIntegers: (123456, 654321, 111111),
+    TupleOfStrings:  ("Character", "Another", "Third"),
+}
+
+
+def sample(Class):
+    """
+    Make sample packet of class.
+    """
+    
+    return make_packet(Class, *map(lambda (name, Type): SAMPLE_VALUES[Type], Class.fields))
+
+
+class CodecTest(unittest.TestCase):
+    def check(self, Class):
+        packet = sample(Class)
+        data = packet.pack()
+        
+        packet_type, length = HEADER.unpack_from(data)
+        
+        self.assertEqual(packet_type, Class.type)
+        self.assertEqual(length, len(data) - HEADER.size)
+        
+        # Compiled codec agrees with types packing themselves one by one
+        self.assertEqual(data[HEADER.size:], "".join(map(lambda item: item.pack(), packet)))
+        
+        self.assertEqual(Class.codec.unpack(data[HEADER.size:]), list(packet))
+        self.assertEqual(map(type, Class.codec.unpack(data[HEADER.size:])), map(lambda (name, Type): Type, Class.fields))
+    
+    def test_server_packets(self):
+        for packet_type, Class in sorted(SERVER_PACKETS.items()):
+            self.check(Class)
+            
+            self.assertEqual(Class(sample(Class).pack()[HEADER.size:]), sample(Class))
+    
+    def test_client_packets(self):
+        for packet_type, Class in sorted(CLIENT_PACKETS.items()):
+            self.check(Class)
+    
+    def test_fixed(self):
+        codec = Codec((Integer, ChannelID, Integer,))
+        
+        self.assertEqual(len(codec.split()), 1)
+        
+        data = codec.pack(1, (Integer(5), ChannelID(0x0A00000002), Integer(7),))
+        
+        self.assertEqual(data, HEADER.pack(1, 13) + Integer(5).pack() + ChannelID(0x0A00000002).pack() + Integer(7).pack())
+        self.assertEqual(codec.unpack(data[HEADER.size:]), [5, 0x0A00000002, 7])
+        self.assertTrue(isinstance(codec.unpack(data[HEADER.size:])[1], ChannelID))
+        
+        self.check(AOSP_PRIVATE_CHANNEL_CHARACTER_JOIN)
+        self.check(AOSP_CHANNEL_LEAVE)
+    
+    def test_mixed(self):
+        codec = Codec((ChannelID, Integer, String, Integer, TupleOfStrings,))
+        
+        self.assertEqual(map(lambda (fixed, types): types, codec.split()), [(ChannelID, Integer,), (String,), (Integer,), (TupleOfStrings,)])
+        
+        items = (ChannelID(0x0300000001), Integer(2), String("text"), Integer(3), TupleOfStrings(("a", "bc",)),)
+        data = codec.pack(65, items)
+        
+        self.assertEqual(data[HEADER.size:], "".join(map(lambda item: item.pack(), items)))
+        self.assertEqual(codec.unpack(data[HEADER.size:]), list(items))
+    
+    def test_no_fields(self):
+        codec = Codec(())
+        
+        self.assertEqual(codec.pack(5, ()), HEADER.pack(5, 0))
+        self.assertEqual(codec.unpack(""), [])
+        
+        self.assertEqual(AOSP_LOGIN_OK("").pack(), HEADER.pack(AOSP_LOGIN_OK.type, 0))
+        self.assertEqual(tuple(AOSP_LOGIN_OK("")), ())
+    
+    def test_truncated(self):
+        for packet_type, Class in sorted(SERVER_PACKETS.items()) + sorted(CLIENT_PACKETS.items()):
+            data = sample(Class).pack()[HEADER.size:]
+            
+            for length in range(len(data)):
+                self.assertRaises(ValueError, Class.codec.unpack, data[:length])
+
+
+
+class PacketTest(unittest.TestCase):
+    def test_no_dict(self):
+        for packet_type, Class in sorted(SERVER_PACKETS.items()) + sorted(CLIENT_PACKETS.items()):
+            if Class in (AOSP_CHARACTERS_LIST, AOSP_CHAT_NOTICE, AOSP_CHANNEL_MESSAGE,):
+                continue
+            
+            packet = sample(Class)
+            
+            self.assertFalse(hasattr(packet, "__dict__"), Class.__name__)
+            self.assertRaises(AttributeError, setattr, packet, "extra", 1)
+    
+    def test_lazy_once(self):
+        packet = AOSP_CHARACTERS_LIST(sample(AOSP_CHARACTERS_LIST).pack()[HEADER.size:])
+        
+        self.assertEqual(packet.__dict__, {})
+        
+        characters = packet.characters
+        
+        self.assertEqual(map(lambda character: character.name, characters), list(SAMPLE_VALUES[TupleOfStrings]))
+        self.assertTrue(packet.characters is characters)
+        self.assertEqual(packet.__dict__.keys(), ["characters"])
+    
+    def test_pickle(self):
+        packet = sample(AOSP_PRIVATE_MESSAGE)
+        copy = pickle.loads(pickle.dumps(packet, pickle.HIGHEST_PROTOCOL))
+        
+        self.assertEqual(type(copy), AOSP_PRIVATE_MESSAGE)
+        self.assertEqual(copy, packet)
+        
+        # Computed lazy attributes go along, others are computed on access
+        packet = make_packet(AOSP_CHANNEL_MESSAGE, 0x0300000001L, 0, "~&!!!&r!5b/Ri!!!!&~", "")
+        packet.extended
+        
+        copy = pickle.loads(pickle.dumps(packet, pickle.HIGHEST_PROTOCOL))
+        
+        self.assertEqual(copy.__dict__, {"extended": (506, 12753364, (5,),)})
+        self.assertEqual((copy.category, copy.instance, copy.args,), (506, 12753364, (5,),))
+        
+        packet = sample(AOSP_CHARACTERS_LIST)
+        copy = pickle.loads(pickle.dumps(packet, pickle.HIGHEST_PROTOCOL))
+        
+        self.assertEqual(copy.__dict__, {})
+        self.assertEqual(copy.characters[0].id, SAMPLE_VALUES[TupleOfIntegers][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from support import login, wait
+
+from aochat.capture import CaptureReader, CaptureWriter, DIRECTION_OUT
+from aochat.dispatch import Dispatcher
+from aochat.packets import *
+from aochat.server import MockServer, make_packet
+
+
+class DispatcherSendTest(unittest.TestCase):
+    COUNT = 2000
+    
+    def setUp(self):
+        script = map(lambda i: make_packet(AOSP_PRIVATE_MESSAGE, 100 + i, "ping %d" % i, "\0"), range(self.COUNT))
+        
+        self.server = MockServer(script = script)
+        self.server.start()
+        
+        self.directory = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        self.server.stop()
+        
+        shutil.rmtree(self.directory)
+    
+    def test_workers_send_at_once(self):
+        path = os.path.join(self.directory, "capture")
+        capture = CaptureWriter(path)
+        
+        chat = login(self.server, capture = capture)
+        
+        # Long replies need several socket writes each
+        reply = "x" * 4000
+        dispatcher = Dispatcher(lambda chat, packet: chat.send_private_message(packet.character_id, reply), workers = 8)
+        
+        handled = 0
+        
+        while handled < self.COUNT:
+            chat.receive()
+            
+            while chat.has_packet():
+                chat.handle_packet(dispatcher)
+                handled += 1
+                
+                # Reader sends too
+                if handled % 100 == 0:
+                    chat.ping()
+        
+        dispatcher.close()
+        
+        messages = lambda: filter(lambda packet: isinstance(packet, AOCP_PRIVATE_MESSAGE), self.server.received)
+        
+        # Last ping may arrive after the last message
+        wait(lambda: len(self.server.received) == self.COUNT + self.COUNT / 100)
+        
+        self.assertEqual(dispatcher.stats()["errors"], 0)
+        self.assertEqual(sorted(map(lambda packet: packet.character_id, messages())), range(100, 100 + self.COUNT))
+        self.assertEqual(set(map(lambda packet: packet.message, messages())), set([reply]))
+        self.assertEqual(len(self.server.received), self.COUNT + self.COUNT / 100)
+        
+        chat.close()
+        capture.close()
+        
+        reader = CaptureReader(path)
+        
+        try:
+            self.assertEqual(len(filter(lambda record: record[1] == DIRECTION_OUT and record[2] == AOCP_PRIVATE_MESSAGE.type, reader)), self.COUNT)
+        finally:
+            reader.close()
+
+
+
+class DispatcherOrderTest(unittest.TestCase):
+    def test_sender_order(self):
+        senders = range(100, 120)
+        channels = [0x0300000001L, 0x0300000002L]
+        
+        # Packets of senders and channels interleaved
+        packets = []
+        
+        for i in range(50):
+            for character_id in senders:
+                packets.append(make_packet(AOSP_PRIVATE_MESSAGE, character_id, str(i), "\0"))
+            
+            for channel_id in channels:
+                packets.append(make_packet(AOSP_CHANNEL_MESSAGE, channel_id, 11, str(i), "\0"))
+        
+        random.seed(1)
+        
+        handled = []
+        threads = {}
+        lock = threading.Lock()
+        
+        def callback(chat, packet):
+            # Uneven work lets workers overtake each other
+            time.sleep(random.random() * 0.0005)
+            
+            with lock:
+                handled.append(packet)
+                threads.setdefault(threading.current_thread(), 0)
+                threads[threading.current_thread()] += 1
+        
+        dispatcher = Dispatcher(callback, workers = 4, size = 10)
+        
+        for packet in packets:
+            dispatcher(None, packet)
+        
+        dispatcher.close()
+        
+        self.assertEqual(len(handled), len(packets))
+        self.assertEqual(len(threads), 4)
+        
+        for character_id in senders:
+            self.assertEqual(map(lambda packet: packet.message, filter(lambda packet: getattr(packet, "channel_id", None) is None and packet.character_id == character_id, handled)), map(str, range(50)))
+        
+        for channel_id in channels:
+            self.assertEqual(map(lambda packet: packet.message, filter(lambda packet: getattr(packet, "channel_id", None) == channel_id, handled)), map(str, range(50)))
+        
+        self.assertEqual(dispatcher.stats()["processed"], len(packets))
+        self.assertEqual(dispatcher.stats()["errors"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+
+import unittest
+
+import support
+
+from aochat import extended
+from aochat.extended import NOTICE_CATEGORY, Templates, parse_extended
+from aochat.packets import *
+from aochat.server import make_packet
+from aochat.types import Integer, String
+
+
+class ParseExtendedTest(unittest.TestCase):
+    def setUp(self):
+        extended._cache.clear()
+    
+    def test_arguments(self):
+        self.assertEqual(parse_extended("~&!!!&r!5b/Rs\x04Bobi!!!!&R!!!&r!5b/R~"), (506, 12753364, ("Bob", 5, (506, 12753364,),)))
+    
+    def test_unknown_type_skipped(self):
+        # Parsed by protocol before extended.py too
+        self.assertEqual(parse_extended("~&!!!&r!5b/RBx~"), (506, 12753364, ()))
+        self.assertEqual(parse_extended("~&!!!&r!5b/RBi!!!!&~"), (506, 12753364, (5,)))
+    
+    def test_empty_string(self):
+        self.assertEqual(parse_extended("~&!!!&r!5b/Rs\x00i!!!!&~"), (506, 12753364, ("", 5,)))
+        self.assertEqual(parse_extended("~&!!!&r!5b/Rs\x01i!!!!&~"), (506, 12753364, ("", 5,)))
+    
+    def test_truncated(self):
+        self.assertEqual(parse_extended("~&!!!&r!5b/Ri!!!!&i!!~"), (506, 12753364, (5,)))
+        self.assertEqual(parse_extended("~&!!!&r!5b/Ri!!!:~"), (506, 12753364, ()))
+        self.assertEqual(parse_extended("~&!!!&r!5b/RR!!!&r!5b/~"), (506, 12753364, ()))
+        self.assertRaises(ValueError, parse_extended, "~&!!!&r!5b/~")
+        self.assertEqual(parse_extended("~&!!!&r!5b/Rs\x09Bob~"), (506, 12753364, ("Bob",)))
+    
+    def test_cache_bounded(self):
+        size = extended.CACHE_SIZE
+        extended.CACHE_SIZE = 2
+        
+        try:
+            parse_extended("~&!!!&r!5b/Ri!!!!&~")
+            parse_extended("~&!!!&r!5b/Ri!!!!'~")
+            parse_extended("~&!!!&r!5b/Ri!!!!&~")
+            parse_extended("~&!!!&r!5b/Ri!!!!(~")
+        finally:
+            extended.CACHE_SIZE = size
+        
+        self.assertEqual(extended._cache.keys(), ["~&!!!&r!5b/Ri!!!!&~", "~&!!!&r!5b/Ri!!!!(~"])
+
+
+
+class TemplatesTest(unittest.TestCase):
+    def setUp(self):
+        self.loaded = []
+        self.templates = Templates(self.load)
+        self.templates.add(1, 1, "%s has %d%% of %q")
+    
+    def load(self, category, instance):
+        self.loaded.append((category, instance,))
+        
+        if category == 2:
+            return "Template %d" % instance
+        
+        return None
+    
+    def test_compile(self):
+        self.assertEqual(self.templates.compile("%s has %5.1f%% of %q %"), ("%s has %5.1f%% of %%q %%", 2))
+        self.assertEqual(self.templates.compile("no arguments"), ("no arguments", 0))
+    
+    def test_cache(self):
+        self.assertEqual(self.templates.get(1, 1), ("%s has %d%% of %%q", 2))
+        self.assertEqual(self.templates.get(2, 5), ("Template 5", 0))
+        self.assertEqual(self.templates.get(2, 5), ("Template 5", 0))
+        self.assertEqual(self.templates.get(3, 1), None)
+        self.assertEqual(self.templates.get(3, 1), None)
+        
+        # Loader is asked once, also for unknown templates
+        self.assertEqual(self.loaded, [(2, 5,), (3, 1,)])
+        self.assertEqual(len(self.templates), 3)
+        
+        # Added text replaces compiled one
+        self.templates.add(1, 1, "%s")
+        
+        self.assertEqual(self.templates.get(1, 1), ("%s", 1))
+    
+    def test_render(self):
+        self.assertEqual(self.templates.render(1, 1, ("Bob", 50,)), "Bob has 50% of %q")
+        self.assertEqual(self.templates.render(3, 1, ("Bob",)), None)
+    
+    def test_references(self):
+        self.templates.add(1, 2, "%s in %s")
+        self.templates.add(1, 3, "Org")
+        
+        self.assertEqual(self.templates.render(1, 2, ((1, 3,), (2, 7,),)), "Org in Template 7")
+        
+        # Unknown references are rendered as numbers
+        self.assertEqual(self.templates.render(1, 2, ((1, 3,), (3, 1,),)), "Org in 3:1")
+    
+    def test_argument_count(self):
+        self.templates.add(1, 2, "%s and %s")
+        
+        self.assertEqual(self.templates.render(1, 2, ("Bob",)), "Bob and ")
+        self.assertEqual(self.templates.render(1, 2, ("Bob", "Alice", "Eve",)), "Bob and Alice")
+        
+        # Arguments not matching specifications leave template text
+        self.assertEqual(self.templates.render(1, 1, ("Bob", "many",)), "%s has %d% of %q")
+        self.assertEqual(self.templates.render(1, 1, ("Bob",)), "%s has %d% of %q")
+    
+    def test_render_packet(self):
+        self.templates.add(506, 12753364, "%s got %d tokens")
+        self.templates.add(NOTICE_CATEGORY, 7, "%s is %d")
+        
+        packet = make_packet(AOSP_CHANNEL_MESSAGE, 0x0300000001L, 0, "~&!!!&r!5b/Rs\x04Bobi!!!!&~", "")
+        
+        self.assertEqual(self.templates.render_packet(packet), "Bob got 5 tokens")
+        
+        # Messages of characters are not extended
+        packet = make_packet(AOSP_CHANNEL_MESSAGE, 0x0300000001L, 12, "~&!!!&r!5b/Rs\x04Bobi!!!!&~", "")
+        
+        self.assertEqual(self.templates.render_packet(packet), None)
+        
+        packet = make_packet(AOSP_CHAT_NOTICE, 0, 0, 7, "S" + String("Bob").pack() + "I" + Integer(5).pack())
+        
+        self.assertEqual(self.templates.render_packet(packet), "Bob is 5")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+
+import unittest
+
+import support
+
+from aochat import Chat, _crypt, _decrypt
+from aochat.keys import KeyPool
+from aochat.server import MockServer
+
+
+class KeyPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer()
+        self.server.start()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def test_pool_keypair_used(self):
+        keys = KeyPool(size = 2, threshold = 0, public_key = self.server.public_key)
+        keys.get()
+        
+        chat = Chat("username", "password", self.server.host, self.server.port, keys = keys)
+        chat.close()
+        keys.close()
+        
+        self.assertEqual(keys.hits + keys.misses, 2)
+    
+    def test_empty_pool_used(self):
+        keys = KeyPool(size = 1, threshold = 0, public_key = self.server.public_key)
+        keys.close()
+        keys.keypairs.clear()
+        
+        self.assertEqual(len(keys), 0)
+        
+        # Empty pool must not be taken for no pool at all
+        chat = Chat("username", "password", self.server.host, self.server.port, keys = keys)
+        chat.close()
+        
+        self.assertEqual(keys.misses, 1)
+
+
+
+class CryptTest(unittest.TestCase):
+    # Key, plain text and crypted text made by original implementation
+    VECTORS = [
+        (0x1123456789ABCDEF0123456789ABCDEFL, "\x00" * 8, "7cb298ffb11ef967"),
+        (0xF0E1D2C3B4A5968778695A4B3C2D1E0FL, "ABCDEFGH12345678", "36e546baafbb9a0e6538131758c67b76"),
+        (0x9C32CC23D559CA90FC31BE72DF817D0EL, "\x01\x02\x03\x04\x05\x06\x07\x08\x00\x00\x00\x16username|seed|password      ", "bdf7ff1e9be6ded90fa8e6212ff5595990942f27acc57b18adbc642c5aed1000a1914f9ff3e50a0b"),
+    ]
+    
+    def test_known_answers(self):
+        for key, plain, crypted in self.VECTORS:
+            self.assertEqual(_crypt(key, plain), crypted)
+            self.assertEqual(_decrypt(key, crypted), plain)
+    
+    def test_length(self):
+        self.assertRaises(ValueError, _crypt, 0x1123456789ABCDEF0123456789ABCDEFL, "1234567")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+
+import unittest
+
+from support import login, wait
+
+from aochat.metrics import Metrics
+from aochat.packets import *
+from aochat.server import MockServer, make_packet
+
+
+class MetricsTest(unittest.TestCase):
+    COUNT = 20
+    
+    def setUp(self):
+        self.script = map(lambda i: make_packet(AOSP_PRIVATE_MESSAGE, 100 + i, "ping %d" % i, "\0"), range(self.COUNT))
+        
+        self.server = MockServer(
+            characters = [(11, "Bob", 200, 1)],
+            script = self.script,
+        )
+        self.server.start()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def test_chat_counts(self):
+        metrics = Metrics()
+        chat = login(self.server, metrics = metrics)
+        
+        handled = []
+        
+        def callback(chat, packet):
+            handled.append(packet)
+            
+            chat.send_private_message(packet.character_id, "pong")
+        
+        while len(handled) < self.COUNT:
+            chat.receive()
+            
+            while chat.has_packet():
+                chat.handle_packet(callback)
+        
+        wait(lambda: len(self.server.received) == self.COUNT)
+        
+        chat.close()
+        
+        stats = metrics.stats()
+        
+        self.assertEqual(stats["packets_in"], {
+            AOSP_SEED.type:            1,
+            AOSP_CHARACTERS_LIST.type: 1,
+            AOSP_LOGIN_OK.type:        1,
+            AOSP_PRIVATE_MESSAGE.type: self.COUNT,
+        })
+        self.assertEqual(stats["packets_out"], {
+            AOCP_AUTH.type:            1,
+            AOCP_LOGIN.type:           1,
+            AOCP_PRIVATE_MESSAGE.type: self.COUNT,
+        })
+        
+        # Seed of mock server is always 16 hex digits
+        server_packets = [
+            make_packet(AOSP_SEED, "0" * 16),
+            make_packet(AOSP_CHARACTERS_LIST, [11], ["Bob"], [200], [1]),
+            make_packet(AOSP_LOGIN_OK),
+        ] + self.script
+        
+        self.assertEqual(stats["bytes_in"], sum(map(lambda packet: len(packet.pack()), server_packets)))
+        self.assertTrue(stats["bytes_out"] > sum(map(lambda packet: len(packet.pack()), self.server.received)))
+        self.assertEqual(stats["decode_errors"], 0)
+        
+        self.assertEqual(stats["latency"]["decode"]["count"], 3 + self.COUNT)
+        self.assertEqual(stats["latency"]["callback"]["count"], self.COUNT)
+        self.assertEqual(stats["latency"]["send"]["count"], 2 + self.COUNT)
+        
+        text = metrics.exposition()
+        lines = text.splitlines()
+        
+        self.assertTrue('aochat_packets_received_total{type="30"} %d' % self.COUNT in lines)
+        self.assertTrue('aochat_packets_sent_total{type="30"} %d' % self.COUNT in lines)
+        self.assertTrue("aochat_callback_seconds_count %d" % self.COUNT in lines)
+        self.assertTrue('aochat_callback_seconds_bucket{le="+Inf"} %d' % self.COUNT in lines)
+        
+        # Every family is typed once, before its samples
+        types = filter(lambda line: line.startswith("# TYPE "), lines)
+        
+        self.assertEqual(types, [
+            "# TYPE aochat_packets_received_total counter",
+            "# TYPE aochat_packets_sent_total counter",
+            "# TYPE aochat_bytes_received_total counter",
+            "# TYPE aochat_bytes_sent_total counter",
+            "# TYPE aochat_decode_errors_total counter",
+            "# TYPE aochat_read_seconds histogram",
+            "# TYPE aochat_decode_seconds histogram",
+            "# TYPE aochat_callback_seconds histogram",
+            "# TYPE aochat_send_seconds histogram",
+        ])
+        
+        family = None
+        
+        for line in lines:
+            if line.startswith("# TYPE "):
+                family = line.split()[2]
+            else:
+                self.assertTrue(line.startswith(family), line)
+        
+        self.assertTrue(text.endswith("\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
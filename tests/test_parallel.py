@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+import unittest
+
+from support import login
+
+from aochat import UnexpectedPacket
+from aochat.packets import *
+from aochat.parallel import ParallelDecoder, batches, decode_batch
+from aochat.server import MockServer, make_packet
+
+
+def frame(packet):
+    data = packet.pack()
+    
+    return (packet.type, data[4:],)
+
+
+class DecodeBatchTest(unittest.TestCase):
+    def test_invalid_frames(self):
+        frames = [
+            frame(make_packet(AOSP_CHANNEL_MESSAGE, 0x0300000001L, 0, "~&!!!&r!5b/Ri!!!!&~", "")),
+            frame(make_packet(AOSP_CHANNEL_MESSAGE, 0x0300000001L, 0, "~&!!!", "")),
+            (AOSP_PRIVATE_MESSAGE.type, "\x00"),
+            (999, "data"),
+            frame(make_packet(AOSP_CHAT_NOTICE, 0, 0, 1, "S\x00\x03Bob")),
+        ]
+        
+        packets = decode_batch(frames)
+        
+        self.assertEqual(packets[0].args, (5,))
+        self.assertEqual(map(lambda packet: isinstance(packet, UnexpectedPacket), packets), [False, True, True, True, False])
+        self.assertEqual(packets[1].args, frames[1])
+        self.assertEqual(packets[4].args, ("Bob",))
+    
+    def test_pool(self):
+        frames = map(lambda i: frame(make_packet(AOSP_PRIVATE_MESSAGE, i, "Hello", "\0")), range(100))
+        decoder = ParallelDecoder(2)
+        
+        try:
+            packets = decoder.decode(frames, 30)
+        finally:
+            decoder.close()
+        
+        self.assertEqual(map(lambda packet: packet.character_id, packets), range(100))
+    
+    def test_idle_chat(self):
+        server = MockServer(script = map(lambda i: make_packet(AOSP_PRIVATE_MESSAGE, i, "Hello", "\0"), range(3)))
+        server.start()
+        
+        try:
+            chat = login(server, timeout = 1)
+            
+            started = time.time()
+            packets = []
+            
+            # Idle longer than socket timeout, kept alive by pings
+            for batch in batches(chat, ping_interval = 600):
+                packets.extend(decode_batch(batch))
+                
+                if len(filter(lambda packet: isinstance(packet, AOSP_PING), packets)) == 2:
+                    break
+            
+            self.assertTrue(time.time() - started > 1.0)
+            self.assertEqual(map(lambda packet: packet.character_id, packets[:3]), range(3))
+            
+            chat.close()
+        finally:
+            server.stop()
+        
+        self.assertEqual(len(filter(lambda packet: isinstance(packet, AOCP_PING), server.received)), 2)
+    
+    def test_batches_timeout(self):
+        server = MockServer(script = map(lambda i: make_packet(AOSP_PRIVATE_MESSAGE, i, "Hello", "\0"), range(3)))
+        server.start()
+        
+        try:
+            chat = login(server)
+            
+            frames = sum(batches(chat, timeout = 0.3), [])
+            
+            self.assertEqual(map(lambda (packet_type, data): packet_type, frames), [AOSP_PRIVATE_MESSAGE.type] * 3)
+            
+            chat.close()
+        finally:
+            server.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
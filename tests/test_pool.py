@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+
+import itertools
+import socket
+import time
+import unittest
+
+from support import login, wait
+
+from aochat import ChatError, ConnectionLost
+from aochat.packets import *
+from aochat.pool import ChatPool
+from aochat.server import MockServer, make_packet
+from aochat.throttle import SendQueue
+
+
+class RecordingPool(ChatPool):
+    """
+    Pool keeping disconnected chats.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        ChatPool.__init__(self, *args, **kwargs)
+        
+        self.disconnected = []
+    
+    def handle_disconnect(self, chat, error):
+        self.disconnected.append((chat, error,))
+
+
+class ChatPoolTest(unittest.TestCase):
+    COUNT = 50
+    
+    def setUp(self):
+        script = map(lambda i: make_packet(AOSP_PRIVATE_MESSAGE, 100 + i, "ping %d" % i, "\0"), range(self.COUNT))
+        
+        self.server = MockServer(script = script)
+        self.server.start()
+        
+        self.pool = RecordingPool()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def test_login_and_receive(self):
+        chats = map(lambda i: login(self.server), range(3))
+        received = dict(map(lambda chat: (chat, [],), chats))
+        
+        def callback(chat, packet):
+            received[chat].append(packet)
+            
+            chat.send_private_message(packet.character_id, "pong")
+            
+            if len(received[chat]) == self.COUNT:
+                self.pool.remove(chat)
+        
+        for chat in chats:
+            self.pool.add(chat, callback)
+        
+        self.assertRaises(ValueError, self.pool.add, chats[0])
+        
+        self.pool.start()
+        
+        for chat in chats:
+            self.assertEqual(map(lambda packet: packet.character_id, received[chat]), range(100, 100 + self.COUNT))
+        
+        wait(lambda: len(self.server.received) == 3 * self.COUNT)
+        
+        self.assertEqual(set(map(lambda packet: packet.message, self.server.received)), set(["pong"]))
+        self.assertEqual(self.pool.disconnected, [])
+        
+        for chat in chats:
+            chat.close()
+    
+    def test_packets_received_with_login(self):
+        server = MockServer(channels = [(0x0300000001L, "Clan OOC", 0x8000), (0x0300000002L, "Clan Shopping", 0x8000)])
+        server.start()
+        
+        try:
+            chat = login(server)
+            
+            # Channel joins came along with login
+            self.assertTrue(chat.has_packet())
+            
+            received = []
+            
+            def callback(chat, packet):
+                received.append(packet)
+                
+                if len(received) == 2:
+                    self.pool.remove(chat)
+            
+            self.pool.add(chat, callback)
+            self.pool.start()
+            
+            self.assertEqual(map(type, received), [AOSP_CHANNEL_JOIN, AOSP_CHANNEL_JOIN])
+            self.assertEqual(chat.channels.get_id("clan shopping"), 0x0300000002L)
+            
+            chat.close()
+        finally:
+            server.stop()
+    
+    def test_send_through_other_chat(self):
+        connections = itertools.count()
+        
+        # Only first chat receives a message
+        server = MockServer(script = lambda handler: [make_packet(AOSP_PRIVATE_MESSAGE, 12, "relay", "\0")] if next(connections) == 0 else [])
+        server.start()
+        
+        pool = RecordingPool(ping_interval = 5000)
+        
+        try:
+            relay = login(server)
+            target = login(server, queue = SendQueue(rate = 4, burst = 1))
+            
+            sent = []
+            
+            def written():
+                sent.append(True)
+                
+                if len(sent) == 3:
+                    pool.remove(relay)
+                    pool.remove(target)
+            
+            def callback(chat, packet):
+                # Rate limit holds back all but first message
+                target.send_bulk(map(lambda i: AOCP_PRIVATE_MESSAGE(100 + i, packet.message, "\0"), range(3)), written)
+            
+            pool.add(relay, callback)
+            pool.add(target)
+            
+            started = time.time()
+            pool.start()
+            
+            self.assertEqual(len(sent), 3)
+            self.assertTrue(time.time() - started < 2.5)
+            
+            wait(lambda: len(server.received) == 3)
+            
+            relay.close()
+            target.close()
+        finally:
+            server.stop()
+    
+    def test_disconnect(self):
+        chat = login(self.server)
+        
+        self.pool.add(chat, lambda chat, packet: None)
+        
+        wait(lambda: self.server.handlers)
+        
+        self.server.disconnect()
+        self.pool.start()
+        
+        self.assertEqual(len(self.pool), 0)
+        self.assertEqual(map(lambda (chat, error): (chat, type(error),), self.pool.disconnected), [(chat, ConnectionLost,)])
+        
+        chat.close()
+    
+    def test_send_error_in_callback(self):
+        chat = login(self.server)
+        
+        def callback(chat, packet):
+            # Write side is gone, so send of handler fails
+            chat.socket.shutdown(socket.SHUT_WR)
+            chat.send_private_message(packet.character_id, "pong")
+        
+        self.pool.add(chat, callback)
+        self.pool.start()
+        
+        self.assertEqual(len(self.pool), 0)
+        self.assertEqual(len(self.pool.disconnected), 1)
+        self.assertTrue(isinstance(self.pool.disconnected[0][1], ConnectionLost))
+        
+        chat.close()
+    
+    def test_error_in_callback(self):
+        chat = login(self.server)
+        
+        def callback(chat, packet):
+            raise ChatError("application error")
+        
+        self.pool.add(chat, callback)
+        
+        self.assertRaises(ChatError, self.pool.start)
+        
+        # Chat is still connected and registered
+        self.assertEqual(len(self.pool), 1)
+        self.assertEqual(self.pool.disconnected, [])
+        
+        self.pool.remove(chat)
+        chat.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
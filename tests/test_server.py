@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+
+import unittest
+
+from support import login
+
+from aochat import Chat, ChatError
+from aochat.keys import KeyPool
+from aochat.packets import *
+from aochat.server import MockServer
+
+
+class MockServerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(
+            accounts = {"username": "password"},
+            characters = [(11, "Bob", 200, 1), (12, "Alice", 10, 0)],
+            channels = [(0x0300000001L, "Clan OOC", 0x8000)],
+        )
+        self.server.start()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def receive(self, Type):
+        """
+        Handle packets until one of Type arrives.
+        """
+        
+        received = []
+        
+        while True:
+            while self.chat.has_packet():
+                self.chat.handle_packet(lambda chat, packet: isinstance(packet, Type) and received.append(packet))
+            
+            if received:
+                return received[0]
+            
+            self.chat.receive()
+    
+    def test_login(self):
+        self.chat = login(self.server)
+        
+        self.assertEqual(map(lambda character: character.name, self.chat.characters), ["Bob", "Alice"])
+        self.assertEqual(self.chat.character.id, 11)
+        
+        self.chat.close()
+    
+    def test_bad_password(self):
+        keys = KeyPool(size = 1, threshold = 0, public_key = self.server.public_key)
+        
+        try:
+            self.assertRaises(ChatError, Chat, "username", "wrong", self.server.host, self.server.port, keys = keys)
+        finally:
+            keys.close()
+    
+    def test_lookup(self):
+        self.chat = login(self.server)
+        
+        answers = []
+        
+        self.assertEqual(self.chat.lookup_character("alice", lambda name, character_id: answers.append(character_id)), None)
+        self.receive(AOSP_CHARACTER_LOOKUP)
+        
+        self.assertEqual(answers, [12])
+        self.assertEqual(self.chat.lookup_character("Alice"), 12)
+        
+        self.chat.lookup_character("nobody")
+        self.receive(AOSP_CHARACTER_LOOKUP)
+        
+        self.assertEqual(self.chat.lookup_character("nobody"), AOFL_CHARACTER_UNKNOWN)
+        self.assertEqual(map(lambda packet: packet.character_name, self.server.received), ["alice", "nobody"])
+        
+        self.chat.close()
+    
+    def test_buddy(self):
+        self.server.online.add(12)
+        self.chat = login(self.server)
+        
+        events = []
+        self.chat.buddies.subscribe(lambda chat, character_id, online: events.append((character_id, online,)))
+        
+        self.chat.friend_add(12)
+        self.receive(AOSP_FRIEND_UPDATE)
+        
+        self.assertEqual(events, [(12, True,)])
+        self.assertTrue(self.chat.buddies.is_online(12))
+        
+        self.chat.friend_remove(12)
+        self.receive(AOSP_FRIEND_REMOVE)
+        
+        self.assertFalse(12 in self.chat.buddies)
+        
+        self.chat.close()
+    
+    def test_channel(self):
+        self.chat = login(self.server)
+        self.receive(AOSP_CHANNEL_JOIN)
+        
+        self.assertEqual(self.chat.channels.get_id("clan ooc"), 0x0300000001L)
+        
+        self.chat.send_channel_message("Clan OOC", "Hello")
+        packet = self.receive(AOSP_CHANNEL_MESSAGE)
+        
+        self.assertEqual((packet.channel_id, packet.character_id, packet.message,), (0x0300000001L, 11, "Hello",))
+        
+        self.assertRaises(ValueError, self.chat.send_channel_message, "No Such Channel", "Hello")
+        
+        self.chat.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+
+import time
+import unittest
+
+from support import login, wait
+
+from aochat import ChatError
+from aochat.packets import *
+from aochat.server import MockServer, make_packet
+
+
+class Stop(Exception):
+    pass
+
+
+class SuperviseTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer(
+            characters = [(11, "Bob", 200, 1), (12, "Alice", 10, 0)],
+            script = [make_packet(AOSP_PRIVATE_MESSAGE, 12, "Hello", "\0")],
+        )
+        self.server.start()
+        
+        self.chat = login(self.server)
+    
+    def tearDown(self):
+        self.chat.close()
+        self.server.stop()
+    
+    def test_callback_error_not_reconnected(self):
+        def callback(chat, packet):
+            if isinstance(packet, AOSP_PRIVATE_MESSAGE):
+                raise ChatError("Callback failed.")
+        
+        self.assertRaises(ChatError, self.chat.supervise, callback, min_delay = 0.01)
+        self.assertEqual(self.chat.reconnects, 0)
+    
+    def test_rejected_login_not_retried(self):
+        def callback(chat, packet):
+            if isinstance(packet, AOSP_PRIVATE_MESSAGE):
+                # Password changed while connection is lost
+                self.server.accounts["username"] = "changed"
+                self.server.disconnect()
+        
+        started = time.time()
+        
+        self.assertRaises(ChatError, self.chat.supervise, callback, min_delay = 1.0)
+        self.assertTrue(time.time() - started < 1.0)
+        self.assertEqual(self.chat.reconnects, 0)
+    
+    def test_lost_connection_reconnected(self):
+        count = lambda Type: len(filter(lambda packet: isinstance(packet, Type), self.server.received))
+        
+        self.chat.friend_add(12)
+        self.chat.private_channel_join(12)
+        
+        wait(lambda: count(AOCP_PRIVATE_CHANNEL_JOIN) == 1)
+        
+        # Lookup not answered before connection is lost
+        self.chat.names.pending["nobody"] = [time.time(), []]
+        
+        def callback(chat, packet):
+            if not isinstance(packet, AOSP_PRIVATE_MESSAGE):
+                return
+            
+            if chat.reconnects == 0:
+                self.server.disconnect()
+            else:
+                raise Stop()
+        
+        self.assertRaises(Stop, self.chat.supervise, callback, min_delay = 0.01)
+        self.assertEqual(self.chat.reconnects, 1)
+        self.assertEqual(self.chat.character.id, 11)
+        
+        # Session state was sent again
+        wait(lambda: count(AOCP_CHARACTER_LOOKUP) == 1)
+        
+        self.assertEqual(count(AOCP_FRIEND_UPDATE), 2)
+        self.assertEqual(count(AOCP_PRIVATE_CHANNEL_JOIN), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
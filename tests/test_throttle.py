@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+
+import unittest
+
+from support import login, wait
+
+from aochat.packets import *
+from aochat.server import MockServer
+from aochat.throttle import PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, SendQueue, TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst(self):
+        bucket = TokenBucket(2, burst = 3)
+        now = bucket.time
+        
+        self.assertEqual(map(lambda i: bucket.consume(now), range(4)), [True, True, True, False])
+        self.assertEqual(bucket.delay(now), 0.5)
+    
+    def test_refill(self):
+        bucket = TokenBucket(2, burst = 3)
+        now = bucket.time
+        
+        while bucket.consume(now):
+            pass
+        
+        self.assertFalse(bucket.consume(now + 0.25))
+        self.assertEqual(bucket.delay(now + 0.25), 0.25)
+        self.assertTrue(bucket.consume(now + 0.5))
+        self.assertFalse(bucket.consume(now + 0.5))
+        
+        # Saved tokens are capped by burst
+        self.assertEqual(bucket.delay(now + 100, 3), 0.0)
+        self.assertEqual(bucket.tokens, 3)
+        
+        # Time going backwards earns nothing
+        bucket.update(now)
+        
+        self.assertEqual(bucket.tokens, 3)
+    
+    def test_rate(self):
+        self.assertRaises(ValueError, TokenBucket, 0)
+
+
+class SendQueueTest(unittest.TestCase):
+    def test_priority(self):
+        queue = SendQueue()
+        
+        queue.put("low 1", PRIORITY_LOW)
+        queue.put("normal 1")
+        queue.put("high 1", PRIORITY_HIGH)
+        queue.put("low 2", PRIORITY_LOW)
+        queue.put("normal 2", PRIORITY_NORMAL)
+        queue.put("high 2", PRIORITY_HIGH)
+        
+        self.assertEqual(queue.take(), ["high 1", "high 2", "normal 1", "normal 2", "low 1", "low 2"])
+        self.assertEqual(len(queue), 0)
+        self.assertEqual(queue.delay(), None)
+    
+    def test_rate(self):
+        queue = SendQueue(rate = 4, burst = 2)
+        now = queue.bucket.time
+        
+        for i in range(5):
+            queue.put(i, PRIORITY_LOW, callback = i)
+        
+        queue.put("high", PRIORITY_HIGH)
+        
+        self.assertEqual(queue.take(now), ["high", 0])
+        self.assertEqual(queue.take(now), [])
+        self.assertEqual(queue.delay(now), 0.25)
+        
+        self.assertEqual(queue.take(now + 0.25), [1])
+        self.assertEqual(queue.take(now + 0.75), [2, 3])
+        self.assertEqual(queue.done(), [0, 1, 2, 3])
+        self.assertEqual(queue.done(), [])
+        
+        self.assertEqual(len(queue), 1)
+        self.assertEqual(queue.stats()["sent"], 5)
+        self.assertEqual(queue.stats()["max_depth"], 6)
+    
+    def test_chunk(self):
+        queue = SendQueue(rate = 10, burst = 4, chunk = 4)
+        now = queue.bucket.time
+        
+        for i in range(10):
+            queue.put(i)
+        
+        self.assertEqual(queue.take(now), [0, 1, 2, 3])
+        
+        # Packets are held until whole chunk may go
+        self.assertEqual(queue.delay(now), 0.4)
+        self.assertEqual(queue.take(now + 0.3), [])
+        self.assertEqual(queue.take(now + 0.4), [4, 5, 6, 7])
+        
+        # Smaller rest goes as soon as it may
+        self.assertAlmostEqual(queue.delay(now + 0.4), 0.2)
+        self.assertEqual(queue.take(now + 0.65), [8, 9])
+        self.assertEqual(queue.delay(now + 0.65), None)
+
+
+class CountingSocket(object):
+    """
+    Socket wrapper counting writes.
+    """
+    
+    def __init__(self, socket):
+        self.socket = socket
+        self.writes = []
+    
+    def sendall(self, data):
+        self.writes.append(data)
+        
+        return self.socket.sendall(data)
+    
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+class ChatQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.server = MockServer()
+        self.server.start()
+    
+    def tearDown(self):
+        self.chat.close()
+        self.server.stop()
+    
+    def test_flush_one_write(self):
+        self.chat = login(self.server, queue = SendQueue())
+        self.chat.socket = CountingSocket(self.chat.socket)
+        
+        packets = map(lambda i: AOCP_PRIVATE_MESSAGE(100 + i, "message %d" % i, "\0"), range(3))
+        
+        for packet in packets:
+            self.chat.queue.put(packet.pack(), PRIORITY_NORMAL)
+        
+        self.chat.queue.put(AOCP_PING("ping").pack(), PRIORITY_HIGH)
+        
+        self.chat.flush()
+        
+        self.assertEqual(self.chat.socket.writes, ["".join(map(lambda packet: packet.pack(), [AOCP_PING("ping")] + packets))])
+        
+        self.chat.send_packets(packets)
+        
+        self.assertEqual(len(self.chat.socket.writes), 2)
+        
+        wait(lambda: len(self.server.received) == 7)
+        
+        self.assertEqual(map(type, self.server.received), [AOCP_PING] + [AOCP_PRIVATE_MESSAGE] * 6)
+    
+    def test_flush_rate(self):
+        self.chat = login(self.server, queue = SendQueue(rate = 1000, burst = 2))
+        self.chat.socket = CountingSocket(self.chat.socket)
+        
+        self.chat.send_packets(map(lambda i: AOCP_FRIEND_REMOVE(100 + i), range(5)))
+        
+        self.assertEqual(len(self.chat.socket.writes), 1)
+        self.assertEqual(len(self.chat.socket.writes[0]), 2 * len(AOCP_FRIEND_REMOVE(100).pack()))
+        self.assertEqual(len(self.chat.queue), 3)
+        
+        while self.chat.queue:
+            self.chat.flush()
+        
+        wait(lambda: len(self.server.received) == 5)
+        
+        self.assertEqual(map(lambda packet: packet.character_id, self.server.received), range(100, 105))
+
+
+if __name__ == "__main__":
+    unittest.main()